@@ -1,10 +1,21 @@
 from flask import Flask, request, jsonify, render_template_string
-from transformers import T5Tokenizer, T5ForConditionalGeneration
+from transformers import LogitsProcessorList, T5Tokenizer
 import torch
+import os
+import threading
+import time
 from collections import deque
 import logging
 from datetime import datetime
 
+from batching import BatcherOverloaded, MicroBatcher
+from encoder_cache import EncoderCache
+from onnx_backend import INFERENCE_BACKEND, load_model, served_variant
+from speculative import SPECULATIVE_DRAFT_MODEL, SpeculativeStats, check_compatible, load_draft_model, speculative_generate
+from sparql_grammar import ENTITY_SEPARATOR, batch_grammar_processor
+from startup import STARTUP_WARMUP_GENERATIONS, STARTUP_WARMUP_IN_WORKERS, WARMUP_PAIRS, NotReady, Startup
+from translation_cache import TranslationCache
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -19,13 +30,36 @@ query_log = deque(maxlen=50)
 # Load the T5 model and tokenizer
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 model_path = "./checkpoint-2"  # Updated for Docker path
-try:
+# beam: plain NUM_BEAMS beam search; constrained: grammar-constrained decoding with CONSTRAINED_NUM_BEAMS;
+# speculative: greedy decoding drafted by SPECULATIVE_DRAFT_MODEL (see speculative.py)
+DECODING_MODE = os.getenv("DECODING_MODE", "beam").lower()
+NUM_BEAMS = int(os.getenv("NUM_BEAMS", "5"))
+CONSTRAINED_NUM_BEAMS = int(os.getenv("CONSTRAINED_NUM_BEAMS", "1"))
+# Batch endpoint / bulk mode: inputs per generate call, and items per request
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "32"))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "1000"))
+
+# Loaded by the startup phases below; the port is bound before they finish
+startup = Startup()
+tokenizer = None
+model = None
+draft_model = None
+speculative_stats = SpeculativeStats()
+
+
+def load_model_and_tokenizer():
+    global tokenizer, model, draft_model
     tokenizer = T5Tokenizer.from_pretrained(model_path)
-    model = T5ForConditionalGeneration.from_pretrained(model_path).to(device)
-    logger.info("Model and tokenizer loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load model: {e}")
-    raise
+    # INFERENCE_BACKEND=onnx serves the (int8) ONNX export instead of the PyTorch model
+    model = load_model(model_path, device)
+    logger.info(f"Model and tokenizer loaded successfully ({INFERENCE_BACKEND} backend)")
+    if DECODING_MODE == "speculative":
+        if INFERENCE_BACKEND != "pytorch" or not SPECULATIVE_DRAFT_MODEL:
+            raise RuntimeError("DECODING_MODE=speculative needs the pytorch backend and SPECULATIVE_DRAFT_MODEL")
+        draft_model = load_draft_model(SPECULATIVE_DRAFT_MODEL, device)
+        check_compatible(model, draft_model)
+        logger.info(f"Draft model loaded from {SPECULATIVE_DRAFT_MODEL}")
+
 
 # HTML template for welcome page
 welcome_template = """
@@ -84,6 +118,14 @@ welcome_template = """
                 </div>
             {% endif %}
         </div>
+        <div class="log-box">
+            <h3>Translation Cache</h3>
+            <p class="mb-0">
+                {{ cache_stats.hits }} hits, {{ cache_stats.misses }} misses
+                (hit rate {{ "%.1f"|format(cache_stats.hit_rate * 100) }}%),
+                {{ cache_stats.entries }}/{{ cache_stats.max_entries }} entries
+            </p>
+        </div>
         <div class="log-box">
             <h3>Recent Queries (Last 50)</h3>
             {% if logs %}
@@ -101,16 +143,167 @@ welcome_template = """
 """
 
 
+def format_input(question, entity):
+    return f"task: generate_sparql\ninput: {question}\nentity:{entity}"
+
+
+# One generate at a time: bulk batches and micro-batches would otherwise compete for the same cores
+generation_lock = threading.Lock()
+# Encoder states of recently seen inputs (ENCODER_CACHE_MAX_BYTES; 0, the default, disables)
+encoder_cache = EncoderCache()
+
+
+def generate_sparql_batch(pairs):
+    """Generate SPARQL queries for a list of (question, entity) pairs in one batched generate."""
+    texts = [format_input(question, entity) for question, entity in pairs]
+    if DECODING_MODE == "speculative":
+        # Assisted generation decodes one input at a time; the draft makes each one cheaper
+        with generation_lock:
+            return [
+                speculative_generate(model, draft_model, tokenizer, text, device, speculative_stats)
+                for text in texts
+            ]
+    decoding = {"num_beams": NUM_BEAMS}
+    if DECODING_MODE == "constrained":
+        # Each input's grammar accepts its own entities only
+        entities = [[e for e in ENTITY_SEPARATOR.split(entity) if e] for _, entity in pairs]
+        decoding = {
+            "num_beams": CONSTRAINED_NUM_BEAMS,
+            "logits_processor": LogitsProcessorList(
+                [batch_grammar_processor(tokenizer, entities, CONSTRAINED_NUM_BEAMS)]
+            ),
+        }
+    with generation_lock, torch.no_grad():
+        if encoder_cache.enabled and INFERENCE_BACKEND == "pytorch":
+            # The encoder only runs on inputs it has not seen; generate() decodes from the states
+            encoder_outputs, attention_mask = encoder_cache.encode(model, tokenizer, texts, device)
+            outputs = model.generate(
+                encoder_outputs=encoder_outputs,
+                attention_mask=attention_mask,
+                max_length=150,
+                early_stopping=True,
+                **decoding,
+            )
+        else:
+            encoded = tokenizer(
+                texts, return_tensors="pt", padding=True, truncation=True, max_length=512
+            ).to(device)
+            outputs = model.generate(
+                encoded.input_ids,
+                attention_mask=encoded.attention_mask,
+                max_length=150,
+                early_stopping=True,
+                **decoding,
+            )
+    return tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+
+# Concurrent requests are collected into one batched generate (BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS)
+batcher = MicroBatcher(generate_sparql_batch, name="nl2sparql-batcher")
+
+
+# Translations of repeated (question, entity) pairs; flushed when the checkpoint or backend changes
+translation_cache = TranslationCache(model_path, served_variant())
+
+
 def generate_sparql(question, entity):
     """Generate SPARQL query from question and entity."""
-    input_text = f"task: generate_sparql\ninput: {question}\nentity:{entity}"
-    input_ids = tokenizer.encode(
-        input_text, return_tensors="pt", truncation=True, max_length=512
-    ).to(device)
-    outputs = model.generate(
-        input_ids, max_length=150, num_beams=5, early_stopping=True
+    sparql_query = translation_cache.get(question, entity)
+    if sparql_query is None:
+        if not startup.ready:
+            raise NotReady(f"Model is {startup.state}")
+        sparql_query = batcher.submit((question, entity))
+        translation_cache.put(question, entity, sparql_query)
+    return sparql_query
+
+
+def translate_many(pairs, batch_size=BULK_BATCH_SIZE):
+    """
+    Translations of many (question, entity) pairs, in input order. Cached and
+    duplicate pairs are not regenerated; the rest are sorted by input length so
+    each batch pads to a similar length, and run batch_size at a time.
+    """
+    results = [None] * len(pairs)
+    pending = {}
+    for i, (question, entity) in enumerate(pairs):
+        results[i] = translation_cache.get(question, entity)
+        if results[i] is None:
+            pending.setdefault((question, entity), []).append(i)
+    if pending and not startup.ready:
+        raise NotReady(f"Model is {startup.state}")
+    todo = sorted(pending, key=lambda pair: len(tokenizer.tokenize(format_input(*pair))))
+    for start in range(0, len(todo), batch_size):
+        chunk = todo[start:start + batch_size]
+        for pair, sparql_query in zip(chunk, generate_sparql_batch(chunk)):
+            translation_cache.put(pair[0], pair[1], sparql_query)
+            for i in pending[pair]:
+                results[i] = sparql_query
+    return results
+
+
+def warm_up():
+    """Runs a few generations so lazy initialisation happens before the first request."""
+    for i in range(STARTUP_WARMUP_GENERATIONS):
+        generate_sparql_batch([WARMUP_PAIRS[i % len(WARMUP_PAIRS)]])
+    if STARTUP_WARMUP_GENERATIONS and batcher.max_size > 1:
+        generate_sparql_batch([WARMUP_PAIRS[i % len(WARMUP_PAIRS)] for i in range(batcher.max_size)])
+
+
+if not STARTUP_WARMUP_IN_WORKERS:
+    startup.start(load_model_and_tokenizer, warm_up)
+# else gunicorn with preload: the master loads the weights in when_ready, after binding and
+# before forking, and each worker warms up in post_fork (see gunicorn.conf.py)
+
+
+@app.context_processor
+def inject_cache_stats():
+    return {"cache_stats": translation_cache.stats()}
+
+
+def overloaded_response(error_msg="Service busy, retry shortly"):
+    """503 with Retry-After when the batch queue is full or the model is not ready, so clients back off."""
+    if request.content_type == "application/json":
+        response = jsonify({"error": error_msg})
+    else:
+        response = app.make_response(
+            render_template_string(welcome_template, sparql_query=error_msg, logs=query_log)
+        )
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+started_at = time.time()
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the worker process is up and serving requests."""
+    return jsonify({"status": "alive", "pid": os.getpid(), "uptime": round(time.time() - started_at, 1)})
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """
+    Readiness: the model is loaded and warmed up, and the batch queue has room.
+    Under gunicorn with WEB_PRELOAD=1 no worker exists while the weights load, so
+    "loading" is only ever reported without preloading; "warming" is reported in both.
+    """
+    if not startup.ready:
+        return jsonify({"status": startup.state, "startup": startup.status()}), 503
+    stats = batcher.stats()
+    if batcher.is_overloaded():
+        return jsonify({"status": "overloaded", "batcher": stats}), 503
+    return jsonify(
+        {
+            "status": "ready",
+            "backend": INFERENCE_BACKEND,
+            "batcher": stats,
+            "encoder_cache": encoder_cache.stats(),
+            "startup": startup.status(),
+            **({"speculative": speculative_stats.summary()} if DECODING_MODE == "speculative" else {}),
+        }
     )
-    return tokenizer.decode(outputs[0], skip_special_tokens=True)
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -166,6 +359,11 @@ def home():
                     for entry in query_log
                 ],
             )
+        except BatcherOverloaded as e:
+            logger.warning(f"Shedding request: {e}")
+            return overloaded_response()
+        except NotReady as e:
+            return overloaded_response(f"{e}, retry shortly")
         except Exception as e:
             logger.error(f"Error in translation: {e}")
             if request.content_type == "application/json":
@@ -219,6 +417,11 @@ def nl2sparql():
                 for entry in query_log
             ],
         )
+    except BatcherOverloaded as e:
+        logger.warning(f"Shedding request: {e}")
+        return overloaded_response()
+    except NotReady as e:
+        return overloaded_response(f"{e}, retry shortly")
     except Exception as e:
         logger.error(f"Error in translation: {e}")
         if request.content_type == "application/json":
@@ -228,5 +431,60 @@ def nl2sparql():
         )
 
 
+@app.route("/nl2sparql/variants", methods=["POST"])
+def nl2sparql_variants():
+    """JSON {"question": ..., "entities": [...]} -> one translation per entity, decoded in one batch."""
+    data = request.get_json(silent=True) or {}
+    question = data.get("question")
+    entities = data.get("entities")
+    if not question or not isinstance(entities, list) or not entities or not all(entities):
+        return jsonify({"error": "'question' and a non-empty 'entities' list are required"}), 400
+    if len(entities) > BULK_MAX_ITEMS:
+        return jsonify({"error": f"At most {BULK_MAX_ITEMS} entities per request"}), 413
+    try:
+        translations = translate_many([(question, entity) for entity in entities])
+    except NotReady as e:
+        return overloaded_response(f"{e}, retry shortly")
+    except Exception as e:
+        logger.error(f"Error in variant translation: {e}")
+        return jsonify({"error": str(e)}), 500
+    return jsonify(
+        {"results": [{"entity": entity, "sparql_query": sparql} for entity, sparql in zip(entities, translations)]}
+    )
+
+
+@app.route("/nl2sparql/batch", methods=["POST"])
+def nl2sparql_batch():
+    """JSON {"items": [{"question": ..., "entity": ...}, ...]} -> {"results": [...]} in the same order."""
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    if not isinstance(items, list):
+        return jsonify({"error": "'items' must be a list of {question, entity} objects"}), 400
+    if len(items) > BULK_MAX_ITEMS:
+        return jsonify({"error": f"At most {BULK_MAX_ITEMS} items per request"}), 413
+
+    pairs, positions, results = [], [], [None] * len(items)
+    for i, item in enumerate(items):
+        question = item.get("question") if isinstance(item, dict) else None
+        entity = item.get("entity") if isinstance(item, dict) else None
+        if not question or not entity:
+            results[i] = {"error": "Both 'question' and 'entity' are required"}
+            continue
+        pairs.append((question, entity))
+        positions.append(i)
+    try:
+        start = time.perf_counter()
+        for i, sparql_query in zip(positions, translate_many(pairs)):
+            results[i] = {"sparql_query": sparql_query}
+        logger.info(f"Batch of {len(items)} translated in {time.perf_counter() - start:.2f}s")
+    except NotReady as e:
+        return overloaded_response(f"{e}, retry shortly")
+    except Exception as e:
+        logger.error(f"Error in batch translation: {e}")
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"results": results})
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=6005, debug=False)
+    # Development server; production runs gunicorn -c gunicorn.conf.py app:app
+    app.run(host="0.0.0.0", port=6005, debug=False, threaded=True)
@@ -0,0 +1,145 @@
+"""
+Dynamic micro-batching for the NL2SPARQL model.
+
+Concurrent requests each call MicroBatcher.submit(); a single worker thread
+collects whatever is queued, waiting at most BATCH_MAX_WAIT_MS after the first
+item or until BATCH_MAX_SIZE items are queued, runs one batched generate for all
+of them and hands each caller its own result. A request therefore waits at most
+BATCH_MAX_WAIT_MS plus the time of one batch before its generate starts.
+
+The worker thread is started on first use in each process, so the batcher can
+be created before gunicorn forks its workers.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Callable, Generic, List, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+# Seconds a caller waits for its result before giving up
+BATCH_RESULT_TIMEOUT = float(os.getenv("BATCH_RESULT_TIMEOUT", "120"))
+# Queued items beyond which submit() refuses new work (0 = unbounded)
+BATCH_MAX_QUEUE = int(os.getenv("BATCH_MAX_QUEUE", "64"))
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class BatcherOverloaded(RuntimeError):
+    """The queue is full; the caller should shed the request rather than wait."""
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Runs `process(items) -> results` (same length and order) on batches of
+    submitted items. An exception from `process` is raised in every caller of
+    that batch.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[List[T]], Sequence[R]],
+        max_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        max_queue: int = BATCH_MAX_QUEUE,
+        name: str = "micro-batcher",
+    ):
+        self.process = process
+        self.max_size = max(1, max_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_queue = max(0, max_queue)
+        self.name = name
+        self._queue: "queue.Queue[Tuple[T, Future]]" = queue.Queue(self.max_queue)
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        # A forked child inherits the queue (and possibly a held lock) but not the thread
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._queue = queue.Queue(self.max_queue)
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def submit(self, item: T, timeout: Optional[float] = BATCH_RESULT_TIMEOUT) -> R:
+        """Queues `item` and blocks until its batch has run. Raises BatcherOverloaded if the queue is full."""
+        self._ensure_worker()
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            self.rejected += 1
+            raise BatcherOverloaded(f"{self.name}: {self.max_queue} requests already queued")
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def _collect(self) -> List[Tuple[T, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            # Callers that timed out no longer want a result
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                results = self.process([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            self.batches += 1
+            self.items += len(batch)
+            logger.debug(f"Ran batch of {len(batch)} in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def is_overloaded(self) -> bool:
+        return self.max_queue > 0 and self.pending() >= self.max_queue
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_size": self.max_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
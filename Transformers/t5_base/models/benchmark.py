@@ -0,0 +1,229 @@
+"""
+Benchmark of the NL2SPARQL service on the repository's question sets.
+
+Replays each dataset's questions with --concurrency clients, either in this
+process (through app.generate_sparql, so requests meet the same micro-batcher,
+caches and decoding settings as in the service) or over HTTP against a running
+service's /nl2sparql endpoint. Every dataset is reported with:
+
+    p50/p95/p99  request latency in ms
+    rps          completed requests per second
+    tok/s        generated SPARQL tokens per second (checkpoint-2 tokenizer)
+    exact        share of outputs equal to the reference query (whitespace-normalised)
+    peak RSS     high-water resident memory of the serving process(es) in MB
+
+    python benchmark.py --concurrency 8 --limit 200
+    DECODING_MODE=speculative SPECULATIVE_DRAFT_MODEL=./draft-t5-small python benchmark.py
+    python benchmark.py --url http://localhost:6005 --server-pid $(pgrep -of gunicorn) --json beam5.json
+
+In-process runs disable the translation and encoder caches unless --warm-caches
+is given, so every request is decoded; for HTTP runs, start the service with
+TRANSLATION_CACHE_SIZE=0 (and ENCODER_CACHE_MAX_BYTES=0) for the same effect.
+The encoder cache is off by default; with --warm-caches, comparing runs with and
+without ENCODER_CACHE_MAX_BYTES set shows whether it pays off.
+Peak RSS of an HTTP service is only known when --server-pid is given (the
+gunicorn master: its workers' high-water marks are summed, Linux only).
+"""
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bulk_translate import item_pair
+
+DEFAULT_DATA = [
+    "../val_data_2April.json",
+    "../val_data_6April.json",
+    "../abacws_bldg_question_pairs_entities.json",
+]
+# Attempts per request while the service answers 503 (overloaded or still warming up)
+HTTP_ATTEMPTS = 20
+WHITESPACE = re.compile(r"\s+")
+
+Sample = Tuple[str, str, Optional[str]]
+
+
+def normalise(query: str) -> str:
+    return WHITESPACE.sub(" ", query).strip()
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def load_samples(path: str, limit: Optional[int], seed: int) -> List[Sample]:
+    """(question, entity, reference query) for the items of a dataset, a seeded sample of `limit` of them."""
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    samples = []
+    for item in items:
+        pair = item_pair(item)
+        if pair is not None:
+            samples.append((pair[0], pair[1], item.get("sparql") or item.get("target_text")))
+    if limit and limit < len(samples):
+        samples = random.Random(seed).sample(samples, limit)
+    return samples
+
+
+def in_process_translator() -> Callable[[str, str], str]:
+    import app
+
+    if not app.startup.wait():
+        raise RuntimeError(f"Model failed to load: {app.startup.error}")
+    return app.generate_sparql
+
+
+def http_translator(url: str, timeout: float) -> Callable[[str, str], str]:
+    endpoint = url.rstrip("/") + "/nl2sparql"
+
+    def translate(question: str, entity: str) -> str:
+        body = json.dumps({"question": question, "entity": entity}).encode("utf-8")
+        for _ in range(HTTP_ATTEMPTS):
+            req = urllib.request.Request(endpoint, data=body, headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(req, timeout=timeout) as response:
+                    return json.load(response)["sparql_query"]
+            except urllib.error.HTTPError as e:
+                if e.code != 503:
+                    raise
+                time.sleep(float(e.headers.get("Retry-After") or 1))
+        raise RuntimeError(f"Service still unavailable after {HTTP_ATTEMPTS} attempts")
+
+    return translate
+
+
+def peak_rss_mb(pid: Optional[int]) -> Optional[float]:
+    """High-water RSS of this process, or of `pid` plus its direct children (from /proc)."""
+    if pid is None:
+        # ru_maxrss is in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    pids = [pid]
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                pids.extend(int(child) for child in f.read().split())
+    except OSError:
+        return None
+    total_kb = 0
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                total_kb += next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        except (OSError, StopIteration):
+            continue
+    return total_kb / 1024
+
+
+def run(translate: Callable[[str, str], str], samples: List[Sample], concurrency: int, count_tokens) -> Dict[str, Any]:
+    def one(sample: Sample) -> Tuple[float, Optional[str], Optional[str]]:
+        start = time.perf_counter()
+        try:
+            output = translate(sample[0], sample[1])
+        except Exception as e:
+            return time.perf_counter() - start, None, str(e)
+        return time.perf_counter() - start, output, None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, samples))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000 for latency, output, _ in results if output is not None]
+    outputs = [(sample, output) for sample, (_, output, _) in zip(samples, results) if output is not None]
+    errors = [error for _, _, error in results if error is not None]
+    compared = [(sample[2], output) for sample, output in outputs if sample[2]]
+    tokens = sum(count_tokens(output) for _, output in outputs)
+    if errors:
+        print(f"  {len(errors)} failed requests, e.g.: {errors[0]}", file=sys.stderr)
+    return {
+        "requests": len(samples),
+        "errors": len(errors),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "rps": len(outputs) / elapsed if elapsed else 0.0,
+        "tokens_per_s": tokens / elapsed if elapsed else 0.0,
+        "exact": sum(normalise(ref) == normalise(out) for ref, out in compared) / len(compared) if compared else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the NL2SPARQL service on the question sets")
+    parser.add_argument("--data", nargs="+", default=DEFAULT_DATA, help="JSON datasets to replay")
+    parser.add_argument("--url", help="Benchmark a running service over HTTP instead of in-process")
+    parser.add_argument("--server-pid", type=int, help="PID of the HTTP service, for its peak RSS")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--limit", type=int, default=200, help="Questions per dataset (0: all)")
+    parser.add_argument("--warmup", type=int, default=8, help="Untimed requests before the first dataset")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="HTTP request timeout in seconds")
+    parser.add_argument("--tokenizer", default="./checkpoint-2", help="Tokenizer for counting output tokens")
+    parser.add_argument("--warm-caches", action="store_true", help="Keep the translation and encoder caches on")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        translate = http_translator(args.url, args.timeout)
+        from transformers import T5Tokenizer
+
+        tokenizer = T5Tokenizer.from_pretrained(args.tokenizer)
+    else:
+        # Load synchronously; warm-up is done below with the benchmark's own requests
+        os.environ.setdefault("STARTUP_BACKGROUND", "0")
+        if not args.warm_caches:
+            os.environ["TRANSLATION_CACHE_SIZE"] = "0"
+            os.environ["TRANSLATION_CACHE_PATH"] = ""
+            os.environ["ENCODER_CACHE_MAX_BYTES"] = "0"
+        translate = in_process_translator()
+        import app
+
+        tokenizer = app.tokenizer
+
+    def count_tokens(output: str) -> int:
+        return len(tokenizer.tokenize(output)) + 1  # + </s>
+
+    datasets = {path: load_samples(path, args.limit or None, args.seed) for path in args.data}
+    warmup = [sample for samples in datasets.values() for sample in samples][:args.warmup]
+    if warmup:
+        run(translate, warmup, args.concurrency, count_tokens)
+
+    mode = args.url or "in-process"
+    print(f"Benchmark ({mode}, concurrency {args.concurrency})")
+    print(f"{'dataset':<44}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>8}{'tok/s':>9}{'exact':>8}")
+    results = []
+    for path, samples in datasets.items():
+        row = {"dataset": path, **run(translate, samples, args.concurrency, count_tokens)}
+        results.append(row)
+        exact = f"{row['exact']:.1%}" if row["exact"] is not None else "-"
+        print(
+            f"{os.path.basename(path):<44}{row['requests']:>6}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+            f"{row['p99_ms']:>10.1f}{row['rps']:>8.2f}{row['tokens_per_s']:>9.1f}{exact:>8}"
+        )
+
+    rss = peak_rss_mb(args.server_pid if args.url else None)
+    if rss is not None:
+        print(f"Peak RSS: {rss:.0f} MB")
+    if args.json:
+        settings = {"mode": mode, "concurrency": args.concurrency, "limit": args.limit, "seed": args.seed}
+        if not args.url:
+            import app
+
+            settings.update(backend=app.INFERENCE_BACKEND, decoding=app.DECODING_MODE, batcher=app.batcher.stats())
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "peak_rss_mb": rss, "results": results}, f, indent=2)
+    return 1 if any(row["errors"] for row in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Offline bulk translation through the service's translation path.
+
+Loads the model like app.py does (same checkpoint, backend, decoding settings and
+translation cache) and pushes a whole JSON dataset through translate_many(),
+chunk by chunk, writing one JSON line per item as it goes:
+
+    python bulk_translate.py ../val_data_April.json -o val_April_predictions.jsonl
+    python bulk_translate.py ../sparql_dataset1.json --batch-size 64 --limit 1000
+
+Accepted items are {"question", "entity"[, "sparql"]} (the sparql_dataset*.json
+and *_question_pairs_*.json files) or {"input_text"[, "target_text"]} (the
+val_data_*.json files), whose question and entity are taken from the input text.
+When the items carry a reference query, the exact-match rate is reported.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import Iterator, List, Optional, Tuple
+
+# Load synchronously and skip the warm-up; the first chunk warms the model anyway
+os.environ.setdefault("STARTUP_BACKGROUND", "0")
+os.environ.setdefault("STARTUP_WARMUP_GENERATIONS", "0")
+
+INPUT_TEXT = re.compile(r"input:\s*(?P<question>.*?)\s*\nentity\s*:?\s*(?P<entity>.*)$", re.DOTALL)
+WHITESPACE = re.compile(r"\s+")
+
+
+def item_pair(item: dict) -> Optional[Tuple[str, str]]:
+    if item.get("question") and item.get("entity"):
+        return item["question"], WHITESPACE.sub(" ", item["entity"]).strip()
+    match = INPUT_TEXT.search(item.get("input_text", ""))
+    if match:
+        return match.group("question"), match.group("entity").strip()
+    return None
+
+
+def chunks(items: List[dict], size: int) -> Iterator[Tuple[int, List[dict]]]:
+    for start in range(0, len(items), size):
+        yield start, items[start:start + size]
+
+
+def normalise(query: str) -> str:
+    return WHITESPACE.sub(" ", query).strip()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Translate a JSON dataset with the NL2SPARQL model")
+    parser.add_argument("input", help="JSON list of items")
+    parser.add_argument("-o", "--output", help="JSON Lines output (default: stdout)")
+    parser.add_argument("--batch-size", type=int, help="Inputs per generate call (default BULK_BATCH_SIZE)")
+    parser.add_argument("--chunk-size", type=int, default=512, help="Items read and written per step")
+    parser.add_argument("--limit", type=int, help="Only the first N items")
+    args = parser.parse_args(argv)
+
+    import app
+
+    if not app.startup.wait():
+        print(f"Model failed to load: {app.startup.error}", file=sys.stderr)
+        return 1
+    batch_size = args.batch_size or app.BULK_BATCH_SIZE
+
+    with open(args.input, encoding="utf-8") as f:
+        items = json.load(f)
+    if args.limit:
+        items = items[:args.limit]
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    start = time.perf_counter()
+    done = skipped = compared = matched = 0
+    try:
+        for offset, chunk in chunks(items, args.chunk_size):
+            pairs = [item_pair(item) for item in chunk]
+            translations = iter(app.translate_many([p for p in pairs if p], batch_size))
+            for i, (item, pair) in enumerate(zip(chunk, pairs)):
+                record = {"index": offset + i}
+                if pair is None:
+                    record["error"] = "no question/entity in item"
+                    skipped += 1
+                else:
+                    record.update(question=pair[0], entity=pair[1], sparql_query=next(translations))
+                    expected = item.get("sparql") or item.get("target_text")
+                    if expected:
+                        record["match"] = normalise(record["sparql_query"]) == normalise(expected)
+                        compared += 1
+                        matched += record["match"]
+                out.write(json.dumps(record) + "\n")
+            done += len(chunk)
+            out.flush()
+            elapsed = time.perf_counter() - start
+            print(f"{done}/{len(items)} items, {done / elapsed:.1f} items/s", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Translated {done - skipped} items in {elapsed:.1f}s ({skipped} skipped)", file=sys.stderr)
+    if compared:
+        print(f"Exact match: {matched}/{compared} ({matched / compared:.1%})", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
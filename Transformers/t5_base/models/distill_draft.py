@@ -0,0 +1,159 @@
+"""
+Trains the draft model for speculative decoding (see speculative.py).
+
+Sequence-level distillation: checkpoint-2 translates every training question
+greedily, and t5-small is fine-tuned on those translations rather than on the
+reference queries. The draft is only useful where it predicts what the target
+will say, so it learns the target's habits, mistakes included, which is what
+raises the acceptance rate. The draft is saved with checkpoint-2's tokenizer so
+both models share one vocabulary.
+
+    python distill_draft.py --output ./draft-t5-small
+    SPECULATIVE_DRAFT_MODEL=./draft-t5-small DECODING_MODE=speculative python app.py
+
+Teacher translations are written to --teacher-cache as they are produced, so an
+interrupted run resumes where it stopped.
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List, Optional
+
+import torch
+from datasets import Dataset
+from transformers import (
+    DataCollatorForSeq2Seq,
+    T5Config,
+    T5ForConditionalGeneration,
+    T5Tokenizer,
+    Trainer,
+    TrainingArguments,
+)
+
+from bulk_translate import item_pair
+from startup import load_pytorch_model
+
+DEFAULT_DATA = [
+    "../sparql_dataset1.json",
+    "../abacws_bldg_question_pairs_entities.json",
+    "../updated_bldg_question_pairs_entities.json",
+]
+
+
+def format_input(question, entity):
+    # Same input format as app.py
+    return f"task: generate_sparql\ninput: {question}\nentity:{entity}"
+
+
+def load_inputs(paths: List[str]) -> List[str]:
+    texts = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for item in json.load(f):
+                pair = item_pair(item)
+                if pair is not None:
+                    texts.append(format_input(*pair))
+    return list(dict.fromkeys(texts))
+
+
+def teacher_translations(model_path: str, texts: List[str], cache_path: str, batch_size: int) -> Dict[str, str]:
+    """Greedy checkpoint-2 output for every input, reusing (and extending) cache_path."""
+    translations: Dict[str, str] = {}
+    if os.path.isfile(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            translations = json.load(f)
+    todo = [text for text in texts if text not in translations]
+    if not todo:
+        return translations
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    tokenizer = T5Tokenizer.from_pretrained(model_path)
+    teacher = load_pytorch_model(model_path, device)
+    # Similar lengths in each batch keep padding down
+    todo.sort(key=len)
+    for start in range(0, len(todo), batch_size):
+        chunk = todo[start:start + batch_size]
+        encoded = tokenizer(chunk, return_tensors="pt", padding=True, truncation=True, max_length=512).to(device)
+        with torch.no_grad():
+            outputs = teacher.generate(
+                encoded.input_ids, attention_mask=encoded.attention_mask, num_beams=1, max_length=150
+            )
+        translations.update(zip(chunk, tokenizer.batch_decode(outputs, skip_special_tokens=True)))
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(translations, f)
+        print(f"Teacher: {min(start + batch_size, len(todo))}/{len(todo)} translated")
+    return translations
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Distil checkpoint-2 into a small draft model")
+    parser.add_argument("--teacher", default="./checkpoint-2")
+    parser.add_argument("--student", default="t5-small")
+    parser.add_argument("--data", nargs="+", default=DEFAULT_DATA, help="JSON datasets of questions")
+    parser.add_argument("--output", default="./draft-t5-small")
+    parser.add_argument("--teacher-cache", default="./draft-teacher-translations.json")
+    parser.add_argument("--teacher-batch-size", type=int, default=32)
+    parser.add_argument("--epochs", type=float, default=5)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--learning-rate", type=float, default=3e-4)
+    args = parser.parse_args(argv)
+
+    # --------------------------------------------------------------
+    # 1. Teacher translations of the training questions
+    # --------------------------------------------------------------
+    texts = load_inputs(args.data)
+    translations = teacher_translations(args.teacher, texts, args.teacher_cache, args.teacher_batch_size)
+    dataset = Dataset.from_dict({
+        "input_text": texts,
+        "target_text": [translations[text] for text in texts],
+    })
+    print(f"Distilling on {len(dataset)} teacher translations")
+
+    # --------------------------------------------------------------
+    # 2. Student model, with the teacher's tokenizer
+    # --------------------------------------------------------------
+    tokenizer = T5Tokenizer.from_pretrained(args.teacher)
+    model = T5ForConditionalGeneration.from_pretrained(args.student)
+    teacher_vocab = T5Config.from_pretrained(args.teacher).vocab_size
+    if model.config.vocab_size != teacher_vocab:
+        model.resize_token_embeddings(teacher_vocab)
+
+    def preprocess_function(examples):
+        model_inputs = tokenizer(examples["input_text"], max_length=512, truncation=True)
+        with tokenizer.as_target_tokenizer():
+            labels = tokenizer(examples["target_text"], max_length=512, truncation=True)
+        model_inputs["labels"] = labels["input_ids"]
+        return model_inputs
+
+    tokenized_dataset = dataset.map(preprocess_function, batched=True, remove_columns=dataset.column_names)
+
+    # --------------------------------------------------------------
+    # 3. Train and save
+    # --------------------------------------------------------------
+    training_args = TrainingArguments(
+        output_dir=args.output,
+        overwrite_output_dir=True,
+        num_train_epochs=args.epochs,
+        per_device_train_batch_size=args.batch_size,
+        learning_rate=args.learning_rate,
+        save_strategy="no",
+        logging_steps=100,
+    )
+    trainer = Trainer(
+        model=model,
+        args=training_args,
+        train_dataset=tokenized_dataset,
+        tokenizer=tokenizer,
+        data_collator=DataCollatorForSeq2Seq(tokenizer, model=model),
+    )
+    trainer.train()
+    trainer.save_model(args.output)
+    tokenizer.save_pretrained(args.output)
+
+    print(f"Draft model saved to {args.output}; measure it with: python speculative.py measure --draft {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Cache of T5 encoder outputs.
+
+generate() normally runs the encoder on every input before decoding. The
+encoder's hidden states are kept here, keyed on the full model input text, so an
+input that is decoded again (a retry, a different decoding setting, the same
+question arriving in another batch after a translation-cache miss) skips the
+encoder pass and goes straight to decoding.
+
+The key has to be the whole input: T5's encoder attends in both directions, so
+the states of a shared question prefix change with the entity that follows it.
+Reusing them across entity variants would change the output. Entity variants of
+one question are instead encoded and decoded together in a single batch
+(translate_many / the /nl2sparql/variants endpoint).
+
+Entries are bounded by ENCODER_CACHE_MAX_BYTES of hidden states (LRU). Only the
+PyTorch backend is supported.
+
+The cache is off by default (ENCODER_CACHE_MAX_BYTES=0). In app.py it sits
+behind the translation cache, which already answers repeated inputs, so it only
+sees inputs that are new or were evicted and its hit rate is close to zero,
+while costing up to its budget in every worker. Turn it on only where
+benchmark.py shows a gain for the deployment's settings, e.g. with
+TRANSLATION_CACHE_SIZE=0 or a small translation cache:
+
+    ENCODER_CACHE_MAX_BYTES=268435456 python benchmark.py --warm-caches
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+import torch
+from transformers.modeling_outputs import BaseModelOutput
+
+ENCODER_CACHE_MAX_BYTES = int(os.getenv("ENCODER_CACHE_MAX_BYTES", "0"))
+
+
+class EncoderCache:
+    def __init__(self, max_bytes: int = ENCODER_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        # input text -> hidden states [length, d_model], without padding
+        self._entries: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, text: str):
+        with self._lock:
+            hidden = self._entries.get(text)
+            if hidden is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(text)
+            self.hits += 1
+            return hidden
+
+    def put(self, text: str, hidden: torch.Tensor) -> None:
+        size = hidden.element_size() * hidden.nelement()
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(text, None)
+            if previous is not None:
+                self._bytes -= previous.element_size() * previous.nelement()
+            self._entries[text] = hidden
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.element_size() * evicted.nelement()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+    def encode(self, model, tokenizer, texts: List[str], device) -> Tuple[BaseModelOutput, torch.Tensor]:
+        """
+        Encoder outputs and attention mask for a batch of inputs, running the
+        encoder only on the texts not cached yet (once per distinct text).
+        """
+        states = [self.get(text) for text in texts]
+        missing = list(dict.fromkeys(text for text, hidden in zip(texts, states) if hidden is None))
+        if missing:
+            encoded = tokenizer(missing, return_tensors="pt", padding=True, truncation=True, max_length=512).to(device)
+            with torch.no_grad():
+                hidden = model.get_encoder()(
+                    input_ids=encoded.input_ids, attention_mask=encoded.attention_mask
+                ).last_hidden_state
+            fresh = {}
+            for row, text in enumerate(missing):
+                length = int(encoded.attention_mask[row].sum())
+                fresh[text] = hidden[row, :length].clone()
+                self.put(text, fresh[text])
+            states = [hidden if hidden is not None else fresh[text] for text, hidden in zip(texts, states)]
+
+        # Right-pad to a common length, as the tokenizer would have
+        max_length = max(h.shape[0] for h in states)
+        d_model = states[0].shape[-1]
+        batch = states[0].new_zeros((len(states), max_length, d_model))
+        attention_mask = torch.zeros((len(states), max_length), dtype=torch.long, device=batch.device)
+        for row, h in enumerate(states):
+            batch[row, :h.shape[0]] = h
+            attention_mask[row, :h.shape[0]] = 1
+        return BaseModelOutput(last_hidden_state=batch), attention_mask
@@ -0,0 +1,141 @@
+"""
+Compares decoding settings of the NL2SPARQL model on the validation sets.
+
+For every val_data_*.json file, a sample of inputs is decoded with each setting
+and reported with:
+
+    valid     share of outputs rdflib can parse as SPARQL (Brick prefixes pre-bound)
+    exact     share of outputs equal to the target query (whitespace-normalised)
+    mean/p95  latency per query in ms (one query at a time)
+    fallback  share of constrained steps where no top-k token was valid
+
+Settings: beam5 (the service default), greedy, and greedy / 2-beam with the
+grammar constraint from sparql_grammar.py.
+
+    python evaluate_decoding.py --data "../val_data_*.json" --limit 200
+    python evaluate_decoding.py --modes beam5,grammar-greedy --json results.json
+
+Needs rdflib (pip install rdflib) for the validity check.
+"""
+import argparse
+import glob
+import json
+import logging
+import random
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+
+import torch
+from transformers import LogitsProcessorList, T5ForConditionalGeneration, T5Tokenizer
+
+from sparql_grammar import NAMESPACES, entities_from_input, grammar_processor
+
+# name -> (num_beams, constrained)
+MODES = {
+    "beam5": (5, False),
+    "greedy": (1, False),
+    "grammar-greedy": (1, True),
+    "grammar-beam2": (2, True),
+}
+WHITESPACE = re.compile(r"\s+")
+
+
+def is_valid_sparql(query: str) -> bool:
+    from rdflib.plugins.sparql import prepareQuery
+
+    try:
+        prepareQuery(query, initNs=NAMESPACES)
+        return True
+    except Exception:
+        return False
+
+
+def normalise(query: str) -> str:
+    return WHITESPACE.sub(" ", query).strip()
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def evaluate(model, tokenizer, samples: List[dict], num_beams: int, constrained: bool) -> Dict[str, float]:
+    valid = exact = steps = fallback = 0
+    latencies = []
+    for sample in samples:
+        input_ids = tokenizer.encode(sample["input_text"], return_tensors="pt", truncation=True, max_length=512)
+        kwargs = {}
+        processor = None
+        if constrained:
+            processor = grammar_processor(tokenizer, entities_from_input(sample["input_text"]))
+            kwargs["logits_processor"] = LogitsProcessorList([processor])
+        start = time.perf_counter()
+        with torch.no_grad():
+            output = model.generate(input_ids, max_length=150, num_beams=num_beams, early_stopping=True, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+        query = tokenizer.decode(output[0], skip_special_tokens=True)
+        valid += is_valid_sparql(query)
+        exact += normalise(query) == normalise(sample["target_text"])
+        if processor is not None:
+            steps += processor.steps
+            fallback += processor.unconstrained_steps
+    n = max(len(samples), 1)
+    return {
+        "samples": len(samples),
+        "valid": valid / n,
+        "exact": exact / n,
+        "mean_ms": sum(latencies) / n,
+        "p95_ms": percentile(latencies, 0.95),
+        "fallback": fallback / steps if steps else 0.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Validity and latency of decoding settings on the validation sets")
+    parser.add_argument("--model", default="./checkpoint-2")
+    parser.add_argument("--data", default="../val_data_*.json", help="Glob of validation files")
+    parser.add_argument("--limit", type=int, default=200, help="Samples per file")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma-separated, from: {', '.join(MODES)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(unknown)}")
+    paths = sorted(glob.glob(args.data))
+    if not paths:
+        parser.error(f"no files match {args.data}")
+
+    tokenizer = T5Tokenizer.from_pretrained(args.model)
+    model = T5ForConditionalGeneration.from_pretrained(args.model).eval()
+
+    results = {}
+    print(f"{'file':<24}{'mode':<16}{'valid':>8}{'exact':>8}{'mean ms':>10}{'p95 ms':>10}{'fallback':>10}")
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            samples = json.load(f)
+        random.Random(args.seed).shuffle(samples)
+        samples = samples[:args.limit]
+        for mode in modes:
+            num_beams, constrained = MODES[mode]
+            row = evaluate(model, tokenizer, samples, num_beams, constrained)
+            results.setdefault(path, {})[mode] = row
+            print(
+                f"{path.rsplit('/', 1)[-1]:<24}{mode:<16}{row['valid']:>8.1%}{row['exact']:>8.1%}"
+                f"{row['mean_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['fallback']:>10.1%}"
+            )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Production serving for the NL2SPARQL app:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Startup in production (WEB_PRELOAD=1, the default):
+
+    1. the master imports app.py (preload_app), which does not load the weights
+    2. the master binds PORT
+    3. when_ready: the master loads the weights ("loading" phase, see startup.py);
+       connections made meanwhile wait in the listen backlog, since no worker
+       exists yet to answer them, /healthz included
+    4. the workers are forked and share the weight pages copy-on-write instead of
+       loading one copy each; each answers /healthz at once and warms up in the
+       background, with /readyz reporting "warming" until it can serve
+
+Objects alive at fork time are frozen out of the garbage collector, whose
+bookkeeping writes would otherwise touch (and copy) the shared pages.
+
+The readiness phases before "warming" (see startup.py) are therefore not
+observable over HTTP with preloading. With WEB_PRELOAD=0 the workers are forked
+straight after binding and each loads its own copy of the weights in the
+background, so /healthz answers and /readyz reports "loading" during loading
+too, at the cost of one copy of the model per worker. INFERENCE_BACKEND=onnx
+always runs this way: onnxruntime sessions hold thread pools and are not safe to
+create in the master and use in forked children.
+
+Each worker gets an equal share of the cores for torch's intra-op threads (and
+onnxruntime's, through ONNX_THREADS) and serves requests on a few threads, which feed its micro-batcher; when the
+batcher's queue is full the app answers 503 with Retry-After.
+
+Settings (environment):
+    PORT                 listen port (default 6005)
+    WEB_PRELOAD          load the weights once in the master and share them (default 1;
+                         ignored with INFERENCE_BACKEND=onnx)
+    WEB_WORKERS          worker processes (default: cores // TORCH_THREADS, at least 1)
+    TORCH_THREADS        intra-op threads per worker (default: cores // workers, or 2 if
+                         neither is set)
+    TORCH_INTEROP_THREADS  inter-op threads per worker (default 1)
+    WEB_THREADS          request threads per worker (default BATCH_MAX_SIZE)
+    WEB_TIMEOUT          seconds before a stuck worker is restarted (default 120)
+"""
+import gc
+import os
+import sys
+
+preload_app = os.getenv("WEB_PRELOAD", "1") == "1" and os.getenv("INFERENCE_BACKEND", "pytorch").lower() != "onnx"
+if preload_app:
+    # Read by startup.py: app.py leaves loading to when_ready and warm-up to post_fork
+    os.environ.setdefault("STARTUP_WARMUP_IN_WORKERS", "1")
+
+
+def _cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+cores = _cores()
+_torch_threads = int(os.getenv("TORCH_THREADS", "0"))
+_workers = int(os.getenv("WEB_WORKERS", "0"))
+if not _workers:
+    _workers = max(1, cores // (_torch_threads or min(2, cores)))
+if not _torch_threads:
+    _torch_threads = max(1, cores // _workers)
+
+bind = f"0.0.0.0:{os.getenv('PORT', '6005')}"
+workers = _workers
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", os.getenv("BATCH_MAX_SIZE", "8")))
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+# Connections waiting for a worker thread; beyond this the kernel refuses them
+backlog = int(os.getenv("WEB_BACKLOG", "256"))
+accesslog = "-"
+
+torch_threads = _torch_threads
+torch_interop_threads = int(os.getenv("TORCH_INTEROP_THREADS", "1"))
+# Read by onnx_backend.py in the workers, which import app.py after the fork
+os.environ.setdefault("ONNX_THREADS", str(torch_threads))
+
+
+def when_ready(server):
+    # The socket is bound; load the weights before the workers are forked so they share them
+    app_module = sys.modules.get("app")
+    if preload_app and app_module is not None and getattr(app_module, "startup", None) is not None:
+        app_module.startup.run(app_module.load_model_and_tokenizer, None, finish=False)
+        if app_module.startup.state == "failed":
+            raise RuntimeError(f"Failed to load model: {app_module.startup.error}")
+    server.log.info(
+        f"Serving with {workers} workers x {threads} threads, "
+        f"{torch_threads} torch threads each ({cores} cores)"
+    )
+
+
+def pre_fork(server, worker):
+    # Keep the preloaded model's objects out of the collector's generations in the children
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    try:
+        torch.set_num_interop_threads(torch_interop_threads)
+    except RuntimeError:
+        # Only settable before the first parallel op in this process
+        server.log.warning("Could not set torch inter-op threads; keeping the inherited setting")
+    server.log.info(f"Worker {worker.pid}: {torch.get_num_threads()} torch threads")
+
+    # Warm up in the background; /readyz reports "warming" until this worker can serve
+    app_module = sys.modules.get("app")
+    if app_module is not None and getattr(app_module, "startup", None) is not None:
+        app_module.startup.start(None, app_module.warm_up, background=True)
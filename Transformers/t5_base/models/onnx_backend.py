@@ -0,0 +1,225 @@
+"""
+ONNX Runtime backend for the NL2SPARQL checkpoint.
+
+The checkpoint is exported once with optimum into an encoder, a decoder and a
+decoder-with-past (so each generation step only runs the new token through the
+decoder), and optionally quantised with dynamic int8 weights. The exported model
+is an ORTModelForSeq2SeqLM, which uses the same `generate()` as the PyTorch model,
+so beam search settings and output are unchanged apart from quantisation noise.
+
+Select it in app.py with INFERENCE_BACKEND=onnx. The export is created on first
+start if ONNX_MODEL_PATH does not exist yet, or ahead of time with:
+
+    python onnx_backend.py export --model ./checkpoint-2 --output ./checkpoint-2-onnx
+
+and compared with the PyTorch model (exact-match rate, latency, memory) with:
+
+    python onnx_backend.py parity --data ../val_data_April.json --limit 200
+
+Images built with --build-arg ONNX_EXPORT=1 run the export and the parity check
+on onnx_parity_inputs.json (64 validation inputs) at build time, so an image
+whose int8 export drifts from the PyTorch model fails to build instead of
+serving different queries.
+"""
+import argparse
+import fcntl
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "pytorch").lower()
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "./checkpoint-2-onnx")
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "1") == "1"
+# Threads per inference session; 0 lets onnxruntime use every core. gunicorn.conf.py
+# sets it to each worker's share of the cores
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+ONNX_FILES = ["encoder_model.onnx", "decoder_model.onnx", "decoder_with_past_model.onnx"]
+QUANTIZED_SUFFIX = "_quantized"
+
+
+def quantized_name(file_name: str) -> str:
+    stem, ext = os.path.splitext(file_name)
+    return f"{stem}{QUANTIZED_SUFFIX}{ext}"
+
+
+def export_onnx(model_path: str, output_dir: str, quantize: bool = ONNX_QUANTIZE) -> None:
+    """Exports `model_path` to ONNX in `output_dir`, adding int8 copies of each graph if `quantize`."""
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import T5Tokenizer
+
+    start = time.perf_counter()
+    model = ORTModelForSeq2SeqLM.from_pretrained(model_path, export=True, use_cache=True)
+    model.save_pretrained(output_dir)
+    T5Tokenizer.from_pretrained(model_path).save_pretrained(output_dir)
+    logger.info(f"Exported {model_path} to ONNX in {output_dir} ({time.perf_counter() - start:.1f}s)")
+
+    if quantize:
+        # Dynamic quantisation: int8 weights, activations quantised at run time; no calibration data
+        config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        for file_name in ONNX_FILES:
+            quantizer = ORTQuantizer.from_pretrained(output_dir, file_name=file_name)
+            quantizer.quantize(save_dir=output_dir, quantization_config=config)
+        logger.info(f"Quantised {', '.join(ONNX_FILES)} to int8")
+
+
+def load_onnx_model(onnx_path: str, quantized: bool = ONNX_QUANTIZE, threads: int = ONNX_THREADS):
+    """The exported model as an ORTModelForSeq2SeqLM on the CPU execution provider."""
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads > 0:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    names = [quantized_name(f) if quantized else f for f in ONNX_FILES]
+    return ORTModelForSeq2SeqLM.from_pretrained(
+        onnx_path,
+        encoder_file_name=names[0],
+        decoder_file_name=names[1],
+        decoder_with_past_file_name=names[2],
+        use_cache=True,
+        provider="CPUExecutionProvider",
+        session_options=options,
+    )
+
+
+def onnx_export_exists(onnx_path: str, quantized: bool = ONNX_QUANTIZE) -> bool:
+    return all(
+        os.path.isfile(os.path.join(onnx_path, quantized_name(f) if quantized else f)) for f in ONNX_FILES
+    )
+
+
+def served_variant() -> str:
+    """
+    How the checkpoint is served: the backend, and for ONNX whether it is the
+    int8 export. The export is derived from the checkpoint, so this (not the
+    export's files) is what tells its translations apart from PyTorch's.
+    """
+    if INFERENCE_BACKEND == "onnx":
+        return "onnx-int8" if ONNX_QUANTIZE else "onnx"
+    return INFERENCE_BACKEND
+
+
+def load_model(model_path: str, device):
+    """
+    The model selected by INFERENCE_BACKEND. The ONNX export is created from
+    `model_path` if it does not exist yet.
+    """
+    if INFERENCE_BACKEND == "onnx":
+        # Every gunicorn worker loads its own session; the first one exports, the others wait for it
+        os.makedirs(os.path.dirname(os.path.abspath(ONNX_MODEL_PATH)), exist_ok=True)
+        with open(ONNX_MODEL_PATH.rstrip("/") + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not onnx_export_exists(ONNX_MODEL_PATH):
+                logger.info(f"No ONNX export at {ONNX_MODEL_PATH}; exporting {model_path}")
+                export_onnx(model_path, ONNX_MODEL_PATH)
+        return load_onnx_model(ONNX_MODEL_PATH)
+    from startup import load_pytorch_model
+
+    return load_pytorch_model(model_path, device)
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB (Linux only)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+
+
+def _generate(model, tokenizer, texts: List[str], num_beams: int) -> Tuple[List[str], float]:
+    import torch
+
+    outputs, start = [], time.perf_counter()
+    with torch.no_grad():
+        for text in texts:
+            input_ids = tokenizer.encode(text, return_tensors="pt", truncation=True, max_length=512)
+            generated = model.generate(input_ids, max_length=150, num_beams=num_beams, early_stopping=True)
+            outputs.append(tokenizer.decode(generated[0], skip_special_tokens=True))
+    return outputs, time.perf_counter() - start
+
+
+def parity(
+    model_path: str, onnx_path: str, data_path: str, limit: int, quantized: bool, num_beams: int, seed: int, min_match: float
+) -> int:
+    """
+    Runs the same validation inputs through both backends, one at a time, and
+    reports how often the ONNX output equals the PyTorch output. Fails (exit
+    code 1) below `min_match`; int8 weights may flip the odd near-tied beam.
+    """
+    from transformers import T5ForConditionalGeneration, T5Tokenizer
+
+    with open(data_path, encoding="utf-8") as f:
+        samples = json.load(f)
+    random.Random(seed).shuffle(samples)
+    texts = [sample["input_text"] for sample in samples[:limit]]
+    tokenizer = T5Tokenizer.from_pretrained(model_path)
+
+    if not onnx_export_exists(onnx_path, quantized):
+        export_onnx(model_path, onnx_path, quantize=quantized)
+
+    rss_before = rss_mb()
+    onnx_model = load_onnx_model(onnx_path, quantized)
+    onnx_rss = rss_mb() - rss_before
+    onnx_out, onnx_seconds = _generate(onnx_model, tokenizer, texts, num_beams)
+    del onnx_model
+
+    rss_before = rss_mb()
+    torch_model = T5ForConditionalGeneration.from_pretrained(model_path).eval()
+    torch_rss = rss_mb() - rss_before
+    torch_out, torch_seconds = _generate(torch_model, tokenizer, texts, num_beams)
+
+    matches = sum(a == b for a, b in zip(torch_out, onnx_out))
+    for text, expected, got in zip(texts, torch_out, onnx_out):
+        if expected != got:
+            logger.info(f"Mismatch for {text!r}:\n  pytorch: {expected}\n  onnx:    {got}")
+    n = len(texts)
+    print(f"Samples:              {n} from {data_path}")
+    print(f"Exact match:          {matches}/{n} ({matches / n:.1%})" if n else "Exact match:          n/a")
+    print(f"PyTorch latency:      {torch_seconds / max(n, 1) * 1000:.1f} ms/query")
+    label = "ONNX int8" if quantized else "ONNX"
+    speedup = torch_seconds / onnx_seconds if onnx_seconds else float("nan")
+    print(f"{label + ' latency:':<22}{onnx_seconds / max(n, 1) * 1000:.1f} ms/query ({speedup:.2f}x)")
+    print(f"Model memory (RSS):   PyTorch {torch_rss:.0f} MB, ONNX {onnx_rss:.0f} MB")
+    return 0 if n and matches / n >= min_match else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Export and check the ONNX backend of the NL2SPARQL model")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Export (and quantise) the checkpoint to ONNX")
+    export.add_argument("--model", default="./checkpoint-2")
+    export.add_argument("--output", default=ONNX_MODEL_PATH)
+    export.add_argument("--no-quantize", action="store_true")
+
+    check = sub.add_parser("parity", help="Compare ONNX and PyTorch outputs on validation data")
+    check.add_argument("--model", default="./checkpoint-2")
+    check.add_argument("--onnx", default=ONNX_MODEL_PATH)
+    check.add_argument("--data", default="../val_data_April.json")
+    check.add_argument("--limit", type=int, default=200)
+    check.add_argument("--num-beams", type=int, default=5)
+    check.add_argument("--no-quantize", action="store_true")
+    check.add_argument("--seed", type=int, default=0)
+    check.add_argument("--min-match", type=float, default=0.98, help="Required exact-match rate")
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        export_onnx(args.model, args.output, quantize=not args.no_quantize)
+        return 0
+    return parity(
+        args.model, args.onnx, args.data, args.limit, not args.no_quantize, args.num_beams, args.seed, args.min_match
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,627 @@
+"""
+Grammar-constrained decoding for the NL2SPARQL model.
+
+SparqlGrammarLogitsProcessor plugs into `model.generate()` and, at every step,
+keeps only the candidate tokens whose text extends the query so far into a
+prefix of a syntactically valid SPARQL query. The check is an incremental lexer
+with a small amount of structure on top:
+
+    - the query starts with SELECT / ASK / CONSTRUCT / DESCRIBE / PREFIX
+    - bare words are SPARQL keywords (or `a`), numbers or variables
+    - prefixed names use the Brick prefixes, and their local names must be known
+      classes / predicates (from the vocabulary file), except for the open
+      prefixes (building instances, `bldg:` by default) and the request's own entities
+    - strings, IRIs, braces and parentheses are balanced, nothing but solution
+      modifiers follows the closed WHERE block
+    - end-of-sequence is only allowed once the query is complete
+
+In a batched generate() each input may bring its own entities, so the processor
+holds one vocabulary per input and checks beam row `r` against that of input
+`r // num_beams`.
+
+Only the `top_k` best candidates of each beam are checked (checking all 32k
+tokens every step would cost more than the decoding it saves); if none of them
+is valid the beam is left unconstrained. Lexer states are cached per generated
+prefix, so each check only lexes the new token's text.
+
+The vocabulary is one `prefix:local` per line (sparql_vocabulary.txt), built from
+the Brick schema, the class/relation list and the queries of every dataset the
+model was trained or evaluated on (DEFAULT_VOCABULARY_SOURCES, which include the
+val_data_*.json targets; some of those use Brick 1.3 classes the 1.4 schema no
+longer has) with:
+
+    python sparql_grammar.py build-vocab -o sparql_vocabulary.txt
+"""
+import argparse
+import bisect
+import glob
+import json
+import logging
+import os
+import re
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+GRAMMAR_VOCABULARY = os.getenv("GRAMMAR_VOCABULARY", "./sparql_vocabulary.txt")
+GRAMMAR_TOP_K = int(os.getenv("GRAMMAR_TOP_K", "8"))
+GRAMMAR_OPEN_PREFIXES = [p for p in os.getenv("GRAMMAR_OPEN_PREFIXES", "bldg").split(",") if p]
+
+# Sources of sparql_vocabulary.txt (relative to this directory; globs allowed)
+DEFAULT_VOCABULARY_SOURCES = [
+    "../../../brick-datasets/brick1.4_schema/Brick.ttl",
+    "../all_relations_and_classes.txt",
+    "../sparql_dataset1.json",
+    "../abacws_bldg_question_pairs_entities.json",
+    "../updated_bldg_question_pairs_entities.json",
+    "../metadata.json",
+    "../val_data_*.json",
+]
+
+PREFIXES: List[Tuple[str, str]] = [
+    ("brick", "https://brickschema.org/schema/Brick#"),
+    ("dcterms", "http://purl.org/dc/terms/"),
+    ("owl", "http://www.w3.org/2002/07/owl#"),
+    ("rdf", "http://www.w3.org/1999/02/22-rdf-syntax-ns#"),
+    ("rdfs", "http://www.w3.org/2000/01/rdf-schema#"),
+    ("sh", "http://www.w3.org/ns/shacl#"),
+    ("skos", "http://www.w3.org/2004/02/skos/core#"),
+    ("sosa", "http://www.w3.org/ns/sosa/"),
+    ("xsd", "http://www.w3.org/2001/XMLSchema#"),
+    ("tag", "https://brickschema.org/schema/BrickTag#"),
+    ("bldg", "http://abacwsbuilding.cardiff.ac.uk/abacws#"),
+    ("bsh", "https://brickschema.org/schema/BrickShape#"),
+    ("s223", "http://data.ashrae.org/standard223#"),
+    ("bacnet", "http://data.ashrae.org/bacnet/2020#"),
+    ("g36", "http://data.ashrae.org/standard223/1.0/extensions/g36#"),
+    ("qkdv", "http://qudt.org/vocab/dimensionvector/"),
+    ("quantitykind", "http://qudt.org/vocab/quantitykind/"),
+    ("qudt", "http://qudt.org/schema/qudt/"),
+    ("rec", "https://w3id.org/rec#"),
+    ("ref", "https://brickschema.org/schema/Brick/ref#"),
+    ("s223tobrick", "https://brickschema.org/extension/brick_extension_interpret_223#"),
+    ("schema1", "http://schema.org/"),
+    ("unit", "http://qudt.org/vocab/unit/"),
+    ("vcard", "http://www.w3.org/2006/vcard/ns#"),
+]
+NAMESPACES: Dict[str, str] = dict(PREFIXES)
+
+KEYWORDS = frozenset("""
+    SELECT DISTINCT REDUCED WHERE FILTER OPTIONAL UNION MINUS GRAPH SERVICE BIND AS VALUES UNDEF
+    LIMIT OFFSET ORDER BY ASC DESC GROUP HAVING ASK CONSTRUCT DESCRIBE PREFIX BASE FROM NAMED
+    NOT EXISTS IN TRUE FALSE COUNT SUM AVG MIN MAX SAMPLE GROUP_CONCAT SEPARATOR
+    STR LANG LANGMATCHES DATATYPE BOUND IRI URI BNODE RAND ABS CEIL FLOOR ROUND CONCAT STRLEN
+    UCASE LCASE CONTAINS STRSTARTS STRENDS STRBEFORE STRAFTER SUBSTR REGEX REPLACE ENCODE_FOR_URI
+    ISIRI ISURI ISBLANK ISLITERAL ISNUMERIC NOW YEAR MONTH DAY HOURS MINUTES SECONDS TIMEZONE TZ
+    COALESCE IF SAMETERM STRDT STRLANG UUID STRUUID MD5 SHA1 SHA256 SHA384 SHA512
+""".split())
+START_KEYWORDS = ("SELECT", "ASK", "CONSTRUCT", "DESCRIBE", "PREFIX", "BASE")
+# Keywords that cannot end a query
+DANGLING = frozenset({"WHERE", "LIMIT", "OFFSET", "ORDER", "BY", "GROUP", "HAVING", "ASC", "DESC", "SELECT", "DISTINCT"})
+# What may follow the closed WHERE block at the top level
+MODIFIERS = frozenset({"LIMIT", "OFFSET", "ORDER", "BY", "GROUP", "HAVING", "ASC", "DESC", "VALUES", "UNDEF", "COUNT", "AS"})
+
+WORD_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-.:%?$@")
+PUNCT = frozenset("{}().;,=!<>*+/&|^")
+IRI_FORBIDDEN = frozenset(' <"{}|^`\\\n\t')
+
+VARIABLE = re.compile(r"^[?$][A-Za-z0-9_]+$")
+VARIABLE_PARTIAL = re.compile(r"^[?$][A-Za-z0-9_]*$")
+NUMBER = re.compile(r"^-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?$")
+NUMBER_PARTIAL = re.compile(r"^-?\d*(?:\.\d*)?(?:[eE][+-]?\d*)?$")
+LANG_TAG = re.compile(r"^@[A-Za-z]+(?:-[A-Za-z0-9]+)*$")
+LANG_TAG_PARTIAL = re.compile(r"^@[A-Za-z]*(?:-[A-Za-z0-9]*)*$")
+PN_LOCAL = re.compile(r"^[A-Za-z0-9_%](?:[A-Za-z0-9_\-.%]*[A-Za-z0-9_\-%])?$")
+PN_LOCAL_PARTIAL = re.compile(r"^[A-Za-z0-9_\-.%]*$")
+ENTITY_SEPARATOR = re.compile(r"[,\s]+")
+PREFIXED_IN_QUERY = re.compile(r"(?<![\w?$])([A-Za-z][\w\-]*):([A-Za-z0-9_%](?:[\w\-.%]*[\w\-%])?)")
+
+
+class SparqlVocabulary:
+    """Known local names per prefix; open prefixes accept any well-formed local name."""
+
+    def __init__(self, names: Dict[str, Iterable[str]], open_prefixes: Sequence[str] = GRAMMAR_OPEN_PREFIXES):
+        self.names = {prefix: sorted(set(local)) for prefix, local in names.items()}
+        self.open_prefixes = frozenset(open_prefixes)
+        self.prefixes = sorted(set(NAMESPACES) | set(self.names))
+
+    def __len__(self) -> int:
+        return sum(len(local) for local in self.names.values())
+
+    def with_names(self, extra: Iterable[Tuple[str, str]]) -> "SparqlVocabulary":
+        """A copy that also accepts `extra` (prefix, local) pairs, e.g. the request's entities."""
+        extra = list(extra)
+        if not extra:
+            return self
+        names = {prefix: list(local) for prefix, local in self.names.items()}
+        for prefix, local in extra:
+            names.setdefault(prefix, []).append(local)
+        return SparqlVocabulary(names, self.open_prefixes)
+
+    def is_prefix_name(self, prefix: str) -> bool:
+        return prefix in NAMESPACES or prefix in self.names
+
+    def starts_prefix_name(self, partial: str) -> bool:
+        i = bisect.bisect_left(self.prefixes, partial)
+        return i < len(self.prefixes) and self.prefixes[i].startswith(partial)
+
+    def is_name(self, prefix: str, local: str) -> bool:
+        if prefix in self.open_prefixes:
+            return bool(PN_LOCAL.match(local))
+        local_names = self.names.get(prefix, ())
+        i = bisect.bisect_left(local_names, local)
+        return i < len(local_names) and local_names[i] == local
+
+    def starts_name(self, prefix: str, partial: str) -> bool:
+        if prefix in self.open_prefixes:
+            return bool(PN_LOCAL_PARTIAL.match(partial))
+        local_names = self.names.get(prefix, ())
+        i = bisect.bisect_left(local_names, partial)
+        return i < len(local_names) and local_names[i].startswith(partial)
+
+
+def names_in_query(query: str) -> List[Tuple[str, str]]:
+    return [(prefix, local) for prefix, local in PREFIXED_IN_QUERY.findall(query) if prefix in NAMESPACES]
+
+
+def entities_from_input(input_text: str) -> List[str]:
+    """The `prefix:local` entities of a model input ("...\nentity:brick:X" or "...\nentitybrick:X")."""
+    _, marker, rest = input_text.rpartition("\nentity")
+    if not marker:
+        return []
+    rest = rest.lstrip(":").strip()
+    return [e for e in ENTITY_SEPARATOR.split(rest) if ":" in e]
+
+
+def names_in_rdf(path: str) -> Set[Tuple[str, str]]:
+    from rdflib import Graph, URIRef
+
+    by_namespace = sorted(((uri, prefix) for prefix, uri in PREFIXES), key=lambda item: -len(item[0]))
+    graph = Graph()
+    graph.parse(path)
+    found = set()
+    for triple in graph:
+        for term in triple:
+            if not isinstance(term, URIRef):
+                continue
+            for uri, prefix in by_namespace:
+                if term.startswith(uri):
+                    local = str(term)[len(uri):]
+                    if PN_LOCAL.match(local):
+                        found.add((prefix, local))
+                    break
+    return found
+
+
+def load_vocabulary(paths: Sequence[str], open_prefixes: Sequence[str] = GRAMMAR_OPEN_PREFIXES) -> SparqlVocabulary:
+    """
+    Reads `prefix:local` lines, class/relation lists (a prefix line followed by
+    its local names, like all_relations_and_classes.txt), JSON datasets, whose
+    "sparql" / "target_text" queries contribute every prefixed name they use, and
+    RDF files (.ttl / .nt / .rdf, needs rdflib), which contribute every URI in a
+    known namespace.
+    """
+    names: Dict[str, Set[str]] = {}
+    for path in paths:
+        if path.endswith((".ttl", ".nt", ".rdf", ".owl")):
+            for prefix, local in names_in_rdf(path):
+                names.setdefault(prefix, set()).add(local)
+            continue
+        if path.endswith(".json"):
+            with open(path, encoding="utf-8") as f:
+                for sample in json.load(f):
+                    for prefix, local in names_in_query(sample.get("sparql") or sample.get("target_text") or ""):
+                        names.setdefault(prefix, set()).add(local)
+            continue
+        current = None
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                word = line.strip()
+                if not word:
+                    continue
+                if ":" in word:
+                    prefix, local = word.split(":", 1)
+                    names.setdefault(prefix, set()).add(local)
+                elif word in NAMESPACES:
+                    current = word
+                elif current is not None:
+                    names.setdefault(current, set()).add(word)
+    return SparqlVocabulary(names, open_prefixes)
+
+
+class LexState:
+    """Lexer state after some prefix of the query. Never mutated once returned by advance()."""
+
+    __slots__ = ("phase", "buf", "braces", "parens", "nesting", "blocks", "prev", "started")
+
+    def __init__(self):
+        self.phase = "ws"  # ws | word | string | iri | lt
+        self.buf = ""
+        self.braces = 0
+        self.parens = 0
+        self.nesting = ""  # open "{" / "(" in order, so each closer matches the innermost
+        self.blocks = 0  # top-level { } groups closed so far
+        self.prev = ""  # last complete token (keywords upper-cased)
+        self.started = False
+
+    def copy(self) -> "LexState":
+        state = LexState.__new__(LexState)
+        for slot in LexState.__slots__:
+            setattr(state, slot, getattr(self, slot))
+        return state
+
+
+class SparqlPrefixChecker:
+    def __init__(self, vocabulary: SparqlVocabulary):
+        self.vocabulary = vocabulary
+
+    # -- words ---------------------------------------------------------------
+
+    def _word_ok(self, word: str, state: LexState) -> bool:
+        """Whether `word` is a complete, valid token at this point."""
+        if not state.started:
+            return word.upper() in START_KEYWORDS
+        if state.braces == 0 and state.blocks > 0 and state.parens == 0:
+            # After the WHERE block: solution modifiers, their numbers and variables only
+            return word.upper() in MODIFIERS or bool(NUMBER.match(word)) or bool(VARIABLE.match(word))
+        first = word[0]
+        if first in "?$":
+            return bool(VARIABLE.match(word))
+        if first == "@":
+            return state.prev == '"' and bool(LANG_TAG.match(word))
+        if first.isdigit() or (first == "-" and len(word) > 1):
+            return bool(NUMBER.match(word))
+        if word == "-":
+            return True
+        if ":" in word:
+            prefix, local = word.split(":", 1)
+            if state.prev == "PREFIX":
+                return local == "" and bool(re.match(r"^[A-Za-z][\w\-]*$|^$", prefix))
+            return self.vocabulary.is_prefix_name(prefix) and self.vocabulary.is_name(prefix, local)
+        return word == "a" or word.upper() in KEYWORDS
+
+    def _word_partial_ok(self, word: str, state: LexState) -> bool:
+        """Whether `word` can still grow into a valid token."""
+        upper = word.upper()
+        if not state.started:
+            return any(k.startswith(upper) for k in START_KEYWORDS)
+        first = word[0]
+        if first in "?$":
+            return bool(VARIABLE_PARTIAL.match(word))
+        if first == "@":
+            return state.prev == '"' and bool(LANG_TAG_PARTIAL.match(word))
+        if first.isdigit() or first == "-":
+            return bool(NUMBER_PARTIAL.match(word))
+        if ":" in word:
+            prefix, local = word.split(":", 1)
+            if state.prev == "PREFIX":
+                return local == ""
+            return self.vocabulary.is_prefix_name(prefix) and self.vocabulary.starts_name(prefix, local)
+        return (
+            any(k.startswith(upper) for k in KEYWORDS)
+            or "a".startswith(word)
+            or self.vocabulary.starts_prefix_name(word)
+        )
+
+    def _buffer_ok(self, state: LexState) -> bool:
+        """A word being lexed is fine if it can still grow, or is a complete word followed by dots."""
+        word = state.buf
+        if self._word_partial_ok(word, state):
+            return True
+        stripped = word.rstrip(".")
+        return stripped != word and bool(stripped) and self._word_ok(stripped, state)
+
+    def _end_word(self, state: LexState) -> bool:
+        word = state.buf
+        state.buf = ""
+        state.phase = "ws"
+        # Local names may contain dots but not end with one: trailing dots are triple terminators
+        stripped = word.rstrip(".")
+        if stripped and not self._word_ok(stripped, state):
+            return False
+        if stripped:
+            state.prev = stripped.upper() if stripped.upper() in KEYWORDS else stripped
+            state.started = True
+        if len(stripped) < len(word):
+            return self._punct(".", state)
+        return True
+
+    # -- punctuation ---------------------------------------------------------
+
+    def _punct(self, ch: str, state: LexState) -> bool:
+        if not state.started:
+            return False
+        if ch == "{":
+            if state.braces == 0 and state.blocks > 0 and state.prev not in ("WHERE", "VALUES"):
+                return False
+            state.braces += 1
+            state.nesting += ch
+        elif ch == "}":
+            # Groups may nest in parentheses, e.g. FILTER(EXISTS { ... })
+            if not state.nesting.endswith("{"):
+                return False
+            state.braces -= 1
+            state.nesting = state.nesting[:-1]
+            if state.braces == 0:
+                state.blocks += 1
+        elif ch == "(":
+            state.parens += 1
+            state.nesting += ch
+        elif ch == ")":
+            if not state.nesting.endswith("("):
+                return False
+            state.parens -= 1
+            state.nesting = state.nesting[:-1]
+        elif ch in ".;," and state.braces == 0 and state.parens == 0:
+            return False
+        state.prev = ch
+        return True
+
+    # -- driver --------------------------------------------------------------
+
+    def advance(self, state: LexState, text: str) -> Optional[LexState]:
+        """The state after `text`, or None if `text` makes the query invalid."""
+        state = state.copy()
+        for ch in text:
+            phase = state.phase
+            if phase == "string":
+                state.buf += ch
+                if ch == "\n":
+                    return None
+                if ch == state.buf[0] and not _escaped(state.buf):
+                    state.phase, state.buf, state.prev = "ws", "", '"'
+                continue
+            if phase == "iri":
+                if ch == ">":
+                    state.phase, state.buf, state.prev = "ws", "", "<iri>"
+                elif ch in IRI_FORBIDDEN:
+                    return None
+                else:
+                    state.buf += ch
+                continue
+            if phase == "lt":
+                # `<` starts an IRI unless it is a comparison operator
+                state.phase = "ws"
+                if ch not in " =?$(-0123456789" and ch not in IRI_FORBIDDEN and ch != ">":
+                    state.phase, state.buf = "iri", ch
+                    continue
+                if not self._punct("<", state):
+                    return None
+                phase = "ws"
+            if phase == "word":
+                if ch in WORD_CHARS and not (ch in "?$@" and state.buf):
+                    state.buf += ch
+                    if not self._buffer_ok(state):
+                        return None
+                    continue
+                if not self._end_word(state):
+                    return None
+            # Between tokens
+            if ch.isspace():
+                continue
+            if ch in "\"'":
+                if not state.started:
+                    return None
+                state.phase, state.buf = "string", ch
+            elif ch == "<":
+                state.phase = "lt"
+            elif ch in WORD_CHARS and ch != ".":
+                state.phase, state.buf = "word", ch
+                if not self._word_partial_ok(ch, state):
+                    return None
+            elif ch in PUNCT or ch == ".":
+                if not self._punct(ch, state):
+                    return None
+            else:
+                return None
+        return state
+
+    def is_complete(self, state: LexState) -> bool:
+        """Whether the query may end here."""
+        if state.phase in ("string", "iri"):
+            return False
+        if state.phase == "lt":
+            return False
+        if state.phase == "word":
+            state = state.copy()
+            if not self._end_word(state):
+                return False
+        return (
+            state.started
+            and state.braces == 0
+            and state.parens == 0
+            and state.blocks > 0
+            and state.prev not in DANGLING
+        )
+
+    def is_valid_prefix(self, text: str) -> bool:
+        return self.advance(LexState(), text) is not None
+
+    def is_valid(self, text: str) -> bool:
+        state = self.advance(LexState(), text)
+        return state is not None and self.is_complete(state)
+
+
+def _escaped(buf: str) -> bool:
+    """Whether the last character of a string buffer is backslash-escaped."""
+    backslashes = len(buf) - 1 - len(buf[:-1].rstrip("\\"))
+    return backslashes % 2 == 1
+
+
+try:
+    import torch
+    from transformers import LogitsProcessor
+except ImportError:  # the vocabulary tools do not need torch
+    torch = None
+    LogitsProcessor = object
+
+
+class SparqlGrammarLogitsProcessor(LogitsProcessor):
+    """
+    Masks every token except the grammar-valid ones among each beam's `top_k`
+    best candidates. One instance serves one generate() call, with either one
+    vocabulary for every input or one per input (beam row r belongs to input
+    r // num_beams).
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        vocabulary: Union[SparqlVocabulary, Sequence[SparqlVocabulary]],
+        top_k: int = GRAMMAR_TOP_K,
+        num_beams: int = 1,
+    ):
+        vocabularies = [vocabulary] if isinstance(vocabulary, SparqlVocabulary) else list(vocabulary)
+        # Inputs with the same vocabulary share a checker and its cached lexer states
+        shared: Dict[int, int] = {}
+        self.checkers: List[SparqlPrefixChecker] = []
+        self._states: List[Dict[Tuple[int, ...], Optional[LexState]]] = []
+        self._input_checker: List[int] = []
+        for vocab in vocabularies:
+            if id(vocab) not in shared:
+                shared[id(vocab)] = len(self.checkers)
+                self.checkers.append(SparqlPrefixChecker(vocab))
+                self._states.append({(): LexState()})
+            self._input_checker.append(shared[id(vocab)])
+        self.num_beams = num_beams
+        self.top_k = top_k
+        self.eos_token_id = tokenizer.eos_token_id
+        self.pieces = _piece_texts(tokenizer)
+        self.special_ids = frozenset(tokenizer.all_special_ids)
+        self.decoder_start_token_id = tokenizer.pad_token_id
+        self.steps = 0
+        self.unconstrained_steps = 0
+
+    def _state(self, index: int, ids: Tuple[int, ...]) -> Optional[LexState]:
+        states = self._states[index]
+        state = states.get(ids)
+        if state is None and ids not in states:
+            parent = self._state(index, ids[:-1])
+            state = None if parent is None else self.checkers[index].advance(parent, self.pieces[ids[-1]])
+            states[ids] = state
+        return state
+
+    def __call__(self, input_ids, scores):
+        k = min(self.top_k, scores.shape[-1])
+        candidates = torch.topk(scores, k, dim=-1).indices.tolist()
+        mask = torch.full_like(scores, float("-inf"))
+        for row, row_ids in enumerate(input_ids.tolist()):
+            self.steps += 1
+            if row_ids and row_ids[0] == self.decoder_start_token_id:
+                row_ids = row_ids[1:]
+            index = self._input_checker[min(row // self.num_beams, len(self._input_checker) - 1)]
+            checker = self.checkers[index]
+            state = self._state(index, tuple(row_ids))
+            allowed = []
+            if state is not None:
+                for token_id in candidates[row]:
+                    if token_id == self.eos_token_id:
+                        if checker.is_complete(state):
+                            allowed.append(token_id)
+                    elif token_id not in self.special_ids:
+                        next_state = checker.advance(state, self.pieces[token_id])
+                        if next_state is not None:
+                            self._states[index][tuple(row_ids) + (token_id,)] = next_state
+                            allowed.append(token_id)
+            if allowed:
+                mask[row, allowed] = 0
+            else:
+                self.unconstrained_steps += 1
+                mask[row] = 0
+        return scores + mask
+
+
+_piece_cache: Dict[int, List[str]] = {}
+
+
+def _piece_texts(tokenizer) -> List[str]:
+    """Text of every token id, with sentencepiece's word marker turned back into a space."""
+    key = id(tokenizer)
+    if key not in _piece_cache:
+        pieces = tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))
+        _piece_cache[key] = [(piece or "").replace("▁", " ") for piece in pieces]
+    return _piece_cache[key]
+
+
+_vocabulary: Optional[SparqlVocabulary] = None
+
+
+def get_vocabulary() -> SparqlVocabulary:
+    """The vocabulary from GRAMMAR_VOCABULARY (comma-separated paths), loaded once."""
+    global _vocabulary
+    if _vocabulary is None:
+        paths = [p for p in GRAMMAR_VOCABULARY.split(",") if p]
+        _vocabulary = load_vocabulary(paths)
+        logger.info(f"Loaded SPARQL grammar vocabulary: {len(_vocabulary)} names from {', '.join(paths)}")
+    return _vocabulary
+
+
+def _entity_names(entities: Iterable[str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted({tuple(e.split(":", 1)) for e in entities if ":" in e}))
+
+
+def grammar_processor(tokenizer, entities: Iterable[str] = ()) -> SparqlGrammarLogitsProcessor:
+    """A processor for one generate() call, also accepting the given `prefix:local` entities."""
+    return SparqlGrammarLogitsProcessor(tokenizer, get_vocabulary().with_names(_entity_names(entities)))
+
+
+def batch_grammar_processor(
+    tokenizer, entities: Sequence[Iterable[str]], num_beams: int
+) -> SparqlGrammarLogitsProcessor:
+    """
+    A processor for one batched generate() call: input i also accepts the
+    `prefix:local` names in entities[i], and only those.
+    """
+    base = get_vocabulary()
+    vocabularies: Dict[Tuple[Tuple[str, str], ...], SparqlVocabulary] = {}
+    per_input = []
+    for input_entities in entities:
+        names = _entity_names(input_entities)
+        if names not in vocabularies:
+            vocabularies[names] = base.with_names(names)
+        per_input.append(vocabularies[names])
+    return SparqlGrammarLogitsProcessor(tokenizer, per_input, num_beams=num_beams)
+
+
+def build_vocabulary_file(sources: Sequence[str], output: str) -> int:
+    vocabulary = load_vocabulary(sources, open_prefixes=())
+    with open(output, "w", encoding="utf-8") as f:
+        for prefix in sorted(vocabulary.names):
+            if prefix in GRAMMAR_OPEN_PREFIXES:
+                continue
+            for local in vocabulary.names[prefix]:
+                f.write(f"{prefix}:{local}\n")
+    return len(vocabulary)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="SPARQL grammar tools for constrained decoding")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build-vocab", help="Build the prefix:local vocabulary file")
+    build.add_argument(
+        "sources", nargs="*", default=DEFAULT_VOCABULARY_SOURCES,
+        help="Class/relation lists, prefix:local files, JSON datasets or RDF files (globs allowed)",
+    )
+    build.add_argument("-o", "--output", default="sparql_vocabulary.txt")
+    check = sub.add_parser("check", help="Check queries (one per line on stdin) against the grammar")
+    check.add_argument("--vocabulary", default=GRAMMAR_VOCABULARY)
+    args = parser.parse_args(argv)
+
+    if args.command == "build-vocab":
+        sources = [path for pattern in args.sources for path in sorted(glob.glob(pattern)) or [pattern]]
+        count = build_vocabulary_file(sources, args.output)
+        print(f"Wrote {args.output} ({count} names, open prefixes excluded)")
+        return 0
+    checker = SparqlPrefixChecker(load_vocabulary(args.vocabulary.split(",")))
+    invalid = 0
+    for line in sys.stdin:
+        query = line.strip()
+        if query and not checker.is_valid(query):
+            invalid += 1
+            print(f"INVALID: {query}")
+    return 1 if invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
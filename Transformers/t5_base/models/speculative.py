@@ -0,0 +1,194 @@
+"""
+Speculative (assisted) decoding for the NL2SPARQL model.
+
+A small draft model trained on the same task (see distill_draft.py) proposes up
+to SPECULATIVE_NUM_TOKENS tokens at a time, and checkpoint-2 checks all of them
+in a single decoder pass. It keeps the longest prefix that matches its own
+greedy choice, plus its own next token. The result is token-for-token the target
+model's greedy decoding, whatever the draft proposes. It is not the 5-beam
+output of the default mode, so switching to DECODING_MODE=speculative changes
+translations wherever greedy and beam search disagree.
+
+The loop is transformers' assisted generation (`generate(assistant_model=...)`),
+which handles both models' KV caches; it decodes one input at a time, greedily.
+Acceptance is measured by counting decoder passes with forward hooks:
+
+    tokens      generated tokens
+    passes      target decoder passes (each yields its accepted draft tokens + 1)
+    proposed    draft decoder passes (one proposed token each)
+    accepted    tokens - passes
+    acceptance  accepted / proposed
+
+Compare with plain greedy decoding of the target on CPU:
+
+    python speculative.py measure --draft ./draft-t5-small --data ../val_data_April.json --limit 100
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import torch
+
+SPECULATIVE_DRAFT_MODEL = os.getenv("SPECULATIVE_DRAFT_MODEL", "")
+SPECULATIVE_NUM_TOKENS = int(os.getenv("SPECULATIVE_NUM_TOKENS", "5"))
+
+
+class PassCounter:
+    """Counts forward calls of a module (here: a decoder stack, one call per decoding pass)."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, module, inputs, output) -> None:
+        self.calls += 1
+
+
+@contextmanager
+def counting_passes(*models) -> Iterator[List[PassCounter]]:
+    counters = [PassCounter() for _ in models]
+    handles = [model.get_decoder().register_forward_hook(counter) for model, counter in zip(models, counters)]
+    try:
+        yield counters
+    finally:
+        for handle in handles:
+            handle.remove()
+
+
+class SpeculativeStats:
+    def __init__(self):
+        self.calls = 0
+        self.tokens = 0
+        self.passes = 0
+        self.proposed = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, tokens: int, passes: int, proposed: int, seconds: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.tokens += tokens
+            self.passes += passes
+            self.proposed += proposed
+            self.seconds += seconds
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            accepted = max(0, self.tokens - self.passes)
+            return {
+                "calls": self.calls,
+                "tokens": self.tokens,
+                "acceptance_rate": round(accepted / self.proposed, 3) if self.proposed else 0.0,
+                "tokens_per_target_pass": round(self.tokens / self.passes, 2) if self.passes else 0.0,
+                "tokens_per_second": round(self.tokens / self.seconds, 1) if self.seconds else 0.0,
+            }
+
+
+def load_draft_model(path: str, device, num_tokens: int = SPECULATIVE_NUM_TOKENS):
+    from startup import load_pytorch_model
+
+    draft = load_pytorch_model(path, device)
+    draft.generation_config.num_assistant_tokens = num_tokens
+    # A fixed window; the adaptive schedule would make acceptance numbers hard to compare
+    draft.generation_config.num_assistant_tokens_schedule = "constant"
+    return draft
+
+
+def check_compatible(model, draft) -> None:
+    """The draft must share the target's vocabulary, or its proposals cannot be verified."""
+    if model.config.vocab_size != draft.config.vocab_size:
+        raise ValueError(
+            f"Draft vocabulary ({draft.config.vocab_size}) differs from the model's ({model.config.vocab_size})"
+        )
+
+
+def speculative_generate(
+    model, draft, tokenizer, text: str, device, stats: Optional[SpeculativeStats] = None, max_length: int = 150
+) -> str:
+    """Greedy translation of one input, drafted by `draft` and verified by `model`."""
+    input_ids = tokenizer.encode(text, return_tensors="pt", truncation=True, max_length=512).to(device)
+    start = time.perf_counter()
+    with counting_passes(model, draft) as (target_passes, draft_passes), torch.no_grad():
+        output = model.generate(
+            input_ids, assistant_model=draft, do_sample=False, num_beams=1, max_length=max_length
+        )
+    if stats is not None:
+        # Output starts with the decoder start token, which is not generated
+        stats.add(output.shape[-1] - 1, target_passes.calls, draft_passes.calls, time.perf_counter() - start)
+    return tokenizer.decode(output[0], skip_special_tokens=True)
+
+
+def greedy_generate(model, tokenizer, text: str, device, max_length: int = 150) -> Tuple[str, int]:
+    input_ids = tokenizer.encode(text, return_tensors="pt", truncation=True, max_length=512).to(device)
+    with torch.no_grad():
+        output = model.generate(input_ids, do_sample=False, num_beams=1, max_length=max_length)
+    return tokenizer.decode(output[0], skip_special_tokens=True), output.shape[-1] - 1
+
+
+def measure(model_path: str, draft_path: str, data_path: str, limit: int, num_tokens: int, seed: int) -> int:
+    """Greedy vs speculative decoding on validation inputs: identical outputs, acceptance, tokens/s."""
+    from transformers import T5Tokenizer
+    from startup import load_pytorch_model
+
+    device = torch.device("cpu")
+    with open(data_path, encoding="utf-8") as f:
+        samples = json.load(f)
+    random.Random(seed).shuffle(samples)
+    texts = [sample["input_text"] for sample in samples[:limit]]
+
+    tokenizer = T5Tokenizer.from_pretrained(model_path)
+    model = load_pytorch_model(model_path, device)
+    draft = load_draft_model(draft_path, device, num_tokens)
+    check_compatible(model, draft)
+
+    # One untimed run of each path, so lazy initialisation is not measured
+    if texts:
+        greedy_generate(model, tokenizer, texts[0], device)
+        speculative_generate(model, draft, tokenizer, texts[0], device)
+
+    greedy_tokens, start = 0, time.perf_counter()
+    greedy_out = []
+    for text in texts:
+        output, tokens = greedy_generate(model, tokenizer, text, device)
+        greedy_out.append(output)
+        greedy_tokens += tokens
+    greedy_seconds = time.perf_counter() - start
+
+    stats = SpeculativeStats()
+    speculative_out = [speculative_generate(model, draft, tokenizer, text, device, stats) for text in texts]
+    summary = stats.summary()
+
+    identical = sum(a == b for a, b in zip(greedy_out, speculative_out))
+    greedy_tps = greedy_tokens / greedy_seconds if greedy_seconds else 0.0
+    speedup = summary["tokens_per_second"] / greedy_tps if greedy_tps else 0.0
+    print(f"Samples:                {len(texts)} from {data_path}")
+    print(f"Identical to greedy:    {identical}/{len(texts)}")
+    print(f"Acceptance rate:        {summary['acceptance_rate']:.1%} ({num_tokens} draft tokens per step)")
+    print(f"Tokens per target pass: {summary['tokens_per_target_pass']:.2f}")
+    print(f"Greedy:                 {greedy_tps:.1f} tokens/s")
+    print(f"Speculative:            {summary['tokens_per_second']:.1f} tokens/s ({speedup:.2f}x)")
+    return 0 if identical == len(texts) else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Speculative decoding tools for the NL2SPARQL model")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser("measure", help="Compare speculative and greedy decoding on validation data")
+    check.add_argument("--model", default="./checkpoint-2")
+    check.add_argument("--draft", default=SPECULATIVE_DRAFT_MODEL or "./draft-t5-small")
+    check.add_argument("--data", default="../val_data_April.json")
+    check.add_argument("--limit", type=int, default=100)
+    check.add_argument("--num-tokens", type=int, default=SPECULATIVE_NUM_TOKENS)
+    check.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    torch.set_grad_enabled(False)
+    return measure(args.model, args.draft, args.data, args.limit, args.num_tokens, args.seed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Startup of the NL2SPARQL service.
+
+Startup moves the service through the readiness states
+
+    starting -> loading -> warming -> ready        (or -> failed)
+
+and logs how long each phase took. With STARTUP_BACKGROUND=1 (the default)
+loading and warm-up run in a background thread, so the port is bound at once and
+/readyz answers "loading" / "warming" until the model can serve; this is how the
+development server and gunicorn workers without preloading (WEB_PRELOAD=0) start.
+Under gunicorn with preloading (the production default) the master binds the
+port first, then loads the weights synchronously in when_ready before forking,
+so the workers share them; each worker then warms up in the background. Nothing
+answers HTTP until the fork, so in that mode the starting and loading phases are
+only visible in the logs: connections wait in the listen backlog, and /readyz
+starts at "warming". Deployments that need /readyz to report "loading" run with
+WEB_PRELOAD=0. See gunicorn.conf.py for what is reachable during each phase.
+
+Warm-up runs STARTUP_WARMUP_GENERATIONS generations on sample questions, so the
+first real request does not pay for lazy kernel selection and allocator growth.
+
+PyTorch weights are read from model.safetensors, which is memory-mapped rather
+than unpickled; with STARTUP_CONVERT_SAFETENSORS=1 a checkpoint that only has
+pytorch_model.bin is converted once (next to it) on first start.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+STARTUP_BACKGROUND = os.getenv("STARTUP_BACKGROUND", "1") == "1"
+STARTUP_WARMUP_GENERATIONS = int(os.getenv("STARTUP_WARMUP_GENERATIONS", "2"))
+STARTUP_CONVERT_SAFETENSORS = os.getenv("STARTUP_CONVERT_SAFETENSORS", "1") == "1"
+# Set by gunicorn.conf.py when preloading: load in the master after binding (when_ready), warm up in each worker
+STARTUP_WARMUP_IN_WORKERS = os.getenv("STARTUP_WARMUP_IN_WORKERS", "0") == "1"
+
+SAFETENSORS_FILE = "model.safetensors"
+PYTORCH_FILE = "pytorch_model.bin"
+
+# (question, entity) pairs used for warm-up, covering the common query shapes
+WARMUP_PAIRS = [
+    ("What is the timeseries ID of the CO2 sensor in room 5.01?", "bldg:CO2_Level_Sensor_5.01"),
+    ("Where is the air quality sensor airq5.01 located?", "bldg:airq5.01"),
+    ("What type of sensor is the zone air temperature sensor in 5.02?", "bldg:Zone_Air_Temperature_Sensor_5.02"),
+    ("Retrieve the label of the Steam System.", "brick:Steam_System"),
+]
+
+
+class NotReady(RuntimeError):
+    """The model is still loading or warming up."""
+
+
+class Startup:
+    def __init__(self):
+        self.state = "starting"
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self._started = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        self.state = name
+        start = time.perf_counter()
+        logger.info(f"Startup phase '{name}' started")
+        yield
+        self.timings[name] = round(time.perf_counter() - start, 3)
+        logger.info(f"Startup phase '{name}' finished in {self.timings[name]:.2f}s")
+
+    def run(self, load: Optional[Callable[[], None]], warm: Optional[Callable[[], None]], finish: bool = True) -> None:
+        """Runs the loading and warm-up phases; `finish=False` leaves the state at "loaded"."""
+        try:
+            if load is not None:
+                with self.phase("loading"):
+                    load()
+            if warm is not None:
+                with self.phase("warming"):
+                    warm()
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.exception(f"Startup failed: {e}")
+            return
+        if finish:
+            self.state = "ready"
+            self.timings["total"] = round(time.monotonic() - self._started, 3)
+            logger.info(f"Ready after {self.timings['total']:.2f}s ({self.timings})")
+        else:
+            self.state = "loaded"
+
+    def start(self, load: Optional[Callable[[], None]], warm: Optional[Callable[[], None]], background: bool = STARTUP_BACKGROUND) -> None:
+        if not background:
+            self.run(load, warm)
+            return
+        self._thread = threading.Thread(target=self.run, args=(load, warm), name="startup", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until a background startup has finished; returns whether the model is ready."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    def status(self) -> Dict[str, Any]:
+        status: Dict[str, Any] = {"state": self.state, "timings": dict(self.timings)}
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+def ensure_safetensors(model_path: str) -> bool:
+    """
+    Whether `model_path` has a safetensors checkpoint, converting pytorch_model.bin
+    into one first if allowed. The conversion is skipped (with a warning) if the
+    directory is read-only.
+    """
+    if os.path.isfile(os.path.join(model_path, SAFETENSORS_FILE)):
+        return True
+    bin_path = os.path.join(model_path, PYTORCH_FILE)
+    if not STARTUP_CONVERT_SAFETENSORS or not os.path.isfile(bin_path):
+        return False
+    try:
+        import torch
+        from safetensors.torch import save_file
+
+        start = time.perf_counter()
+        state_dict = torch.load(bin_path, map_location="cpu")
+        # T5 ties its embeddings (and LM head); safetensors refuses shared storage, so
+        # keep one name per tensor and let from_pretrained re-tie the others
+        seen = set()
+        for name, tensor in list(state_dict.items()):
+            key = (tensor.data_ptr(), tuple(tensor.shape))
+            if key in seen:
+                del state_dict[name]
+            seen.add(key)
+        tmp_path = os.path.join(model_path, f".{SAFETENSORS_FILE}.{os.getpid()}.tmp")
+        save_file({k: v.contiguous() for k, v in state_dict.items()}, tmp_path, metadata={"format": "pt"})
+        os.replace(tmp_path, os.path.join(model_path, SAFETENSORS_FILE))
+        logger.info(f"Converted {bin_path} to {SAFETENSORS_FILE} in {time.perf_counter() - start:.1f}s")
+        return True
+    except OSError as e:
+        logger.warning(f"Could not write {SAFETENSORS_FILE} next to {bin_path}, loading the pickle: {e}")
+        return False
+
+
+def load_pytorch_model(model_path: str, device):
+    """
+    T5 from the memory-mapped safetensors checkpoint, built without the usual
+    random initialisation (low_cpu_mem_usage) before the weights are filled in.
+    """
+    from transformers import T5ForConditionalGeneration
+
+    use_safetensors = ensure_safetensors(model_path)
+    model = T5ForConditionalGeneration.from_pretrained(
+        model_path, low_cpu_mem_usage=True, use_safetensors=use_safetensors or None
+    )
+    return model.to(device).eval()
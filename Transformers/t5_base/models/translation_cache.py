@@ -0,0 +1,199 @@
+"""
+Cache of NL2SPARQL translations.
+
+Keys are the normalised question (Unicode NFC, whitespace collapsed; case is kept
+because the model copies names from the question) plus the sorted list of
+entities, so "a, b" and "b,a" hit the same entry. At most TRANSLATION_CACHE_SIZE
+entries are kept, least recently used first out.
+
+Entries belong to one checkpoint and backend: the fingerprint of the files at
+`model_path` (names, sizes, mtimes) plus the serving `variant` is re-checked at
+most every TRANSLATION_CACHE_CHECK_INTERVAL seconds and the cache is flushed
+when it changes. Files the service derives from the checkpoint itself (the
+model.safetensors converted from pytorch_model.bin, ONNX exports, temp files)
+are not part of the fingerprint, so creating them does not discard the cache.
+
+With TRANSLATION_CACHE_PATH set, the cache is loaded from that JSON file on
+start (if it was written for the same checkpoint) and saved back every
+TRANSLATION_CACHE_SAVE_EVERY new entries and at exit.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from startup import PYTORCH_FILE, SAFETENSORS_FILE
+
+logger = logging.getLogger(__name__)
+
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "10000"))
+TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", "")
+TRANSLATION_CACHE_SAVE_EVERY = int(os.getenv("TRANSLATION_CACHE_SAVE_EVERY", "100"))
+TRANSLATION_CACHE_CHECK_INTERVAL = float(os.getenv("TRANSLATION_CACHE_CHECK_INTERVAL", "30"))
+
+WHITESPACE = re.compile(r"\s+")
+ENTITY_SEPARATOR = re.compile(r"[,\s]+")
+# ONNX exports (onnx_backend.py) made inside a checkpoint directory are derived from it
+ONNX_DIR_SUFFIX = "-onnx"
+
+CacheKey = Tuple[str, Tuple[str, ...]]
+
+
+def cache_key(question: str, entity: str) -> CacheKey:
+    question = WHITESPACE.sub(" ", unicodedata.normalize("NFC", question)).strip()
+    entities = tuple(sorted(e for e in ENTITY_SEPARATOR.split(entity.strip()) if e))
+    return question, entities
+
+
+def checkpoint_fingerprint(model_path: str) -> str:
+    """Names, sizes and mtimes of the checkpoint files; changes whenever the checkpoint is replaced."""
+    if os.path.isfile(model_path):
+        paths = [model_path]
+    else:
+        paths = []
+        for root, dirs, files in os.walk(model_path):
+            dirs[:] = [name for name in dirs if not name.endswith(ONNX_DIR_SUFFIX)]
+            derived = {SAFETENSORS_FILE} if PYTORCH_FILE in files else set()
+            paths.extend(
+                os.path.join(root, name) for name in files if name not in derived and not name.startswith(".")
+            )
+    parts = []
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        parts.append(f"{os.path.relpath(path, model_path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return "|".join(parts)
+
+
+class TranslationCache:
+    def __init__(
+        self,
+        model_path: str,
+        variant: str = "",
+        max_entries: int = TRANSLATION_CACHE_SIZE,
+        path: str = TRANSLATION_CACHE_PATH,
+        save_every: int = TRANSLATION_CACHE_SAVE_EVERY,
+        check_interval: float = TRANSLATION_CACHE_CHECK_INTERVAL,
+    ):
+        self.model_path = model_path
+        self.variant = variant
+        self.max_entries = max_entries
+        self.path = path
+        self.save_every = save_every
+        self.check_interval = check_interval
+        self._entries: "OrderedDict[CacheKey, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = self._current_fingerprint()
+        self._next_check = time.monotonic() + check_interval
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def _current_fingerprint(self) -> str:
+        return f"{self.variant}|{checkpoint_fingerprint(self.model_path)}"
+
+    def _check_checkpoint(self) -> None:
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        fingerprint = self._current_fingerprint()
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                logger.info(f"Checkpoint at {self.model_path} changed; flushing {len(self._entries)} cached translations")
+                self._entries.clear()
+                self._fingerprint = fingerprint
+                self._unsaved = 0
+                self.flushes += 1
+
+    def get(self, question: str, entity: str) -> Optional[str]:
+        self._check_checkpoint()
+        key = cache_key(question, entity)
+        with self._lock:
+            sparql = self._entries.get(key)
+            if sparql is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return sparql
+
+    def put(self, question: str, entity: str, sparql: str) -> None:
+        key = cache_key(question, entity)
+        with self._lock:
+            self._entries[key] = sparql
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            save = self.path and self._unsaved >= self.save_every
+        if save:
+            self.save()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._unsaved = 0
+
+    def load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read translation cache {self.path}: {e}")
+            return
+        if data.get("checkpoint") != self._fingerprint:
+            logger.info(f"Translation cache {self.path} was written for another checkpoint; ignoring it")
+            return
+        with self._lock:
+            for question, entities, sparql in data.get("entries", [])[-self.max_entries:]:
+                self._entries[(question, tuple(entities))] = sparql
+        logger.info(f"Loaded {len(self._entries)} cached translations from {self.path}")
+
+    def save(self) -> None:
+        """Writes the cache to `path` (atomically, so concurrent workers never see a partial file)."""
+        if not self.path:
+            return
+        with self._lock:
+            data = {
+                "checkpoint": self._fingerprint,
+                "entries": [[question, list(entities), sparql] for (question, entities), sparql in self._entries.items()],
+            }
+            self._unsaved = 0
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save translation cache to {self.path}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "flushes": self.flushes,
+                "persistent": bool(self.path),
+            }
@@ -0,0 +1,300 @@
+"""
+Loads Brick TTL models from this folder into the Fuseki triple store.
+
+Files are parsed in parallel (one process per file), merged and de-duplicated as
+N-Triples lines, then pushed through the SPARQL Graph Store protocol in large
+batches, or written out for an offline TDB2 build.
+
+Modes:
+    replace  PUT the first batch (replacing the graph), POST the rest        (default)
+    append   POST every batch, keeping what is already in the graph
+    diff     fetch the loaded graph, and send only the changed triples as
+             DELETE DATA / INSERT DATA updates
+    tdb2     write the merged N-Triples and run tdb2.tdbloader on them
+
+Every load also stores a version triple, <urn:brickbot:dataset> dcterms:modified
+<load time>, with the data; the Rasa action server's SPARQL result cache
+(rasa-ui/actions/sparql_cache.py) watches it to know when to drop its results.
+
+Blank nodes get new labels on every parse and in the store, so they cannot be
+matched triple by triple. In diff mode the blank-node part of both sides is
+compared in canonical form; if it changed, the graph is fully replaced instead.
+
+Examples:
+    python load_models.py abacws-building-v7.ttl brick1.4_schema/Brick.ttl
+    python load_models.py abacws-building-v7.ttl --mode diff
+    python load_models.py brick_models_ttl/*.ttl --graph http://abacwsbuilding.cardiff.ac.uk/models
+    python load_models.py abacws-building-v7.ttl --mode tdb2 --tdb2-location ./tdb2-abacws
+"""
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+import requests
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.compare import to_canonical_graph
+from rdflib.exceptions import ParserError
+from rdflib.namespace import XSD
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger("load_models")
+
+DEFAULT_ENDPOINT = os.getenv("FUSEKI_DATASET_URL", "http://localhost:3030/abacws-sensor-network")
+NTRIPLES = "application/n-triples"
+# Read by rasa-ui/actions/sparql_cache.py; keep the two in sync
+DATASET_VERSION_SUBJECT = URIRef("urn:brickbot:dataset")
+DATASET_VERSION_PREDICATE = URIRef("http://purl.org/dc/terms/modified")
+NT_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r"})
+
+
+def nt_term(term) -> str:
+    """
+    A term in N-Triples syntax. Node.n3() writes literals containing line breaks
+    as Turtle triple-quoted strings, which N-Triples parsers, Fuseki's included,
+    reject.
+    """
+    if isinstance(term, Literal):
+        text = '"' + str(term).translate(NT_ESCAPES) + '"'
+        if term.language:
+            return f"{text}@{term.language}"
+        if term.datatype:
+            return f"{text}^^<{term.datatype}>"
+        return text
+    return term.n3()
+
+
+def triple_lines(graph: Graph) -> Tuple[List[str], List[str]]:
+    """
+    N-Triples lines of a graph, split into ground triples and triples with a
+    blank node. Both the files and the store's copy go through this, so equal
+    triples always produce identical lines.
+    """
+    ground, with_bnodes = [], []
+    for s, p, o in graph:
+        line = f"{nt_term(s)} {nt_term(p)} {nt_term(o)} ."
+        (with_bnodes if isinstance(s, BNode) or isinstance(o, BNode) else ground).append(line)
+    return ground, with_bnodes
+
+
+def version_line() -> str:
+    """The dataset version triple for a load happening now."""
+    stamp = Literal(datetime.now(timezone.utc).isoformat(timespec="microseconds"), datatype=XSD.dateTime)
+    return f"{nt_term(DATASET_VERSION_SUBJECT)} {nt_term(DATASET_VERSION_PREDICATE)} {nt_term(stamp)} ."
+
+
+def parse_file(path: str) -> Tuple[str, List[str], List[str], float]:
+    """
+    Parses one RDF file into N-Triples lines.
+
+    Returns (path, ground lines, lines containing blank nodes, seconds taken).
+    The lines are parsed back as N-Triples, so a term that does not serialise
+    cleanly fails here (ParserError) rather than in Fuseki or tdb2.tdbloader.
+    Runs in a worker process.
+    """
+    start = time.perf_counter()
+    graph = Graph()
+    graph.parse(path)
+    ground, with_bnodes = triple_lines(graph)
+    check = Graph()
+    check.parse(data="\n".join(ground + with_bnodes), format="nt")
+    if len(check) != len(graph):
+        raise ParserError(f"{path}: {len(graph)} triples, but {len(check)} after an N-Triples round trip")
+    return path, ground, with_bnodes, time.perf_counter() - start
+
+
+def parse_all(paths: List[str], workers: int) -> Tuple[Set[str], List[str]]:
+    """Parses every file in parallel; returns the de-duplicated ground lines and the blank-node lines."""
+    ground: Set[str] = set()
+    with_bnodes: List[str] = []
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, file_ground, file_bnodes, seconds in pool.map(parse_file, paths):
+            total += len(file_ground) + len(file_bnodes)
+            ground.update(file_ground)
+            with_bnodes.extend(file_bnodes)
+            logger.info(f"Parsed {path}: {len(file_ground) + len(file_bnodes)} triples in {seconds:.1f}s")
+    logger.info(f"{total} triples parsed, {len(ground) + len(with_bnodes)} after de-duplication")
+    return ground, with_bnodes
+
+
+def bnode_fingerprint(lines: Iterable[str]) -> str:
+    """Hash of the blank-node triples in canonical form (independent of blank node labels)."""
+    graph = Graph()
+    graph.parse(data="\n".join(lines), format="nt")
+    canonical = sorted(to_canonical_graph(graph).serialize(format="nt").splitlines())
+    return hashlib.sha256("\n".join(line for line in canonical if line.strip()).encode("utf-8")).hexdigest()
+
+
+def batches(lines: Iterable[str], size: int) -> Iterator[List[str]]:
+    batch: List[str] = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class GraphStore:
+    def __init__(self, dataset_url: str, graph: Optional[str], auth: Optional[Tuple[str, str]], timeout: float):
+        self.dataset_url = dataset_url.rstrip("/")
+        self.graph = graph
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.timeout = timeout
+
+    @property
+    def graph_params(self) -> dict:
+        return {"graph": self.graph} if self.graph else {"default": ""}
+
+    def upload(self, lines: List[str], replace: bool) -> None:
+        """PUT (replace) or POST (append) one batch of N-Triples."""
+        body = ("\n".join(lines) + "\n").encode("utf-8")
+        method = self.session.put if replace else self.session.post
+        response = method(
+            f"{self.dataset_url}/data",
+            params=self.graph_params,
+            data=body,
+            headers={"Content-Type": NTRIPLES},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
+    def download(self) -> Tuple[List[str], List[str]]:
+        """The graph currently in the store, as triple_lines()."""
+        response = self.session.get(
+            f"{self.dataset_url}/data",
+            params=self.graph_params,
+            headers={"Accept": NTRIPLES},
+            timeout=self.timeout,
+        )
+        if response.status_code == 404:
+            return [], []
+        response.raise_for_status()
+        graph = Graph()
+        graph.parse(data=response.text, format="nt")
+        return triple_lines(graph)
+
+    def update(self, operation: str, lines: List[str]) -> None:
+        """Runs INSERT DATA / DELETE DATA for a batch of ground triples."""
+        triples = "\n".join(lines)
+        if self.graph:
+            triples = f"GRAPH <{self.graph}> {{\n{triples}\n}}"
+        response = self.session.post(
+            f"{self.dataset_url}/update",
+            data={"update": f"{operation} {{\n{triples}\n}}"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
+
+def load(store: GraphStore, ground: List[str], with_bnodes: List[str], batch_size: int, replace: bool) -> None:
+    """
+    Uploads the ground triples in batches, then every blank-node triple in one
+    final request: blank node labels only hold within a single request, so a
+    blank node split across two batches would become two different nodes.
+    """
+    start = time.perf_counter()
+    requests_sent = 0
+    total = len(ground) + len(with_bnodes)
+    sent = 0
+    for batch in list(batches(ground, batch_size)) + ([with_bnodes] if with_bnodes else []):
+        store.upload(batch, replace=replace and requests_sent == 0)
+        requests_sent += 1
+        sent += len(batch)
+        logger.info(f"Uploaded {sent}/{total} triples")
+    if replace and requests_sent == 0:
+        store.upload([], replace=True)
+    logger.info(f"Loaded {sent} triples in {requests_sent} requests, {time.perf_counter() - start:.1f}s")
+
+
+def load_diff(store: GraphStore, ground: Set[str], with_bnodes: List[str], batch_size: int) -> None:
+    loaded, loaded_bnodes = store.download()
+    loaded_ground = set(loaded)
+
+    if bnode_fingerprint(with_bnodes) != bnode_fingerprint(loaded_bnodes):
+        logger.info("Blank-node triples changed; they cannot be diffed, replacing the whole graph")
+        load(store, sorted(ground), with_bnodes, batch_size, replace=True)
+        return
+
+    to_delete = sorted(loaded_ground - ground)
+    to_insert = sorted(ground - loaded_ground)
+    logger.info(f"Diff against loaded graph: -{len(to_delete)} +{len(to_insert)} triples")
+    for batch in batches(to_delete, batch_size):
+        store.update("DELETE DATA", batch)
+    for batch in batches(to_insert, batch_size):
+        store.update("INSERT DATA", batch)
+
+
+def build_tdb2(lines: List[str], location: str, output: str) -> None:
+    with open(output, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(line + "\n")
+    logger.info(f"Wrote {len(lines)} triples to {output}")
+    command = ["tdb2.tdbloader", "--loc", location, output]
+    if shutil.which(command[0]) is None:
+        logger.warning(f"tdb2.tdbloader not found on PATH; run it from a Jena installation:\n  {' '.join(command)}")
+        return
+    subprocess.run(command, check=True)
+    logger.info(f"Built TDB2 database in {location}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load Brick TTL models into Fuseki")
+    parser.add_argument("files", nargs="+", help="RDF files to load (any format rdflib can guess)")
+    parser.add_argument("--endpoint", default=DEFAULT_ENDPOINT, help="Fuseki dataset URL (default: %(default)s)")
+    parser.add_argument("--graph", help="Named graph URI (default graph if omitted)")
+    parser.add_argument("--mode", choices=["replace", "append", "diff", "tdb2"], default="replace")
+    parser.add_argument("--batch-size", type=int, default=50000, help="Triples per request")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parser processes")
+    parser.add_argument("--user", default=os.getenv("FUSEKI_USER", "admin"))
+    parser.add_argument("--password", default=os.getenv("FUSEKI_PASSWORD"))
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds per HTTP request")
+    parser.add_argument("--tdb2-location", default="./tdb2", help="Database directory for --mode tdb2")
+    parser.add_argument("--tdb2-output", default="./merged.nt", help="N-Triples file written for --mode tdb2")
+    args = parser.parse_args(argv)
+
+    missing = [path for path in args.files if not os.path.isfile(path)]
+    if missing:
+        parser.error(f"files not found: {', '.join(missing)}")
+
+    try:
+        ground, with_bnodes = parse_all(args.files, max(1, min(args.workers, len(args.files))))
+    except ParserError as e:
+        logger.error(f"Parsing failed: {e}")
+        return 1
+    # Replaced along with the data in replace mode, diffed like any other triple in diff mode
+    ground.add(version_line())
+
+    if args.mode == "tdb2":
+        build_tdb2(sorted(ground) + with_bnodes, args.tdb2_location, args.tdb2_output)
+        return 0
+
+    auth = (args.user, args.password) if args.password else None
+    store = GraphStore(args.endpoint, args.graph, auth, args.timeout)
+    try:
+        if args.mode == "diff":
+            load_diff(store, ground, with_bnodes, args.batch_size)
+        else:
+            load(store, sorted(ground), with_bnodes, args.batch_size, replace=args.mode == "replace")
+    except requests.RequestException as e:
+        logger.error(f"Upload failed: {e}")
+        return 1
+    except ParserError as e:
+        # The store's copy of the graph (diff mode) could not be read back
+        logger.error(f"Diff failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
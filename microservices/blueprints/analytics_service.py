@@ -4,6 +4,7 @@ import pandas as pd
 import numpy as np
 import logging
 import json
+from datetime import datetime
 
 analytics_service = Blueprint("analytics_service", __name__)
 
@@ -2275,6 +2276,24 @@ analysis_functions = {
     "forecast_downtimes": forecast_downtimes,
 }
 
+def execute_analysis(analysis_type, sensor_data):
+    """
+    Runs a registered analysis and wraps its output in the /run response envelope.
+
+    Shared by the /run endpoint and by callers that import this module directly
+    (the Rasa action server's in-process analytics mode), so both paths return
+    the same structure:
+    {"analysis_type": ..., "timestamp": "YYYY-MM-DD HH:MM:SS", "results": ...}
+
+    Raises KeyError if analysis_type is not in analysis_functions.
+    """
+    result = analysis_functions[analysis_type](sensor_data)
+    return {
+        "analysis_type": analysis_type,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "results": result
+    }
+
 @analytics_service.route("/test", methods=["GET", "POST"])
 def test_endpoint():
     if request.method == "POST":
@@ -2309,14 +2328,8 @@ def run_analysis():
 
     try:
         logging.info(f"Calling analysis function: {analysis_type} with data of length: {len(str(sensor_data))}")
-        result = analysis_functions[analysis_type](sensor_data)
-        
         # Create an enhanced response that includes the analytics type
-        enhanced_result = {
-            "analysis_type": analysis_type,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "results": result
-        }
+        enhanced_result = execute_analysis(analysis_type, sensor_data)
         
         logging.info(f"Analysis result: {enhanced_result}")
         return jsonify(enhanced_result)
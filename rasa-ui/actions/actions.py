@@ -1,7 +1,9 @@
 import os
+import asyncio
 import logging
+import threading
 import time
-import requests
+import httpx
 import pandas as pd
 from rasa_sdk import Action
 import numpy as np
@@ -10,12 +12,29 @@ from rasa_sdk import Action, Tracker, FormValidationAction
 from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.events import SlotSet
 from rasa_sdk.types import DomainDict
-from typing import Any, Text, Dict, List, Tuple, Union
+from typing import Any, Optional, Text, Dict, List, Set, Tuple, Union
 from rasa_sdk.events import FollowupAction
 from SPARQLWrapper import SPARQLWrapper, JSON
 import mysql.connector
 import json
-from ollama import Client
+from ollama import AsyncClient
+from .attachments import get_attachment_store
+from .blocking import run_blocking
+from .brick_index import BRICK_MODEL_TTL, answer_locally, preload_in_background as preload_brick_index
+from .http_client import CircuitOpenError, service_client
+from .inprocess_analytics import inprocess_enabled, run_analysis as run_inprocess_analysis
+from .pipeline import StageTimer
+from .sensor_registry import sensor_registry
+from .sparql_cache import make_sparql_cache
+from .sparql_prefixes import PREFIX_BLOCK, URI_COMPACTOR
+from .routing import DIRECT_TIMESERIES_ROUTING, direct_timeseries_ids, is_direct_timeseries_request, timeseries_results
+from .sparql_stream import (
+    SPARQL_STREAM_TIMEOUT,
+    SPARQL_STREAMING,
+    StreamCancelled,
+    StreamedSelect,
+    stream_select_to_attachment,
+)
 import dateparser
 from dateparser.search import search_dates
 from datetime import datetime, timedelta
@@ -41,8 +60,15 @@ logger = logging.getLogger(__name__)
 # Global constants
 nl2sparql_url = "https://deep-gator-cleanly.ngrok-free.app/"
 FUSEKI_URL = "http://jena-fuseki-rdf-store:3030/abacws-sensor-network/sparql"
-ATTACHMENTS_DIR = "/app/actions/static/attachments"
 SUMMARIZATION_URL = "http://dashing-sunfish-curiously.ngrok-free.app"
+ANALYTICS_URL = os.getenv("ANALYTICS_URL", "http://microservices:6000/analytics/run")
+
+# Per-call timeouts (seconds) for everything the async actions wait on
+NL2SPARQL_TIMEOUT = float(os.getenv("NL2SPARQL_TIMEOUT", "20"))
+SPARQL_TIMEOUT = float(os.getenv("SPARQL_TIMEOUT", "10"))
+SQL_TIMEOUT = float(os.getenv("SQL_TIMEOUT", "30"))
+ANALYTICS_TIMEOUT = float(os.getenv("ANALYTICS_TIMEOUT", "30"))
+SUMMARY_TIMEOUT = float(os.getenv("SUMMARY_TIMEOUT", "120"))
 
 
 MyDatabase = "MySQL_DB_CONFIG"
@@ -65,15 +91,92 @@ except FileNotFoundError:
 except Exception as e:
     logger.error(f"Error loading sensor_list.txt: {e}")
     VALID_SENSOR_TYPES = set()
+# Fuseki results, cleared when the dataset version changes (see sparql_cache.py)
+sparql_cache = make_sparql_cache(FUSEKI_URL, BRICK_MODEL_TTL)
+
+# Start indexing the Brick model so simple queries can skip Fuseki
+preload_brick_index()
+
 # Initialize Ollama client
 try:
-    client = Client(host=SUMMARIZATION_URL)
+    client = AsyncClient(host=SUMMARIZATION_URL, timeout=SUMMARY_TIMEOUT)
     logger.info(f"Initialized Ollama client for {SUMMARIZATION_URL}")
 except Exception as e:
     logger.error(f"Failed to initialize Ollama client: {e}")
     client = None
 
 
+def log_uuid_mappings(uuids_found: Set[str], source: str) -> None:
+    """Logs which of the UUIDs found in a payload have a sensor name."""
+    if not uuids_found:
+        return
+    logger.info(f"UUIDs found in {source}: {sorted(uuids_found)}")
+    for uuid in sorted(uuids_found):
+        name = sensor_registry.name_for(uuid)
+        if name:
+            logger.info(f"UUID {uuid} maps to sensor name: {name}")
+        else:
+            logger.info(f"UUID {uuid} has no mapping in sensor_mappings.txt")
+
+
+def log_data_sample(serialised: str, limit: int = 500) -> None:
+    """Logs the start of an already-serialised payload."""
+    if len(serialised) > limit:
+        logger.info(f"Data sample (truncated): {serialised[:limit]}...")
+    else:
+        logger.info(f"Data sample: {serialised}")
+    logger.info("===============================================================")
+
+
+async def generate_summary(question: str, response_text: str) -> Optional[str]:
+    """
+    Asks the Mistral model for a short summary of a query/analytics response.
+
+    :param question: The user's original question.
+    :param response_text: The (already UUID-translated) response serialised as JSON.
+    :return: The summary text, or None if the model is unavailable or errors.
+    """
+    if not client:
+        logger.error("Ollama client is not initialized.")
+        return None
+
+    prompt = (
+        "Instructions: Read the following smart building data received over an ontology created using BrickSchema "
+        "and SQL sensor data or analytics output received and provide a short summary.\n"
+        f"Question: {question}\n"
+        f"SPARQL Response: {response_text}\n\n"
+        "Explanation:"
+    )
+    logger.debug(f"Generated prompt: {prompt}")
+
+    try:
+        logger.debug("Sending prompt to the model 'mistral:latest' with max_tokens=150")
+        response = await service_client.call(
+            "summarization",
+            lambda: client.generate(model="mistral:latest", prompt=prompt, options={"max_tokens": 150}),
+            timeout=SUMMARY_TIMEOUT,
+        )
+        logger.debug(f"Response received: {response}")
+
+        if "response" not in response:
+            logger.error("Error: The response does not contain the 'response' key.")
+            return None
+
+        summary = response["response"]
+        logger.debug(f"Extracted summary: {summary}")
+        return summary
+
+    except asyncio.TimeoutError:
+        logger.error(f"Summary generation timed out after {SUMMARY_TIMEOUT}s")
+        return None
+    except CircuitOpenError as e:
+        logger.error(f"Summarization service unavailable: {e}")
+        return None
+    except Exception as e:
+        logger.exception(f"An error occurred while generating the summary: {e}")
+        return None
+
+
 class ValidateSensorForm(FormValidationAction):
     def name(self) -> Text:
         return "validate_sensor_form"
@@ -96,8 +199,7 @@ class ValidateSensorForm(FormValidationAction):
         else:
             sensor_types = slot_value if isinstance(slot_value, list) else [slot_value]
             
-        sensor_mappings = self.load_sensor_mappings()
-        valid_sensors = [s for s in sensor_types if s in sensor_mappings]
+        valid_sensors = [s for s in sensor_types if sensor_registry.is_known(s)]
 
         if not valid_sensors:
             dispatcher.utter_message(response="utter_ask_sensor_type")
@@ -106,36 +208,6 @@ class ValidateSensorForm(FormValidationAction):
         logger.info(f"Validated sensor_types: {valid_sensors}")
         return {"sensor_type": valid_sensors}
 
-    def load_sensor_mappings(self) -> Dict[str, str]:
-        mappings = {}
-        try:
-            with open("./actions/sensor_mappings.txt", "r") as f:
-                for line_num, line in enumerate(f, 1):
-                    try:
-                        if line.strip():
-                            parts = line.strip().split(",")
-                            if len(parts) == 2:
-                                name, uuid = parts
-                                # Store both directions for flexible lookup
-                                mappings[name] = uuid  # For validation of names
-                                mappings[uuid] = name  # For converting UUIDs to names
-                            else:
-                                logger.warning(f"Line {line_num}: Invalid format - expected 'name,uuid' but got: {line.strip()}")
-                    except Exception as e:
-                        logger.error(f"Error on line {line_num}: {e}")
-            logger.info(f"Loaded {len(mappings)} sensor mappings")
-        except FileNotFoundError:
-            logger.error("sensor_mappings.txt not found")
-            # Create an empty file to prevent future errors
-            try:
-                os.makedirs("./actions", exist_ok=True)
-                with open("./actions/sensor_mappings.txt", "w") as f:
-                    f.write("# Format: sensor_name,sensor_uuid\n")
-                logger.info("Created empty sensor_mappings.txt file")
-            except Exception as e:
-                logger.error(f"Failed to create empty sensor_mappings.txt: {e}")
-        return mappings
-
 def extract_date_range(text: str) -> Dict[str, str]:
     """
     Extract date ranges from text using various common patterns.
@@ -391,26 +463,10 @@ class ActionQuestionToBrickbot(Action):
     def name(self) -> Text:
         return "action_question_to_brickbot"
 
-    def load_sensor_mappings(self) -> Dict[str, str]:
-        mappings = {}
-        try:
-            with open("./actions/sensor_mappings.txt", "r") as f:
-                for line in f:
-                    if line.strip():
-                        name, uuid = line.strip().split(",")
-                        mappings[uuid] = name
-            logger.info(f"Loaded {len(mappings)} sensor mappings")
-        except FileNotFoundError:
-            logger.error("sensor_mappings.txt not found")
-        return mappings
-
-    def query_service_requests(self, url: str, data: Dict) -> Dict:
-            headers = {"Content-Type": "application/json"}
+    async def query_service_requests(self, url: str, data: Dict) -> Dict:
             try:
-                response = requests.post(url, json=data, headers=headers, timeout=20)
-                response.raise_for_status()
-                return response.json()
-            except requests.exceptions.RequestException as e:
+                return await service_client.post_json("nl2sparql", url, data, timeout=NL2SPARQL_TIMEOUT)
+            except (httpx.HTTPError, ValueError, CircuitOpenError) as e:
                 logger.error(f"Failed to query nl2sparql endpoint: {e}")
                 return {"error": str(e)}
 
@@ -418,45 +474,27 @@ class ActionQuestionToBrickbot(Action):
         """
         Appends a set of predefined SPARQL prefixes to the query.
         """
-        prefixes = [
-            "PREFIX brick: <https://brickschema.org/schema/Brick#>",
-            "PREFIX dcterms: <http://purl.org/dc/terms/>",
-            "PREFIX owl: <http://www.w3.org/2002/07/owl#>",
-            "PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>",
-            "PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>",
-            "PREFIX sh: <http://www.w3.org/ns/shacl#>",
-            "PREFIX skos: <http://www.w3.org/2004/02/skos/core#>",
-            "PREFIX sosa: <http://www.w3.org/ns/sosa/>",
-            "PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>",
-            "PREFIX tag: <https://brickschema.org/schema/BrickTag#>",
-            "PREFIX bldg: <http://abacwsbuilding.cardiff.ac.uk/abacws#>",
-            "PREFIX bsh: <https://brickschema.org/schema/BrickShape#>",
-            "PREFIX s223: <http://data.ashrae.org/standard223#>",
-            "PREFIX bacnet: <http://data.ashrae.org/bacnet/2020#>",
-            "PREFIX g36: <http://data.ashrae.org/standard223/1.0/extensions/g36#>",
-            "PREFIX qkdv: <http://qudt.org/vocab/dimensionvector/>",
-            "PREFIX quantitykind: <http://qudt.org/vocab/quantitykind/>",
-            "PREFIX qudt: <http://qudt.org/schema/qudt/>",
-            "PREFIX rec: <https://w3id.org/rec#>",
-            "PREFIX ref: <https://brickschema.org/schema/Brick/ref#>",
-            "PREFIX s223tobrick: <https://brickschema.org/extension/brick_extension_interpret_223#>",
-            "PREFIX schema1: <http://schema.org/>",
-            "PREFIX unit: <http://qudt.org/vocab/unit/>",
-            "PREFIX vcard: <http://www.w3.org/2006/vcard/ns#>",
-        ]
-        return "\n".join(prefixes) + "\n" + sparql_query
+        return PREFIX_BLOCK + "\n" + sparql_query
 
     def execute_sparql_query(self, sparql_query: str) -> Dict:
         """
         Executes the given SPARQL query against the Fuseki endpoint.
+
+        This is a blocking call; async callers should go through run_blocking.
         """
+        cached = sparql_cache.get(sparql_query)
+        if cached is not None:
+            logger.info("SPARQL query served from the result cache.")
+            return cached
+
         sparql = SPARQLWrapper(FUSEKI_URL)
         sparql.setQuery(sparql_query)
         sparql.setReturnFormat(JSON)
-        sparql.setTimeout(10)
+        sparql.setTimeout(int(SPARQL_TIMEOUT))
         try:
             results = sparql.queryAndConvert()
             logger.info("SPARQL query executed successfully.")
+            sparql_cache.put(sparql_query, results)
             return results
         except Exception as e:
             logger.error(f"Error executing SPARQL query: {e}")
@@ -481,6 +519,17 @@ class ActionQuestionToBrickbot(Action):
             formatted.append(f"Result: {values}")
         return "\n".join(formatted)[:500]
 
+    def format_standardized_results(self, rows: List[Dict], total_rows: int) -> Text:
+        """
+        Formats the preview rows of a streamed result set like format_sparql_results.
+        """
+        if not rows:
+            return "No results found."
+        formatted = "\n".join(f"Result: {row}" for row in rows)[:500]
+        if total_rows > len(rows):
+            formatted += f"\n(showing {len(rows)} of {total_rows} rows; the attachment has all of them)"
+        return formatted
+
     def format_json_for_ui(self, json_data: Dict) -> Text:
             """
             Formats JSON for display in the chatbot UI.
@@ -494,54 +543,12 @@ class ActionQuestionToBrickbot(Action):
                 logger.error(f"Error formatting JSON for UI: {e}")
                 return "Unable to display JSON response."
 
-    def replace_uuids_with_sensor_types(self, data: Any, uuid_to_sensor: Dict[Text, Text]) -> Any:
-                """Recursively replace UUIDs with sensor types in the data structure."""
-                if isinstance(data, dict):
-                    return {k: self.replace_uuids_with_sensor_types(v, uuid_to_sensor) for k, v in data.items()}
-                elif isinstance(data, list):
-                    return [self.replace_uuids_with_sensor_types(item, uuid_to_sensor) for item in data]
-                elif isinstance(data, str) and data in uuid_to_sensor:
-                    return uuid_to_sensor[data]
-                return data
-
-    def get_prefix_map(self) -> Dict[str, str]:
-            """
-            Returns a mapping of prefixes to URIs from add_sparql_prefixes.
-            """
-            prefixes = [
-                ("brick", "https://brickschema.org/schema/Brick#"),
-                ("dcterms", "http://purl.org/dc/terms/"),
-                ("owl", "http://www.w3.org/2002/07/owl#"),
-                ("rdf", "http://www.w3.org/1999/02/22-rdf-syntax-ns#"),
-                ("rdfs", "http://www.w3.org/2000/01/rdf-schema#"),
-                ("sh", "http://www.w3.org/ns/shacl#"),
-                ("skos", "http://www.w3.org/2004/02/skos/core#"),
-                ("sosa", "http://www.w3.org/ns/sosa/"),
-                ("xsd", "http://www.w3.org/2001/XMLSchema#"),
-                ("tag", "https://brickschema.org/schema/BrickTag#"),
-                ("bldg", "http://abacwsbuilding.cardiff.ac.uk/abacws#"),
-                ("bsh", "https://brickschema.org/schema/BrickShape#"),
-                ("s223", "http://data.ashrae.org/standard223#"),
-                ("bacnet", "http://data.ashrae.org/bacnet/2020#"),
-                ("g36", "http://data.ashrae.org/standard223/1.0/extensions/g36#"),
-                ("qkdv", "http://qudt.org/vocab/dimensionvector/"),
-                ("quantitykind", "http://qudt.org/vocab/quantitykind/"),
-                ("qudt", "http://qudt.org/schema/qudt/"),
-                ("rec", "https://w3id.org/rec#"),
-                ("ref", "https://brickschema.org/schema/Brick/ref#"),
-                ("s223tobrick", "https://brickschema.org/extension/brick_extension_interpret_223#"),
-                ("schema1", "http://schema.org/"),
-                ("unit", "http://qudt.org/vocab/unit/"),
-                ("vcard", "http://www.w3.org/2006/vcard/ns#"),
-            ]
-            return {uri: prefix for prefix, uri in prefixes}
     def standardize_sparql_json(
         self, results: Dict, user_question: str, sensor_type: str
     ) -> Dict:
         """
         Converts SPARQL JSON to a standardized format with prefixed URIs.
         """
-        prefix_map = self.get_prefix_map()
         standardized = {"question": user_question, "sensor": sensor_type, "results": []}
 
         if (
@@ -551,28 +558,11 @@ class ActionQuestionToBrickbot(Action):
         ):
             return standardized
 
-        bindings = results["results"]["bindings"]
-        for binding in bindings:
-            result_entry = {}
-            for key, val in binding.items():
-                value_type = val.get("type")
-                value = val.get("value", "")
-                if value_type == "uri":
-                    for uri, prefix in prefix_map.items():
-                        if value.startswith(uri):
-                            value = f"{prefix}:{value[len(uri):]}"
-                            break
-                elif value_type == "literal":
-                    lang = val.get("xml:lang")
-                    if lang:
-                        value = f"{value}@{lang}"
-                result_entry[key] = value
-            standardized["results"].append(result_entry)
-
+        standardized["results"] = list(URI_COMPACTOR.standardize_bindings(results["results"]["bindings"]))
         return standardized
 
 
-    def summarize_response(self, standardized_json: Dict) -> Text:
+    async def summarize_response(self, standardized_json: Dict) -> Text:
         """
         Generate a summary using the Mistral model based on the standardized JSON.
 
@@ -591,84 +581,130 @@ class ActionQuestionToBrickbot(Action):
         sensor_info = standardized_json.get("sensor", "No sensor info")
         logger.info(f"Sensor info: {sensor_info}")
         
-        # Load sensor mappings once and reuse
-        sensor_mappings = self.load_sensor_mappings()
-        logger.info(f"Loaded {len(sensor_mappings)} sensor mappings")
-        
-        # Check for UUIDs and their mappings in the data
-        uuid_pattern = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
-        json_str = json.dumps(standardized_json)
-        uuids_found = uuid_pattern.findall(json_str)
-        
-        if uuids_found:
-            logger.info(f"UUIDs found in SPARQL data: {uuids_found}")
-            # Check if we have mappings for these UUIDs
-            for uuid in uuids_found:
-                if uuid in sensor_mappings:
-                    logger.info(f"UUID {uuid} maps to sensor name: {sensor_mappings[uuid]}")
-                    # Consider replacing UUID with sensor name in the data before sending to LLM
-                else:
-                    logger.info(f"UUID {uuid} has no mapping in sensor_mappings.txt")
-        
-        # Log a sample of the JSON (truncated if too large)
-        sample_json = json.dumps(standardized_json, indent=2)
-        if len(sample_json) > 500:
-            logger.info(f"Data sample (truncated): {sample_json[:500]}...")
-        else:
-            logger.info(f"Data sample: {sample_json}")
-        logger.info("===============================================================")
+        # One pass replaces known UUIDs (keys and values) and collects every UUID seen
+        processed_json, uuids_found = sensor_registry.translate(standardized_json)
+        log_uuid_mappings(uuids_found, "SPARQL data")
 
         question = standardized_json.get("question", "")
-        
-        # Replace any UUIDs with sensor names in the data before generating the prompt
-        processed_json = standardized_json
-        if uuids_found and sensor_mappings:
-            processed_json = self.replace_uuids_with_sensor_types(standardized_json, sensor_mappings)
-            logger.info("Replaced UUIDs with sensor names in data for summary")
-        
         sparql_response = json.dumps(processed_json, indent=2)
+        log_data_sample(sparql_response)
         logger.debug(f"Summarization input - question: {question}")
         logger.debug(f"Summarization input - SPARQL response: {sparql_response}")
 
-        prompt = (
-            "Instructions: Read the following smart building data received over an ontology created using BrickSchema "
-            "and SQL sensor data or analytics output received and provide a short summary.\n"
-            f"Question: {question}\n"
-            f"SPARQL Response: {sparql_response}\n\n"
-            "Explanation:"
-        )
-        logger.debug(f"Generated prompt: {prompt}")
+        return await generate_summary(question, sparql_response)
 
+    async def run(
+        self,
+        dispatcher: CollectingDispatcher,
+        tracker: Tracker,
+        domain: Dict[Text, Any],
+    ) -> List[Dict[Text, Any]]:
+        timer = StageTimer(self.name())
         try:
-            logger.debug(
-                "Sending prompt to the model 'mistral:latest' with max_tokens=150"
-            )
-            response = client.generate(
-                model="mistral:latest", prompt=prompt, options={"max_tokens": 150}
-            )
-            logger.debug(f"Response received: {response}")
+            return await self.run_pipeline(dispatcher, tracker, domain, timer)
+        finally:
+            timer.log()
 
-            if "response" not in response:
-                error_message = (
-                    "Error: The response does not contain the 'response' key."
-                )
-                logger.error(error_message)
-                return None
+    async def translate_and_query(
+            self,
+            dispatcher: CollectingDispatcher,
+            user_question: str,
+            sensor_types: List[str],
+            sensor: str,
+            stream_filename: str,
+            timer: StageTimer,
+        ) -> Tuple[Optional[Dict], Optional[StreamedSelect], Optional[List[Dict[Text, Any]]]]:
+            """
+            NL2SPARQL translation followed by the local index, a streamed or a regular Fuseki query.
+            A streamed query writes its attachment to `stream_filename`.
 
-            summary = response["response"]
-            logger.debug(f"Extracted summary: {summary}")
-            return summary
+            :return: (SPARQL JSON results, streamed result, None), or (None, None, events)
+                     when translation failed and the run should end with `events`.
+            """
+            entity_string = ", ".join([f"bldg:{sensor}" for sensor in sensor_types])
+            input_data = {"question": user_question, "entity": entity_string}
+            logger.info(f"Input data for nl2sparql: {input_data}")
 
-        except Exception as e:
-            logger.exception(f"An error occurred while generating the summary: {e}")
-            return None
+            response = await timer.timed(
+                "translation",
+                self.query_service_requests(os.getenv("NL2SPARQL_URL", "https://deep-gator-cleanly.ngrok-free.app/nl2sparql"), input_data),
+            )
+            if "error" in response:
+                dispatcher.utter_message(response="utter_translation_error")
+                return None, None, [SlotSet("sparql_error", True), SlotSet("timeseries_ids", None)]
 
-    async def run(
+            sparql_query = response.get("sparql_query")
+            if not sparql_query:
+                dispatcher.utter_message(text="No valid SPARQL query returned. Please try again.")
+                return None, None, [SlotSet("sparql_error", True), SlotSet("timeseries_ids", None)]
+
+            logger.info(f"Generated SPARQL query: {sparql_query}")
+            streamed = None
+
+            # Simple lookups (sensor -> timeseries, room -> points, ...) are answered
+            # from the in-process Brick index; everything else goes to Fuseki
+            with timer.stage("local_query"):
+                sparql_results = answer_locally(sparql_query)
+            if sparql_results is not None:
+                logger.info("SPARQL query answered from the local Brick index.")
+            elif SPARQL_STREAMING:
+                # Rows go straight to the attachment; only a preview is kept in memory.
+                # Streamed results bypass the SPARQL result cache
+                cancel_stream = threading.Event()
+                try:
+                    streamed = await timer.timed(
+                        "sparql_stream",
+                        run_blocking(
+                            stream_select_to_attachment,
+                            FUSEKI_URL,
+                            self.add_sparql_prefixes(sparql_query),
+                            get_attachment_store(),
+                            stream_filename,
+                            {"question": user_question, "sensor": sensor},
+                            read_timeout=SPARQL_TIMEOUT,
+                            deadline=SPARQL_STREAM_TIMEOUT,
+                            cancel=cancel_stream,
+                            timeout=SPARQL_STREAM_TIMEOUT,
+                        ),
+                    )
+                except asyncio.TimeoutError:
+                    logger.error(f"Streamed SPARQL query timed out after {SPARQL_STREAM_TIMEOUT}s, retrying unstreamed")
+                except (httpx.HTTPError, OSError, ValueError, StreamCancelled) as e:
+                    logger.error(f"Error streaming SPARQL query, retrying unstreamed: {e}")
+                finally:
+                    # run_blocking does not stop the worker thread; this makes it drop its temp files
+                    if streamed is None:
+                        cancel_stream.set()
+            if sparql_results is None and streamed is None:
+                # Not answered locally, or the stream failed: a regular Fuseki query
+                full_sparql_query = self.add_sparql_prefixes(sparql_query)
+                try:
+                    sparql_results = await timer.timed(
+                        "sparql_query",
+                        run_blocking(self.execute_sparql_query, full_sparql_query, timeout=SPARQL_TIMEOUT),
+                    )
+                except asyncio.TimeoutError:
+                    logger.error(f"SPARQL query timed out after {SPARQL_TIMEOUT}s")
+                    sparql_results = None
+            return sparql_results, streamed, None
+
+    async def run_pipeline(
             self,
             dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any],
+            timer: StageTimer,
         ) -> List[Dict[Text, Any]]:
+            """
+            Question -> NL2SPARQL -> local Brick index or Fuseki (or, for direct
+            "show/analyse <sensor>" requests, the sensor -> timeseries view), then the
+            post-query stages.
+
+            Translation and the SPARQL query are inherently sequential. Once results
+            exist they are queued for the user first; the attachment write, timeseries
+            UUID extraction and (when needed) the LLM summary then run concurrently, so
+            the run takes as long as its critical path rather than the sum of its stages.
+            """
             user_question = tracker.latest_message.get("text", "").strip()
             if not user_question:
                 dispatcher.utter_message(text="Sorry, I couldn't understand your query. Please try again.")
@@ -677,152 +713,183 @@ class ActionQuestionToBrickbot(Action):
             sensor_types = tracker.get_slot("sensor_type") or []
             logger.info(f"User question: {user_question}, Sensor types: {sensor_types}")
 
-            sensor_mappings = self.load_sensor_mappings()
-            uuids = [sensor_mappings.get(sensor) for sensor in sensor_types if sensor in sensor_mappings]
+            name_to_uuid = sensor_registry.name_to_uuid
+            uuids = [name_to_uuid[sensor] for sensor in sensor_types if sensor in name_to_uuid]
 
             if not sensor_types or not uuids:
                 dispatcher.utter_message(response="utter_ask_sensor_type")
                 return [{"event": "active_loop", "name": "sensor_form"}, SlotSet("sparql_error", False)]
 
-            entity_string = ", ".join([f"bldg:{sensor}" for sensor in sensor_types])
-            input_data = {"question": user_question, "entity": entity_string}
-            logger.info(f"Input data for nl2sparql: {input_data}")
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"sparql_response_{timestamp}.json"
+            # Kept apart from `filename`: a stream given up on may still be finishing in its
+            # worker thread while the fallback query's results are saved
+            stream_filename = f"sparql_response_{timestamp}_stream.json"
+            sensor = sensor_types[0] if sensor_types else ""
             dispatcher.utter_message(text="Processing your query...")
 
-            response = self.query_service_requests(os.getenv("NL2SPARQL_URL", "https://deep-gator-cleanly.ngrok-free.app/nl2sparql"), input_data)
-            if "error" in response:
-                dispatcher.utter_message(response="utter_translation_error")
-                return [SlotSet("sparql_error", True), SlotSet("timeseries_ids", None)]
-
-            sparql_query = response.get("sparql_query")
-            if not sparql_query:
-                dispatcher.utter_message(text="No valid SPARQL query returned. Please try again.")
-                return [SlotSet("sparql_error", True), SlotSet("timeseries_ids", None)]
-
-            logger.info(f"Generated SPARQL query: {sparql_query}")
-            full_sparql_query = self.add_sparql_prefixes(sparql_query)
-            sparql_results = self.execute_sparql_query(full_sparql_query)
-            if sparql_results is None:
+            # "Show/analyse <sensor>" questions only need the sensors' timeseries IDs,
+            # which are known locally; skip the translator and the triple store
+            direct_view = None
+            if DIRECT_TIMESERIES_ROUTING and is_direct_timeseries_request(user_question):
+                direct_view = direct_timeseries_ids(sensor_types)
+            if direct_view is not None:
+                logger.info(f"Direct timeseries request, skipping NL2SPARQL: {direct_view}")
+                with timer.stage("direct_lookup"):
+                    sparql_results, streamed = timeseries_results(direct_view), None
+            else:
+                sparql_results, streamed, error_events = await self.translate_and_query(
+                    dispatcher, user_question, sensor_types, sensor, stream_filename, timer
+                )
+                if error_events is not None:
+                    return error_events
+            if sparql_results is None and streamed is None:
                 dispatcher.utter_message(text="Error executing SPARQL query. Please try again later.")
                 return [SlotSet("sparql_error", True), SlotSet("timeseries_ids", None)]
 
-            formatted_results = self.format_sparql_results(sparql_results)
+            with timer.stage("format"):
+                if streamed is not None:
+                    standardized_json = {
+                        "question": user_question,
+                        "sensor": sensor,
+                        "results": streamed.preview,
+                        "total_results": streamed.total_rows,
+                    }
+                    formatted_results = self.format_standardized_results(streamed.preview, streamed.total_rows)
+                else:
+                    formatted_results = self.format_sparql_results(sparql_results)
+                    standardized_json = self.standardize_sparql_json(sparql_results, user_question, sensor)
+            # Queued before the attachment and summary messages; the dispatcher sends them all
+            # together when the action returns, so this orders the reply rather than sending early
             dispatcher.utter_message(text=f"SPARQL query results:\n{formatted_results}")
 
-            standardized_json = self.standardize_sparql_json(sparql_results, user_question, sensor_types[0] if sensor_types else "")
-            static_folder = os.getenv("STATIC_FOLDER", ATTACHMENTS_DIR)
-            base_url = os.getenv("BASE_URL", "http://localhost:8000")
-            os.makedirs(static_folder, exist_ok=True)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"sparql_response_{timestamp}.json"
-            output_file = os.path.join(static_folder, filename)
-            try:
-                with open(output_file, "w") as f:
-                    json.dump(standardized_json, f, indent=2)
-                json_url = f"{base_url}/{filename}"
-                dispatcher.utter_message(
-                    text="SPARQL results saved as JSON:",
-                    attachment={"type": "json", "url": json_url, "filename": filename}
+            # A streamed result set is already in its attachment
+            attachment_task = None
+            summary_task = None
+            if streamed is None:
+                attachment_task = asyncio.ensure_future(
+                    timer.timed("attachment", get_attachment_store().save(standardized_json, filename))
                 )
-            except (IOError, TypeError) as e:
-                logger.error(f"Failed to save SPARQL JSON: {e}")
-                dispatcher.utter_message(text="Error saving SPARQL results. Inline results above.")
-
-            uuid_pattern = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
-            timeseries_ids = [
-                r.get("timeseriesId") for r in standardized_json.get("results", [])
-                if r.get("timeseriesId") and uuid_pattern.match(r.get("timeseriesId"))
-            ]
-            has_timeseries = bool(timeseries_ids)
-            logger.info(f"Has timeseries IDs: {has_timeseries}, IDs: {timeseries_ids}")
-            # Add these helpful debug logs
-            logger.info(f"Deciding path - has_timeseries: {has_timeseries}, start_date: {tracker.get_slot('start_date')}, end_date: {tracker.get_slot('end_date')}")
-            logger.info(f"Will proceed to {'timeseries processing' if has_timeseries else 'direct summary'} path")
-            is_auto_date = False
-            now = datetime.now()
-            today_str = now.strftime("%Y-%m-%d")
-            today_time_str = now.strftime("%Y-%m-%d %H:%M:%S")
-            midnight_str = f"{today_str} 00:00:00"
-
-            # After extracting timeseries_ids:
-            events = [SlotSet("sparql_error", False)]
-            if has_timeseries:
-                events.append(SlotSet("timeseries_ids", timeseries_ids))
-                dispatcher.utter_message(text=f"Found timeseries IDs: {timeseries_ids}")
-            
-                # Add these lines to define the missing variables
-                start_date = tracker.get_slot("start_date")
-                end_date = tracker.get_slot("end_date")
 
-                # Add after checking if both dates are present
-                if start_date and end_date:
-                    # Initialize SQL date variables
-                    start_date_sql = None
-                    end_date_sql = None
-                    
-                    # Convert any ISO format dates to SQL format before returning
-                    if 'T' in start_date:
-                        parsed_date = parse(start_date)
-                        start_date_sql = parsed_date.strftime("%Y-%m-%d %H:%M:%S")
-                        events.append(SlotSet("start_date", start_date_sql))
-                        logger.info(f"Converted ISO start_date to SQL format: {start_date_sql}")
+            try:
+                with timer.stage("uuid_extraction"):
+                    uuid_pattern = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+                    if streamed is not None:
+                        candidates = streamed.timeseries_ids
                     else:
-                        # Keep the original if not ISO format
-                        start_date_sql = start_date
+                        candidates = [r.get("timeseriesId") for r in standardized_json.get("results", [])]
+                    timeseries_ids = [ts for ts in candidates if ts and uuid_pattern.match(ts)]
+
+                # Without timeseries IDs the answer is a summary of the SPARQL results; start it
+                # now so it overlaps with the attachment write instead of following it
+                if not timeseries_ids and tracker.get_slot("start_date") and tracker.get_slot("end_date"):
+                    summary_task = asyncio.ensure_future(timer.timed("summary", self.summarize_response(standardized_json)))
+
+                try:
+                    json_url = await attachment_task if attachment_task is not None else streamed.url
+                    dispatcher.utter_message(
+                        text="SPARQL results saved as JSON:",
+                        attachment={"type": "json", "url": json_url, "filename": filename if streamed is None else streamed.filename}
+                    )
+                except (IOError, TypeError) as e:
+                    logger.error(f"Failed to save SPARQL JSON: {e}")
+                    dispatcher.utter_message(text="Error saving SPARQL results. Inline results above.")
+
+                has_timeseries = bool(timeseries_ids)
+                logger.info(f"Has timeseries IDs: {has_timeseries}, IDs: {timeseries_ids}")
+                # Add these helpful debug logs
+                logger.info(f"Deciding path - has_timeseries: {has_timeseries}, start_date: {tracker.get_slot('start_date')}, end_date: {tracker.get_slot('end_date')}")
+                logger.info(f"Will proceed to {'timeseries processing' if has_timeseries else 'direct summary'} path")
+                is_auto_date = False
+                now = datetime.now()
+                today_str = now.strftime("%Y-%m-%d")
+                today_time_str = now.strftime("%Y-%m-%d %H:%M:%S")
+                midnight_str = f"{today_str} 00:00:00"
+
+                # After extracting timeseries_ids:
+                events = [SlotSet("sparql_error", False)]
+                if has_timeseries:
+                    events.append(SlotSet("timeseries_ids", timeseries_ids))
+                    dispatcher.utter_message(text=f"Found timeseries IDs: {timeseries_ids}")
+            
+                    # Add these lines to define the missing variables
+                    start_date = tracker.get_slot("start_date")
+                    end_date = tracker.get_slot("end_date")
+
+                    # Add after checking if both dates are present
+                    if start_date and end_date:
+                        # Initialize SQL date variables
+                        start_date_sql = None
+                        end_date_sql = None
+                    
+                        # Convert any ISO format dates to SQL format before returning
+                        if 'T' in start_date:
+                            parsed_date = parse(start_date)
+                            start_date_sql = parsed_date.strftime("%Y-%m-%d %H:%M:%S")
+                            events.append(SlotSet("start_date", start_date_sql))
+                            logger.info(f"Converted ISO start_date to SQL format: {start_date_sql}")
+                        else:
+                            # Keep the original if not ISO format
+                            start_date_sql = start_date
                         
-                    if 'T' in end_date:
-                        parsed_date = parse(end_date)
-                        end_date_sql = parsed_date.strftime("%Y-%m-%d %H:%M:%S")
-                        events.append(SlotSet("end_date", end_date_sql))
-                        logger.info(f"Converted ISO start_date to SQL format: {end_date_sql}")
-                    else:
-                        end_date_sql = end_date
+                        if 'T' in end_date:
+                            parsed_date = parse(end_date)
+                            end_date_sql = parsed_date.strftime("%Y-%m-%d %H:%M:%S")
+                            events.append(SlotSet("end_date", end_date_sql))
+                            logger.info(f"Converted ISO start_date to SQL format: {end_date_sql}")
+                        else:
+                            end_date_sql = end_date
                        
                     
-                    # Add right before the summary is generated (around line 741):
-                    logger.info("==================== Date Debug Information ====================")
-                    logger.info(f"Final tracker start_date before summarization: {tracker.get_slot('start_date')}")
-                    logger.info(f"Final tracker end_date before summarization: {tracker.get_slot('end_date')}")
-                    logger.info(f"Final start_date before summarization: {start_date_sql if 'start_date_sql' in locals() else tracker.get_slot('start_date')}")
-                    logger.info(f"Final end_date before summarization: {end_date_sql if 'end_date_sql' in locals() else tracker.get_slot('end_date')}")
-                    logger.info(f"Auto-generated dates: {is_auto_date}")
-                    logger.info("===============================================================")
-
-                    # summary = self.summarize_response(standardized_json)
-                    # if summary:
-                    #     logger.info(f"Generated SPARQL summary: {summary}")
-                    #     dispatcher.utter_message(text=f"Summary: {summary}")
-                    # else:
-                    #     logger.debug("No summary generated for SPARQL results")
-
-                    return events
+                        # Add right before the summary is generated (around line 741):
+                        logger.info("==================== Date Debug Information ====================")
+                        logger.info(f"Final tracker start_date before summarization: {tracker.get_slot('start_date')}")
+                        logger.info(f"Final tracker end_date before summarization: {tracker.get_slot('end_date')}")
+                        logger.info(f"Final start_date before summarization: {start_date_sql if 'start_date_sql' in locals() else tracker.get_slot('start_date')}")
+                        logger.info(f"Final end_date before summarization: {end_date_sql if 'end_date_sql' in locals() else tracker.get_slot('end_date')}")
+                        logger.info(f"Auto-generated dates: {is_auto_date}")
+                        logger.info("===============================================================")
+
+                        # summary = self.summarize_response(standardized_json)
+                        # if summary:
+                        #     logger.info(f"Generated SPARQL summary: {summary}")
+                        #     dispatcher.utter_message(text=f"Summary: {summary}")
+                        # else:
+                        #     logger.debug("No summary generated for SPARQL results")
+
+                        return events
+                    else:
+                        # If dates are missing, use the form to collect them
+                        dispatcher.utter_message(response="utter_ask_start_date")
+                        events.append({"event": "active_loop", "name": "dates_form"})
+                        return events
                 else:
-                    # If dates are missing, use the form to collect them
-                    dispatcher.utter_message(response="utter_ask_start_date")
-                    events.append({"event": "active_loop", "name": "dates_form"})
-                    return events
-            else:
-                # Instead of always asking for dates, first check if dates are already available
-                start_date = tracker.get_slot("start_date")
-                end_date = tracker.get_slot("end_date")
+                    # Instead of always asking for dates, first check if dates are already available
+                    start_date = tracker.get_slot("start_date")
+                    end_date = tracker.get_slot("end_date")
                 
-                # If dates are available, summarize the SPARQL results
-                if start_date and end_date:
-                    logger.info(f"No timeseries IDs found, but dates are available. Generating summary from SPARQL results.")
-                    # Generate summary directly from standardized_json without timeseries processing
-                    summary = self.summarize_response(standardized_json)
-                    if summary:
-                        logger.info(f"Generated SPARQL summary (without timeseries): {summary}")
-                        dispatcher.utter_message(text=f"Summary: {summary}")
+                    # If dates are available, summarize the SPARQL results
+                    if start_date and end_date:
+                        logger.info(f"No timeseries IDs found, but dates are available. Generating summary from SPARQL results.")
+                        # Generate summary directly from standardized_json without timeseries processing
+                        summary = await summary_task
+                        if summary:
+                            logger.info(f"Generated SPARQL summary (without timeseries): {summary}")
+                            dispatcher.utter_message(text=f"Summary: {summary}")
+                        else:
+                            logger.debug("No summary generated for SPARQL results")
+                            dispatcher.utter_message(text="I found information based on your query, but couldn't generate a summary.")
                     else:
-                        logger.debug("No summary generated for SPARQL results")
-                        dispatcher.utter_message(text="I found information based on your query, but couldn't generate a summary.")
-                else:
-                    # If no dates, ask for them (original behavior)
-                    dispatcher.utter_message(response="utter_ask_start_date")
-                    events.append({"event": "active_loop", "name": "dates_form"})
+                        # If no dates, ask for them (original behavior)
+                        dispatcher.utter_message(response="utter_ask_start_date")
+                        events.append({"event": "active_loop", "name": "dates_form"})
                 
-                return events
+                    return events
+            finally:
+                # An error above must not leave the attachment write or the summary running unawaited
+                for task in (attachment_task, summary_task):
+                    if task is not None and not task.done():
+                        task.cancel()
             
 class ActionDebugEntities(Action):
     def name(self) -> Text:
@@ -982,63 +1049,47 @@ class ActionProcessTimeseries(Action):
             logger.error(f"Unexpected error: {e}")
             return None, f"Unexpected error: {str(e)}"
 
-    def load_sensor_mappings(self) -> Dict[str, str]:
-        mappings = {}
-        try:
-            with open("./actions/sensor_mappings.txt", "r") as f:
-                for line_num, line in enumerate(f, 1):
-                    try:
-                        if line.strip():
-                            parts = line.strip().split(",")
-                            if len(parts) == 2:
-                                name, uuid = parts
-                                # Store both directions for flexible lookup
-                                mappings[name] = uuid  # For validation of names
-                                mappings[uuid] = name  # For converting UUIDs to names
-                            else:
-                                logger.warning(f"Line {line_num}: Invalid format - expected 'name,uuid' but got: {line.strip()}")
-                    except Exception as e:
-                        logger.error(f"Error on line {line_num}: {e}")
-            logger.info(f"Loaded {len(mappings)} sensor mappings")
-        except FileNotFoundError:
-            logger.error("sensor_mappings.txt not found")
-            # Create an empty file to prevent future errors
-            try:
-                os.makedirs("./actions", exist_ok=True)
-                with open("./actions/sensor_mappings.txt", "w") as f:
-                    f.write("# Format: sensor_name,sensor_uuid\n")
-                logger.info("Created empty sensor_mappings.txt file")
-            except Exception as e:
-                logger.error(f"Failed to create empty sensor_mappings.txt: {e}")
-        return mappings
-
-    def replace_uuids_with_sensor_types(self, data: Any, uuid_to_sensor: Dict[Text, Text]) -> Any:
-            """Recursively replace UUIDs with sensor types in the data structure."""
-            if isinstance(data, dict):
-                return {k: self.replace_uuids_with_sensor_types(v, uuid_to_sensor) for k, v in data.items()}
-            elif isinstance(data, list):
-                return [self.replace_uuids_with_sensor_types(item, uuid_to_sensor) for item in data]
-            elif isinstance(data, str) and data in uuid_to_sensor:
-                return uuid_to_sensor[data]
-            return data
-
-    def query_analytics_type(self, url: str, prompt: str) -> List[str]:
+    async def query_analytics_type(self, url: str, prompt: str) -> List[str]:
             """Query the T5 model endpoint to retrieve analytics types."""
-            headers = {"Content-Type": "application/json"}
             payload = {"prompt": prompt}
             try:
-                response = requests.post(url, json=payload, headers=headers, timeout=20)
-                response.raise_for_status()
-                analytics_types = response.json()
+                analytics_types = await service_client.post_json("analytics_type", url, payload, timeout=NL2SPARQL_TIMEOUT)
                 if isinstance(analytics_types, list):
                     return analytics_types
                 logger.error(f"Unexpected response format from T5 endpoint: {analytics_types}")
                 return []
-            except requests.exceptions.RequestException as e:
+            except (httpx.HTTPError, ValueError, CircuitOpenError) as e:
                 logger.error(f"Failed to query T5 endpoint: {e}")
                 return []
 
-    def summarize_response(self, standardized_json: Dict) -> Text:
+    async def query_analytics_service(self, analytics_type: str, sensor_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Runs an analysis through the analytics microservice over HTTP.
+
+        :return: The service's JSON response (including {"error": ...} bodies), or None if
+                 the service could not be reached or returned something that is not JSON.
+        """
+        payload = {
+            "analysis_type": analytics_type,
+            **sensor_data  # Expand the dictionary directly into the payload
+        }
+        try:
+            return await service_client.post_json("analytics", ANALYTICS_URL, payload, timeout=ANALYTICS_TIMEOUT)
+        except httpx.HTTPStatusError as e:
+            # The analytics service reports its own errors as JSON with a 4xx/5xx status
+            try:
+                return e.response.json()
+            except ValueError:
+                logger.error(f"Analytics service returned {e.response.status_code} without a JSON body")
+                return None
+        except ValueError as e:
+            logger.error(f"Invalid JSON response from analytics service: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Failed to query analytics service: {e}")
+            return None
+
+    async def summarize_response(self, standardized_json: Dict) -> Text:
         """
         Generate a summary using the Mistral model based on the standardized JSON.
 
@@ -1057,43 +1108,17 @@ class ActionProcessTimeseries(Action):
         if "analysis_type" in standardized_json:
             logger.info(f"Analysis type: {standardized_json.get('analysis_type')}")
         
-        # Check for UUIDs and their mappings in the data
-        uuid_pattern = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
-        json_str = json.dumps(standardized_json)
-        uuids_found = uuid_pattern.findall(json_str)
-        
-        # Load sensor mappings once and reuse
-        sensor_mappings = self.load_sensor_mappings()
-        logger.info(f"Loaded {len(sensor_mappings)} sensor mappings")
-        
-        if uuids_found:
-            logger.info(f"UUIDs found in analytics data: {uuids_found}")
-            # Check if we have mappings for these UUIDs
-            for uuid in uuids_found:
-                if uuid in sensor_mappings:
-                    logger.info(f"UUID {uuid} maps to sensor name: {sensor_mappings[uuid]}")
-                else:
-                    logger.info(f"UUID {uuid} has no mapping in sensor_mappings.txt")
-        
-        # Log a sample of the JSON (truncated if too large)
-        sample_json = json.dumps(standardized_json, indent=2)
-        if len(sample_json) > 500:
-            logger.info(f"Data sample (truncated): {sample_json[:500]}...")
-        else:
-            logger.info(f"Data sample: {sample_json}")
-        logger.info("===============================================================")
+        # One pass replaces known UUIDs (keys and values) and collects every UUID seen
+        processed_json, uuids_found = sensor_registry.translate(standardized_json)
+        log_uuid_mappings(uuids_found, "analytics data")
 
         question = standardized_json.get("question", "")
-        
-        # Replace any UUIDs with sensor names in the data before generating the prompt
-        processed_json = standardized_json
-        if uuids_found and sensor_mappings:
-            processed_json = self.replace_uuids_with_sensor_types(standardized_json, sensor_mappings)
-            logger.info("Replaced UUIDs with sensor names in data for summary")
-            
         sparql_response = json.dumps(processed_json, indent=2)
+        log_data_sample(sparql_response)
         logger.debug(f"Summarization input - question: {question}")
         logger.debug(f"Summarization input - analytics response: {sparql_response}")
+        return await generate_summary(question, sparql_response)
+
     async def run(
         self,
         dispatcher: CollectingDispatcher,
@@ -1217,18 +1242,24 @@ class ActionProcessTimeseries(Action):
             "database": os.getenv("DB_NAME", "sensordb"),
             "user": os.getenv("DB_USER", "root"),
             "password": os.getenv("DB_PASSWORD", "root"),
-            "port": os.getenv("DB_PORT", "3306")
+            "port": os.getenv("DB_PORT", "3306"),
+            "connection_timeout": int(SQL_TIMEOUT),
         }
         logger.info(f"SQL Query will use dates: {start_date_sql} to {end_date_sql}")
-        sql_results, error = self.fetch_sql_data(
-            timeseries_ids=timeseries_ids,
-            start_date=start_date_sql,
-            end_date=end_date_sql,
-            database="sensordb",
-            table_name="sensor_data",
-            db_config=db_config,
-            return_json=True
-        )
+        try:
+            sql_results, error = await run_blocking(
+                self.fetch_sql_data,
+                timeout=SQL_TIMEOUT,
+                timeseries_ids=timeseries_ids,
+                start_date=start_date_sql,
+                end_date=end_date_sql,
+                database="sensordb",
+                table_name="sensor_data",
+                db_config=db_config,
+                return_json=False
+            )
+        except asyncio.TimeoutError:
+            sql_results, error = None, f"SQL query timed out after {SQL_TIMEOUT}s"
         if error:
             logger.error(f"SQL query failed: {error}")
             dispatcher.utter_message(text=f"Failed to retrieve SQL data: {error}")
@@ -1239,61 +1270,52 @@ class ActionProcessTimeseries(Action):
             return []
 
         dispatcher.utter_message(text="SQL query executed successfully.")
-        static_folder = os.getenv("STATIC_FOLDER", ATTACHMENTS_DIR)
-        base_url = os.getenv("BASE_URL", "http://localhost:8000")
-        os.makedirs(static_folder, exist_ok=True)
-        timestamp = int(time.time())
-        filename = f"sql_results_{timestamp}.json"
-        file_path = os.path.join(static_folder, filename)
+        # The attachment is compressed and written in the background while analytics run
+        filename = f"sql_results_{int(time.time())}.json"
+        attachment_task = asyncio.ensure_future(get_attachment_store().save(sql_results, filename))
+
+        analytics_type = "analyze_device_deviation"
+        logger.info(f"Using analytics_type: {analytics_type} (default for testing)")
+        analytics_response = None
+        if inprocess_enabled():
+            try:
+                analytics_response = await run_blocking(
+                    run_inprocess_analysis, analytics_type, sql_results, timeout=ANALYTICS_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.error(f"In-process analytics timed out after {ANALYTICS_TIMEOUT}s")
+                analytics_response = {"error": f"Analysis {analytics_type} timed out"}
+            if analytics_response is not None:
+                logger.info(f"Analytics {analytics_type} computed in-process")
+        if analytics_response is None:
+            analytics_response = await self.query_analytics_service(analytics_type, sql_results)
+
         try:
-            with open(file_path, "w") as f:
-                json.dump(json.loads(sql_results), f, indent=2)
-            json_url = f"{base_url}/{filename}"
+            json_url = await attachment_task
             dispatcher.utter_message(
                 text="SQL query results saved as JSON:",
                 attachment={"type": "json", "url": json_url, "filename": filename}
             )
-            # dispatcher.utter_message(text=f"SQL query results:\n{json.dumps(json.loads(sql_results), indent=2)}")
-            logger.info(f"SQL results saved to {file_path}")
+            logger.info(f"SQL results saved as {filename}")
         except (IOError, TypeError) as e:
             logger.error(f"Failed to save SQL JSON: {e}")
             dispatcher.utter_message(text="Error saving SQL results. Inline results above.")
 
-        analytics_type = "analyze_device_deviation"
-        logger.info(f"Using analytics_type: {analytics_type} (default for testing)")
-        ANALYTICS_URL = "http://microservices:6000/analytics/run"
-        # Parse the SQL results from string to dictionary
-        sql_results_dict = json.loads(sql_results)
-        payload = {
-            "analysis_type": analytics_type,
-            **sql_results_dict  # Expand the dictionary directly into the payload
-        }
-        try:
-            analytics_response = requests.post(ANALYTICS_URL, json=payload, timeout=30)
-            try:
-                analytics_response = analytics_response.json()
-                if "error" in analytics_response:
-                    logger.error(f"Analytics error: {analytics_response['error']}")
-                    dispatcher.utter_message(text=f"Analytics error: {analytics_response['error']}")
-                else:
-                    dispatcher.utter_message(text="Analytics results:")
-                    dispatcher.utter_message(text=json.dumps(analytics_response, indent=2))
-                    logger.info(f"Analytics response: {analytics_response}")
-            except ValueError as e:
-                logger.error(f"Invalid JSON response from analytics service: {e}")
-                dispatcher.utter_message(text="Error: Invalid response format from analytics service")
-        except Exception as e:
-            logger.error(f"Failed to query analytics service: {e}")
+        if analytics_response is None:
             dispatcher.utter_message(text="Error querying analytics service.")
+            analytics_response = {}
+        elif "error" in analytics_response:
+            logger.error(f"Analytics error: {analytics_response['error']}")
+            dispatcher.utter_message(text=f"Analytics error: {analytics_response['error']}")
+        else:
+            dispatcher.utter_message(text="Analytics results:")
+            dispatcher.utter_message(text=json.dumps(analytics_response, indent=2, default=str))
+            logger.info(f"Analytics response: {analytics_response}")
         # start performing pre-processing for summary
-        uuid_to_sensor = self.load_sensor_mappings()
-        if not uuid_to_sensor:
+        if not sensor_registry.uuid_to_name:
             dispatcher.utter_message(text="Error: Could not load sensor mappings. Using raw analytics data for summarization.")
-        else:
-            analytics_response = self.replace_uuids_with_sensor_types(analytics_response, uuid_to_sensor)
-            logger.info(f"Modified analytics response with sensor types: {analytics_response}")
-        # start performing summary
-        summary = self.summarize_response(analytics_response)
+        # start performing summary (UUIDs are replaced with sensor names there)
+        summary = await self.summarize_response(analytics_response)
         logger.info(f"Generated summary: {summary}")
         dispatcher.utter_message(text=f"Summary: {summary}" if summary else "Unable to generate summary.")
 
@@ -1333,6 +1355,11 @@ class ActionTestConnection(Action):
     ) -> List[Dict[Text, Any]]:
         # Introduce the media test with a text message
         dispatcher.utter_message(text="✅ The action server is working!")
+        endpoint_stats = service_client.stats()
+        if endpoint_stats:
+            logger.info(f"Outbound endpoint latency: {endpoint_stats}")
+            dispatcher.utter_message(text=f"Outbound endpoint latency:\n{json.dumps(endpoint_stats, indent=2)}")
+        dispatcher.utter_message(text=f"SPARQL result cache: {json.dumps(sparql_cache.stats())}")
         # dispatcher.utter_message(text="Testing various media types:")
 
         # # Log working directory
@@ -0,0 +1,178 @@
+"""
+Attachment storage for the JSON files the actions share with the chat UI.
+
+Each attachment is serialised once and written next to precompressed copies
+(`.json.gz`, plus `.json.br` when the brotli module is installed) so the static
+server can answer `Accept-Encoding` requests without compressing on the fly.
+SQL result attachments are mostly repeated keys and shrink roughly 10x.
+
+Writes go through the blocking executor: callers start `save()` as a task and
+await it only when they need the URL, so disk I/O and compression overlap with
+the rest of the action instead of sitting in the request path.
+"""
+import gzip
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Dict, Optional, Tuple
+
+from .blocking import run_blocking
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always written
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENTS_DIR = "/app/actions/static/attachments"
+GZIP_LEVEL = int(os.getenv("ATTACHMENT_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("ATTACHMENT_BROTLI_QUALITY", "5"))
+SUFFIX_ENCODINGS = {"": "identity", ".gz": "gzip", ".br": "br"}
+
+
+def _atomic_write(path: str, payload: bytes) -> None:
+    """Writes via a temp file + rename so the server never serves a half-written file."""
+    folder = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class AttachmentStore:
+    def __init__(self, folder: str, base_url: str):
+        self.folder = folder
+        self.base_url = base_url.rstrip("/")
+
+    def url_for(self, filename: str) -> str:
+        return f"{self.base_url}/{filename}"
+
+    def write(self, data: Any, filename: str) -> Dict[str, int]:
+        """
+        Serialises `data` and writes the plain and precompressed variants.
+
+        Returns the size in bytes of each variant written. Blocking; raises
+        IOError/TypeError if the data cannot be serialised or written.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        raw = json.dumps(data, indent=2).encode("utf-8")
+        path = os.path.join(self.folder, filename)
+
+        variants = {"identity": raw, "gzip": gzip.compress(raw, compresslevel=GZIP_LEVEL)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(raw, quality=BROTLI_QUALITY)
+
+        # Compressed copies first, so the plain file (which the server keys on)
+        # only appears once every variant is in place
+        suffixes = {"gzip": ".gz", "br": ".br"}
+        for encoding, suffix in suffixes.items():
+            if encoding in variants:
+                _atomic_write(path + suffix, variants[encoding])
+        _atomic_write(path, raw)
+
+        sizes = {encoding: len(payload) for encoding, payload in variants.items()}
+        logger.info(f"Saved attachment {filename}: {sizes}")
+        return sizes
+
+    def open_stream(self, filename: str, header: Dict[str, Any]) -> "AttachmentStream":
+        """Starts an attachment of the form {**header, "results": [rows...]} written row by row."""
+        os.makedirs(self.folder, exist_ok=True)
+        return AttachmentStream(os.path.join(self.folder, filename), header)
+
+    async def save(self, data: Any, filename: str) -> str:
+        """Writes the attachment on the blocking executor and returns its public URL."""
+        await run_blocking(self.write, data, filename)
+        return self.url_for(filename)
+
+
+class AttachmentStream:
+    """
+    Incremental writer for large result attachments.
+
+    Rows are serialised one at a time and fed to the plain file and to the gzip
+    (and brotli) compressors as they arrive, so the full result set never has to
+    be held in memory. Everything is written to temp files that are renamed into
+    place on close(), compressed variants first, like AttachmentStore.write().
+    Blocking; use from the executor.
+    """
+
+    def __init__(self, path: str, header: Dict[str, Any]):
+        self.path = path
+        self.rows = 0
+        self._outputs: Dict[str, Tuple[str, Any]] = {}
+        self._gzip: Optional[gzip.GzipFile] = None
+        self._brotli = None
+        try:
+            for suffix in ("", ".gz") + ((".br",) if brotli is not None else ()):
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+                self._outputs[suffix] = (tmp_path, os.fdopen(fd, "wb"))
+            self._gzip = gzip.GzipFile(fileobj=self._outputs[".gz"][1], mode="wb", compresslevel=GZIP_LEVEL)
+            if brotli is not None:
+                self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        except BaseException:
+            self.abort()
+            raise
+        fields = "".join(f"  {json.dumps(key)}: {json.dumps(value)},\n" for key, value in header.items())
+        self._emit(f"{{\n{fields}  \"results\": [".encode("utf-8"))
+
+    def _emit(self, data: bytes) -> None:
+        self._outputs[""][1].write(data)
+        self._gzip.write(data)
+        if self._brotli is not None:
+            self._outputs[".br"][1].write(self._brotli.process(data))
+
+    def write_row(self, row: Any) -> None:
+        separator = ",\n    " if self.rows else "\n    "
+        self._emit((separator + json.dumps(row)).encode("utf-8"))
+        self.rows += 1
+
+    def close(self) -> Dict[str, int]:
+        """Finishes every variant and moves it into place; returns the size of each."""
+        self._emit(b"\n  ]\n}\n" if self.rows else b"]\n}\n")
+        self._gzip.close()
+        if self._brotli is not None:
+            self._outputs[".br"][1].write(self._brotli.finish())
+        sizes = {}
+        for suffix, (tmp_path, f) in self._outputs.items():
+            f.close()
+            os.chmod(tmp_path, 0o644)
+            sizes[SUFFIX_ENCODINGS[suffix]] = os.path.getsize(tmp_path)
+        for suffix in (".gz", ".br", ""):
+            if suffix in self._outputs:
+                os.replace(self._outputs[suffix][0], self.path + suffix)
+        self._outputs = {}
+        logger.info(f"Saved streamed attachment {os.path.basename(self.path)} ({self.rows} rows): {sizes}")
+        return sizes
+
+    def abort(self) -> None:
+        for tmp_path, f in self._outputs.values():
+            f.close()
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        self._outputs = {}
+
+    def __enter__(self) -> "AttachmentStream":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def get_attachment_store() -> AttachmentStore:
+    """Store configured from STATIC_FOLDER / BASE_URL (read per call, as the actions always have)."""
+    return AttachmentStore(
+        os.getenv("STATIC_FOLDER", ATTACHMENTS_DIR),
+        os.getenv("BASE_URL", "http://localhost:8000"),
+    )
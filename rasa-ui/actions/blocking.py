@@ -0,0 +1,30 @@
+"""
+Bounded executor for blocking work done on behalf of the async actions.
+
+SPARQLWrapper, mysql.connector, file writes and CPU-heavy analytics all block;
+running them here keeps the action server's event loop free to serve other
+conversations.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+ACTION_EXECUTOR_WORKERS = int(os.getenv("ACTION_EXECUTOR_WORKERS", "8"))
+BLOCKING_EXECUTOR = ThreadPoolExecutor(
+    max_workers=ACTION_EXECUTOR_WORKERS, thread_name_prefix="action-io"
+)
+
+
+async def run_blocking(func: Callable, *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+    """
+    Runs a blocking call on BLOCKING_EXECUTOR and awaits it with a timeout.
+
+    Raises asyncio.TimeoutError if the call does not finish within `timeout` seconds.
+    The worker thread is not interrupted, so blocking clients should also carry
+    their own socket timeouts.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    return await asyncio.wait_for(loop.run_in_executor(BLOCKING_EXECUTOR, call), timeout)
@@ -0,0 +1,435 @@
+"""
+In-process index of the Brick building model.
+
+The TTL file (BRICK_MODEL_TTL) is parsed once in a background thread when the
+action server starts and indexed three ways (subject -> predicate -> objects,
+predicate -> object -> subjects, object -> (subject, predicate)), plus adjacency
+maps for the relations most questions are about: hasPoint/isPointOf,
+hasLocation/isLocationOf and the ref:hasExternalReference -> hasTimeseriesId
+timeseries references.
+
+`answer_locally()` answers the simple query shapes NL2SPARQL produces, i.e.
+`SELECT [DISTINCT] ?vars WHERE { <triple patterns> } [LIMIT n]` with no FILTER,
+OPTIONAL, UNION, property paths or sub-queries, straight from those indexes and
+returns standard SPARQL JSON results. Anything else, or any query arriving before
+the model is loaded, returns None and goes to Fuseki as before. Only asserted
+triples are matched (no inverse inference), so answers are the same as Fuseki's
+for the same model file.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.namespace import RDF
+
+from .sparql_prefixes import NAMESPACES
+
+logger = logging.getLogger(__name__)
+
+BRICK_MODEL_TTL = os.getenv("BRICK_MODEL_TTL", "./actions/abacws-building-v5-copy.ttl")
+# "1" answers simple query shapes from the local model; "0" sends everything to Fuseki
+BRICK_LOCAL_QUERIES = os.getenv("BRICK_LOCAL_QUERIES", "1") == "1"
+
+BRICK = NAMESPACES["brick"]
+REF = NAMESPACES["ref"]
+HAS_POINT = URIRef(BRICK + "hasPoint")
+IS_POINT_OF = URIRef(BRICK + "isPointOf")
+HAS_LOCATION = URIRef(BRICK + "hasLocation")
+IS_LOCATION_OF = URIRef(BRICK + "isLocationOf")
+HAS_EXTERNAL_REFERENCE = URIRef(REF + "hasExternalReference")
+HAS_TIMESERIES_ID = URIRef(REF + "hasTimeseriesId")
+STORED_AT = URIRef(REF + "storedAt")
+
+Term = Union[URIRef, Literal, BNode]
+Pattern = Tuple[Any, Any, Any]  # each position is a Term or a Variable
+
+TOKEN_PATTERN = re.compile(
+    r"""\s*(?:
+        (?P<iri><[^<>\s]*>)
+      | (?P<var>[?$][A-Za-z_]\w*)
+      | (?P<pname>[A-Za-z][\w\-]*:(?:[\w\-%]|\.(?=[\w\-%]))*)
+      | (?P<literal>"(?:[^"\\\n]|\\.)*"(?:@[A-Za-z][A-Za-z0-9\-]*)?)
+      | (?P<number>\d+)
+      | (?P<punct>[{}.;,*])
+      | (?P<word>[A-Za-z]+)
+    )""",
+    re.VERBOSE,
+)
+
+
+class Variable(str):
+    """A query variable name (without the leading ?)."""
+
+
+class SelectPlan:
+    def __init__(self, projection: Optional[List[str]], patterns: List[Pattern], distinct: bool, limit: Optional[int]):
+        self.projection = projection  # None for SELECT *
+        self.patterns = patterns
+        self.distinct = distinct
+        self.limit = limit
+
+    @property
+    def variables(self) -> List[str]:
+        if self.projection is not None:
+            return self.projection
+        seen: List[str] = []
+        for pattern in self.patterns:
+            for term in pattern:
+                if isinstance(term, Variable) and term not in seen:
+                    seen.append(term)
+        return seen
+
+
+def _tokenize(query: str) -> Optional[List[Tuple[str, str]]]:
+    tokens = []
+    pos, end = 0, len(query.rstrip())
+    while pos < end:
+        match = TOKEN_PATTERN.match(query, pos)
+        if not match or match.end() == pos:
+            return None
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        pos = match.end()
+    return tokens
+
+
+def parse_select(query: str) -> Optional[SelectPlan]:
+    """Parses a basic-graph-pattern SELECT query; returns None for anything more complex."""
+    tokens = _tokenize(query)
+    if not tokens:
+        return None
+    namespaces = dict(NAMESPACES)
+    i = 0
+
+    def peek(kind: str, value: Optional[str] = None) -> bool:
+        if i >= len(tokens) or tokens[i][0] != kind:
+            return False
+        return value is None or tokens[i][1].upper() == value
+
+    def term(token: Tuple[str, str]) -> Any:
+        kind, value = token
+        if kind == "var":
+            return Variable(value[1:])
+        if kind == "iri":
+            return URIRef(value[1:-1])
+        if kind == "pname":
+            prefix, _, local = value.partition(":")
+            namespace = namespaces.get(prefix)
+            return URIRef(namespace + local) if namespace is not None else None
+        if kind == "literal":
+            body, _, lang = value[1:].rpartition('"')
+            body = body.replace('\\"', '"').replace("\\\\", "\\")
+            return Literal(body, lang=lang[1:] or None)
+        if kind == "word" and value == "a":
+            return RDF.type
+        return None
+
+    while peek("word", "PREFIX"):
+        if i + 2 >= len(tokens) or tokens[i + 1][0] != "pname" or tokens[i + 2][0] != "iri":
+            return None
+        namespaces[tokens[i + 1][1].rstrip(":")] = tokens[i + 2][1][1:-1]
+        i += 3
+
+    if not peek("word", "SELECT"):
+        return None
+    i += 1
+    distinct = peek("word", "DISTINCT")
+    if distinct:
+        i += 1
+    projection: Optional[List[str]] = []
+    if peek("punct", "*"):
+        projection = None
+        i += 1
+    else:
+        while peek("var"):
+            projection.append(tokens[i][1][1:])
+            i += 1
+        if not projection:
+            return None
+    if peek("word", "WHERE"):
+        i += 1
+    if not peek("punct", "{"):
+        return None
+    i += 1
+
+    patterns: List[Pattern] = []
+    while True:
+        if peek("punct", "}"):
+            i += 1
+            break
+        if i >= len(tokens):
+            return None
+        subject = term(tokens[i])
+        i += 1
+        if subject is None or isinstance(subject, Literal):
+            return None
+        while True:
+            if i >= len(tokens):
+                return None
+            predicate = term(tokens[i])
+            i += 1
+            if predicate is None or isinstance(predicate, Literal):
+                return None
+            while True:
+                if i >= len(tokens):
+                    return None
+                obj = term(tokens[i])
+                i += 1
+                if obj is None:
+                    return None
+                patterns.append((subject, predicate, obj))
+                if peek("punct", ","):
+                    i += 1
+                    continue
+                break
+            if peek("punct", ";"):
+                i += 1
+                # A trailing ';' before '.' or '}' is allowed
+                if peek("punct", ".") or peek("punct", "}"):
+                    break
+                continue
+            break
+        if peek("punct", "."):
+            i += 1
+        elif not peek("punct", "}"):
+            return None
+
+    limit = None
+    if peek("word", "LIMIT"):
+        if i + 1 >= len(tokens) or tokens[i + 1][0] != "number":
+            return None
+        limit = int(tokens[i + 1][1])
+        i += 2
+    if i != len(tokens) or not patterns:
+        return None
+    return SelectPlan(projection, patterns, distinct, limit)
+
+
+def _to_json(value: Term) -> Dict[str, str]:
+    if isinstance(value, URIRef):
+        return {"type": "uri", "value": str(value)}
+    if isinstance(value, BNode):
+        return {"type": "bnode", "value": str(value)}
+    binding = {"type": "literal", "value": str(value)}
+    if value.language:
+        binding["xml:lang"] = value.language
+    elif value.datatype:
+        binding["datatype"] = str(value.datatype)
+    return binding
+
+
+class BrickIndex:
+    def __init__(self, graph: Graph):
+        self.spo: Dict[Term, Dict[Term, List[Term]]] = defaultdict(lambda: defaultdict(list))
+        self.pos: Dict[Term, Dict[Term, List[Term]]] = defaultdict(lambda: defaultdict(list))
+        self.osp: Dict[Term, List[Tuple[Term, Term]]] = defaultdict(list)
+        self.triples = 0
+        for s, p, o in graph:
+            self.spo[s][p].append(o)
+            self.pos[p][o].append(s)
+            self.osp[o].append((s, p))
+            self.triples += 1
+        # Freeze into plain dicts so lookups of unknown keys never insert
+        self.spo = {s: dict(by_p) for s, by_p in self.spo.items()}
+        self.pos = {p: dict(by_o) for p, by_o in self.pos.items()}
+        self.osp = dict(self.osp)
+
+        # Adjacency for the common Brick relations, with both directions merged
+        self.points: Dict[Term, Set[Term]] = defaultdict(set)
+        self.point_of: Dict[Term, Set[Term]] = defaultdict(set)
+        self.locations: Dict[Term, Set[Term]] = defaultdict(set)
+        self.located: Dict[Term, Set[Term]] = defaultdict(set)
+        for owner, point in self._pairs(HAS_POINT, IS_POINT_OF):
+            self.points[owner].add(point)
+            self.point_of[point].add(owner)
+        for thing, location in self._pairs(HAS_LOCATION, IS_LOCATION_OF):
+            self.locations[thing].add(location)
+            self.located[location].add(thing)
+
+        self.timeseries: Dict[Term, List[Tuple[str, Optional[str]]]] = defaultdict(list)
+        for ref, entities in self.pos.get(HAS_EXTERNAL_REFERENCE, {}).items():
+            ref_props = self.spo.get(ref, {})
+            stored_at = ref_props.get(STORED_AT, [None])[0]
+            for ts_id in ref_props.get(HAS_TIMESERIES_ID, []):
+                for entity in entities:
+                    self.timeseries[entity].append((str(ts_id), str(stored_at) if stored_at is not None else None))
+
+        # Materialised sensor name -> timeseries IDs view for building entities,
+        # e.g. "Air_Temperature_Sensor_5.01" -> ["<uuid>"]
+        bldg = NAMESPACES["bldg"]
+        self.timeseries_by_name: Dict[str, List[str]] = {
+            str(entity)[len(bldg):]: [ts_id for ts_id, _ in refs]
+            for entity, refs in self.timeseries.items()
+            if isinstance(entity, URIRef) and str(entity).startswith(bldg)
+        }
+
+    def _pairs(self, forward: URIRef, inverse: URIRef) -> Iterator[Tuple[Term, Term]]:
+        for o, subjects in self.pos.get(forward, {}).items():
+            for s in subjects:
+                yield s, o
+        for o, subjects in self.pos.get(inverse, {}).items():
+            for s in subjects:
+                yield o, s
+
+    @staticmethod
+    def expand(name: str) -> URIRef:
+        """Accepts `prefix:local` or a full URI."""
+        prefix, sep, local = name.partition(":")
+        if sep and prefix in NAMESPACES and not local.startswith("//"):
+            return URIRef(NAMESPACES[prefix] + local)
+        return URIRef(name)
+
+    # ---------------------------------------------------------- direct lookups
+
+    def points_of(self, entity: str) -> List[str]:
+        return sorted(str(p) for p in self.points.get(self.expand(entity), ()))
+
+    def equipment_of(self, point: str) -> List[str]:
+        return sorted(str(e) for e in self.point_of.get(self.expand(point), ()))
+
+    def location_of(self, entity: str) -> List[str]:
+        return sorted(str(loc) for loc in self.locations.get(self.expand(entity), ()))
+
+    def contents_of(self, location: str) -> List[str]:
+        return sorted(str(e) for e in self.located.get(self.expand(location), ()))
+
+    def timeseries_of(self, entity: str) -> List[Tuple[str, Optional[str]]]:
+        """(timeseriesId, storedAt) pairs of a point."""
+        return list(self.timeseries.get(self.expand(entity), ()))
+
+    def timeseries_ids_for(self, sensor_name: str) -> List[str]:
+        """Timeseries IDs of the building sensor `sensor_name` (bldg: local name)."""
+        return list(self.timeseries_by_name.get(sensor_name, ()))
+
+    # ------------------------------------------------------- query evaluation
+
+    def match(self, s: Optional[Term], p: Optional[Term], o: Optional[Term]) -> Iterator[Tuple[Term, Term, Term]]:
+        if s is not None:
+            by_p = self.spo.get(s, {})
+            predicates = [(p, by_p.get(p, ()))] if p is not None else by_p.items()
+            for pred, objects in predicates:
+                for obj in objects:
+                    if o is None or obj == o:
+                        yield s, pred, obj
+        elif p is not None:
+            by_o = self.pos.get(p, {})
+            objects = [(o, by_o.get(o, ()))] if o is not None else by_o.items()
+            for obj, subjects in objects:
+                for subj in subjects:
+                    yield subj, p, obj
+        elif o is not None:
+            for subj, pred in self.osp.get(o, ()):
+                yield subj, pred, o
+
+    def evaluate(self, plan: SelectPlan) -> Optional[Dict[str, Any]]:
+        """Evaluates the plan; returns None if a pattern would need a full scan."""
+        solutions: List[Dict[str, Term]] = [{}]
+        remaining = list(plan.patterns)
+        bound: Set[str] = set()
+
+        def selectivity(pattern: Pattern) -> int:
+            # A bound subject narrows the most (a handful of triples per entity),
+            # then a bound object; a bound predicate alone can still mean thousands
+            weights = (4, 1, 2)
+            return sum(w for w, t in zip(weights, pattern) if not isinstance(t, Variable) or t in bound)
+
+        while remaining and solutions:
+            pattern = max(remaining, key=selectivity)
+            remaining.remove(pattern)
+            if selectivity(pattern) == 0:
+                return None
+
+            next_solutions = []
+            for solution in solutions:
+                resolved = [solution.get(t) if isinstance(t, Variable) else t for t in pattern]
+                for triple in self.match(*resolved):
+                    extended = dict(solution)
+                    consistent = True
+                    for t, value in zip(pattern, triple):
+                        if isinstance(t, Variable):
+                            if extended.setdefault(t, value) != value:
+                                consistent = False
+                                break
+                    if consistent:
+                        next_solutions.append(extended)
+            solutions = next_solutions
+            bound.update(t for t in pattern if isinstance(t, Variable))
+
+        variables = plan.variables
+        bindings = []
+        seen = set()
+        for solution in solutions:
+            if plan.distinct:
+                key = tuple(solution.get(v) for v in variables)
+                if key in seen:
+                    continue
+                seen.add(key)
+            bindings.append({v: _to_json(solution[v]) for v in variables if v in solution})
+            if plan.limit is not None and len(bindings) >= plan.limit:
+                break
+        return {"head": {"vars": variables}, "results": {"bindings": bindings}}
+
+    def answer(self, query: str) -> Optional[Dict[str, Any]]:
+        plan = parse_select(query)
+        if plan is None:
+            return None
+        return self.evaluate(plan)
+
+
+_index: Optional[BrickIndex] = None
+_load_failed = False
+_load_lock = threading.Lock()
+
+
+def get_brick_index() -> Optional[BrickIndex]:
+    """Loads and indexes the model once (blocking); None if it cannot be loaded."""
+    global _index, _load_failed
+    if _index is not None or _load_failed:
+        return _index
+    with _load_lock:
+        if _index is not None or _load_failed:
+            return _index
+        try:
+            start = time.perf_counter()
+            graph = Graph()
+            graph.parse(BRICK_MODEL_TTL, format="turtle")
+            index = BrickIndex(graph)
+            _index = index
+            logger.info(
+                f"Loaded Brick model {BRICK_MODEL_TTL}: {index.triples} triples, "
+                f"{len(index.timeseries)} timeseries points in {(time.perf_counter() - start) * 1000:.0f}ms"
+            )
+        except Exception as e:
+            _load_failed = True
+            logger.error(f"Local Brick index unavailable, all queries go to Fuseki: {e}")
+    return _index
+
+
+def preload_in_background() -> None:
+    """Starts loading the model so the first question does not wait for it."""
+    if BRICK_LOCAL_QUERIES:
+        threading.Thread(target=get_brick_index, name="brick-index-loader", daemon=True).start()
+
+
+def loaded_brick_index() -> Optional[BrickIndex]:
+    """The index if it has finished loading, without waiting for it."""
+    return _index
+
+
+def answer_locally(query: str) -> Optional[Dict[str, Any]]:
+    """
+    SPARQL JSON results for `query` from the local model, or None if the query
+    must go to Fuseki (unsupported shape, local queries disabled, or the model
+    is not loaded yet). Never blocks on loading.
+    """
+    if not BRICK_LOCAL_QUERIES or _index is None:
+        return None
+    try:
+        return _index.answer(query)
+    except Exception as e:
+        logger.warning(f"Local query failed, using Fuseki: {e}")
+        return None
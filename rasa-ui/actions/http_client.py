@@ -0,0 +1,222 @@
+"""
+Shared HTTP client layer for the action server's outbound service calls.
+
+All calls to the NL2SPARQL translator, the analytics microservice and the
+Ollama summarizer go through one ServiceClient so that:
+
+- each host gets its own keep-alive connection pool (no TCP/TLS handshake per call),
+- transient failures (connect errors, 502/503/504) are retried with exponential backoff,
+- an endpoint that keeps failing trips a circuit breaker and is skipped until it recovers,
+- per-endpoint latency is recorded so slow hops are visible in the logs.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.25"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Responses worth retrying: the upstream (or the ngrok tunnel in front of it) is
+# briefly unavailable rather than rejecting the request
+RETRY_STATUSES = {502, 503, 504}
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is short-circuited because its endpoint is marked as down."""
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker.
+
+    closed    -> calls pass; `failure_threshold` consecutive failures open the circuit.
+    open      -> calls fail fast with CircuitOpenError for `reset_timeout` seconds.
+    half-open -> one trial call is let through; success closes, failure re-opens.
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Keeps a rolling window of call latencies (ms) and error counts per endpoint."""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self.samples: Dict[str, Deque[float]] = {}
+        self.calls: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, endpoint: str, elapsed_ms: float, ok: bool) -> None:
+        self.samples.setdefault(endpoint, deque(maxlen=self.window)).append(elapsed_ms)
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        stats = {}
+        for endpoint, samples in self.samples.items():
+            ordered = sorted(samples)
+            n = len(ordered)
+            stats[endpoint] = {
+                "calls": self.calls.get(endpoint, 0),
+                "errors": self.errors.get(endpoint, 0),
+                "p50_ms": round(ordered[n // 2], 1),
+                "p95_ms": round(ordered[min(n - 1, int(n * 0.95))], 1),
+                "max_ms": round(ordered[-1], 1),
+            }
+        return stats
+
+
+class ServiceClient:
+    """Pooled, retrying, circuit-broken HTTP client shared by all actions."""
+
+    def __init__(
+        self,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive: int = HTTP_MAX_KEEPALIVE,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        retries: int = HTTP_RETRIES,
+        backoff: float = HTTP_BACKOFF,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.retries = retries
+        self.backoff = backoff
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latency = LatencyTracker()
+
+    def _client_for(self, url: str) -> httpx.AsyncClient:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        client = self.clients.get(origin)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(limits=self.limits)
+            self.clients[origin] = client
+        return client
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        return self.breakers.setdefault(endpoint, CircuitBreaker())
+
+    async def call(self, endpoint: str, func: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """
+        Runs `func()` under the endpoint's circuit breaker and records its latency.
+
+        Used directly for clients that manage their own connections (e.g. Ollama).
+        """
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {endpoint}; skipping call")
+
+        start = time.perf_counter()
+        ok = False
+        # A 4xx means the endpoint is up and rejected this request; it must not trip the circuit
+        healthy = False
+        try:
+            result = await asyncio.wait_for(func(), timeout)
+            ok = healthy = True
+            return result
+        except httpx.HTTPStatusError as e:
+            healthy = e.response.status_code < 500
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.latency.record(endpoint, elapsed_ms, ok)
+            if healthy:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+            logger.info(f"[http] {endpoint} {'ok' if ok else 'failed'} in {elapsed_ms:.1f} ms (circuit {breaker.state})")
+
+    async def post_json(self, endpoint: str, url: str, payload: Any, timeout: float, headers: Optional[Dict[str, str]] = None) -> Any:
+        """
+        POSTs `payload` as JSON and returns the decoded JSON response.
+
+        Raises httpx.HTTPError for failed requests, ValueError for non-JSON bodies
+        and CircuitOpenError when the endpoint is currently marked as down.
+        """
+        client = self._client_for(url)
+
+        async def attempt() -> Any:
+            for attempt_no in range(self.retries + 1):
+                last_try = attempt_no == self.retries
+                try:
+                    response = await client.post(url, json=payload, headers=headers, timeout=timeout)
+                except RETRY_EXCEPTIONS as e:
+                    if last_try:
+                        raise
+                    logger.warning(f"[http] {endpoint} attempt {attempt_no + 1} failed: {e}; retrying")
+                else:
+                    if response.status_code not in RETRY_STATUSES or last_try:
+                        response.raise_for_status()
+                        return response.json()
+                    logger.warning(f"[http] {endpoint} attempt {attempt_no + 1} returned {response.status_code}; retrying")
+                await asyncio.sleep(self.backoff * (2 ** attempt_no))
+
+        return await self.call(endpoint, attempt)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Latency summary per endpoint, including the current circuit state."""
+        stats = self.latency.snapshot()
+        for endpoint, entry in stats.items():
+            entry["circuit"] = self.breaker(endpoint).state
+        return stats
+
+    async def aclose(self) -> None:
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+
+
+# Shared instance used by every action
+service_client = ServiceClient()
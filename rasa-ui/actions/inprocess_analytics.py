@@ -0,0 +1,81 @@
+"""
+In-process execution of the analytics microservice's functions.
+
+When the action server is deployed next to the microservices code (ANALYTICS_MODE=inprocess),
+ActionProcessTimeseries calls the functions in microservices/blueprints/analytics_service.py
+directly on the fetched SQL results instead of POSTing them to /analytics/run. This skips the
+network hop and the JSON encode/decode on both sides. The HTTP service stays the fallback
+whenever the module cannot be imported or the local run fails.
+"""
+import importlib.util
+import logging
+import os
+import threading
+from types import ModuleType
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# "http" (default) always uses the analytics service; "inprocess" runs the functions locally
+ANALYTICS_MODE = os.getenv("ANALYTICS_MODE", "http").lower()
+# Directory containing the microservices code (mounted into the action server container)
+ANALYTICS_MODULE_PATH = os.getenv("ANALYTICS_MODULE_PATH", "/app/microservices")
+
+_module: Optional[ModuleType] = None
+_load_failed = False
+_load_lock = threading.Lock()
+
+
+def inprocess_enabled() -> bool:
+    return ANALYTICS_MODE == "inprocess"
+
+
+def get_analytics_module() -> Optional[ModuleType]:
+    """
+    Imports analytics_service once and returns the module.
+
+    The module is loaded from its file path under a private name, so it does not
+    depend on (or pollute) sys.path. Returns None if the import fails; the failure
+    is logged once and not retried.
+    """
+    global _module, _load_failed
+    if _module is not None or _load_failed:
+        return _module
+
+    with _load_lock:
+        if _module is not None or _load_failed:
+            return _module
+        module_file = os.path.join(ANALYTICS_MODULE_PATH, "blueprints", "analytics_service.py")
+        try:
+            spec = importlib.util.spec_from_file_location("abacws_analytics_service", module_file)
+            if spec is None or spec.loader is None:
+                raise ImportError(f"No module found at {module_file}")
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _module = module
+            logger.info(f"Loaded in-process analytics from {module_file} ({len(module.analysis_functions)} analyses)")
+        except Exception as e:
+            _load_failed = True
+            logger.error(f"In-process analytics unavailable, falling back to HTTP: {e}")
+    return _module
+
+
+def run_analysis(analysis_type: str, sensor_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Runs `analysis_type` locally and returns the same envelope as /analytics/run.
+
+    Returns None when the in-process path is unavailable or the analysis raised,
+    so the caller can fall back to the HTTP service. Unknown analysis types are
+    reported as {"error": ...}, exactly as the service would.
+    This is CPU-bound; async callers should run it through run_blocking.
+    """
+    module = get_analytics_module()
+    if module is None:
+        return None
+    if analysis_type not in module.analysis_functions:
+        return {"error": f"Unknown analysis type: {analysis_type}"}
+    try:
+        return module.execute_analysis(analysis_type, sensor_data)
+    except Exception as e:
+        logger.exception(f"In-process analysis {analysis_type} failed: {e}")
+        return None
@@ -0,0 +1,51 @@
+"""
+Stage timing for the multi-step actions.
+
+A StageTimer is created per action run; each stage (translation, SPARQL query,
+attachment write, summary, ...) is timed individually, including stages that run
+concurrently, and the whole breakdown is logged once when the run finishes. The
+total is the wall-clock time of the run, i.e. the critical path, so it can be
+compared directly against the sum of the stage timings.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimer:
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """Times a synchronous block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = (time.perf_counter() - start) * 1000
+
+    async def timed(self, stage: str, awaitable: Awaitable[Any]) -> Any:
+        """Awaits `awaitable` and records how long it took; safe to wrap in a task."""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.timings[stage] = (time.perf_counter() - start) * 1000
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def log(self) -> None:
+        stages = ", ".join(f"{stage}={ms:.1f}ms" for stage, ms in self.timings.items())
+        summed = sum(self.timings.values())
+        logger.info(
+            f"[{self.name}] stage timings: {stages or 'none'} | "
+            f"sum of stages={summed:.1f}ms, wall clock={self.total_ms:.1f}ms"
+        )
@@ -0,0 +1,70 @@
+"""
+Routing rule for direct sensor -> timeseries questions.
+
+"Show me / analyse / plot <sensor> ..." questions only need the timeseries IDs of
+the sensors already resolved into the sensor_type slot. For those,
+ActionQuestionToBrickbot skips the NL2SPARQL translation and the Fuseki query and
+builds the result from a materialised sensor -> timeseriesId view: the Brick
+index's view once the model is loaded (UUID-form IDs only), otherwise the sensor
+registry. Questions about metadata (location, type, label, points, ...) and
+sensors missing from the view take the normal path.
+"""
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from .brick_index import loaded_brick_index
+from .sensor_registry import UUID_PATTERN, sensor_registry
+from .sparql_prefixes import NAMESPACES
+
+logger = logging.getLogger(__name__)
+
+DIRECT_TIMESERIES_ROUTING = os.getenv("DIRECT_TIMESERIES_ROUTING", "1") == "1"
+
+DATA_REQUEST = re.compile(
+    r"^\s*(?:(?:can|could|would)\s+you\s+|please\s+)?"
+    r"(?:show|display|plot|graph|chart|visuali[sz]e|analy[sz]e|check|detect|compute|calculate|"
+    r"aggregate|correlate|forecast|generate|get|fetch|give\s+me|"
+    r"what\s+(?:is|are|was|were)\s+the\s+(?:readings?|values?|data|trends?|average|mean|max\w*|min\w*))\b",
+    re.IGNORECASE,
+)
+METADATA_TERMS = re.compile(
+    r"\b(?:where|locat\w*|rooms?|zones?|floors?|types?|kind|labels?|class(?:es)?|points?|units?|"
+    r"belongs?|part\s+of|connected|feeds?|stored\w*|timeseries\s*ids?)\b",
+    re.IGNORECASE,
+)
+
+
+def is_direct_timeseries_request(question: str) -> bool:
+    return bool(DATA_REQUEST.match(question)) and not METADATA_TERMS.search(question)
+
+
+def direct_timeseries_ids(sensor_names: Sequence[str]) -> Optional[Dict[str, List[str]]]:
+    """Timeseries IDs for every sensor, or None if any of them is not in the view."""
+    index = loaded_brick_index()
+    view: Dict[str, List[str]] = {}
+    for name in sensor_names:
+        ids = [ts for ts in index.timeseries_ids_for(name) if UUID_PATTERN.fullmatch(ts)] if index else []
+        if not ids:
+            uuid = sensor_registry.uuid_for(name)
+            ids = [uuid] if uuid else []
+        if not ids:
+            logger.info(f"No timeseries ID known for {name}; using NL2SPARQL")
+            return None
+        view[name] = ids
+    return view or None
+
+
+def timeseries_results(view: Dict[str, List[str]]) -> Dict[str, Any]:
+    """The view as SPARQL JSON results, shaped like the timeseries lookup query's output."""
+    bldg = NAMESPACES["bldg"]
+    bindings = [
+        {
+            "sensor": {"type": "uri", "value": bldg + name},
+            "timeseriesId": {"type": "literal", "value": ts_id},
+        }
+        for name, ids in view.items()
+        for ts_id in ids
+    ]
+    return {"head": {"vars": ["sensor", "timeseriesId"]}, "results": {"bindings": bindings}}
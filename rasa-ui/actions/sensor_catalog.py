@@ -0,0 +1,324 @@
+"""
+Columnar sensor catalog for multi-building deployments.
+
+Every sensor is one row across parallel numpy columns instead of a handful of
+Python strings and dict entries:
+
+    names      fixed-width bytes, sorted (the row order)   -> searchsorted by name/prefix
+    uuids      16-byte big-endian UUIDs (128-bit integers)  -> searchsorted via uuid_order
+    building   int16 codes into `buildings`
+    floor      int16 (-1 when the name carries no floor)
+    type       int32 codes into `types` (the name without its `_<floor>.<room>` suffix)
+
+A 100k-sensor portfolio takes a few MB, and a catalog saved with `save()` is
+loaded back with `load()` without parsing any text, so the action server starts
+in milliseconds. Names handed back to callers are interned, so repeated lookups
+share one string object.
+"""
+import hashlib
+import logging
+import os
+import re
+import sys
+import uuid as uuid_module
+import zipfile
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# "<Type>_<floor>.<room>", e.g. Air_Temperature_Sensor_5.01
+NAME_PATTERN = re.compile(r"^(?P<type>.+?)_(?P<floor>\d+)\.\d+$")
+DEFAULT_BUILDING = os.getenv("SENSOR_DEFAULT_BUILDING", "abacws")
+
+Row = Tuple[str, str, str]  # (name, uuid, building)
+
+
+def _uuid_bytes(value: str) -> bytes:
+    return uuid_module.UUID(value).bytes
+
+
+def _categorical(values: Sequence[str]) -> Tuple[np.ndarray, List[str]]:
+    categories = sorted(set(values))
+    lookup = {category: code for code, category in enumerate(categories)}
+    dtype = np.int16 if len(categories) < 2 ** 15 else np.int32
+    return np.fromiter((lookup[v] for v in values), dtype=dtype, count=len(values)), categories
+
+
+class SensorCatalog:
+    def __init__(
+        self,
+        names: np.ndarray,
+        uuids: np.ndarray,
+        building: np.ndarray,
+        floor: np.ndarray,
+        type_codes: np.ndarray,
+        buildings: List[str],
+        types: List[str],
+    ):
+        self.names = names
+        self.uuids = uuids
+        self.building = building
+        self.floor = floor
+        self.type_codes = type_codes
+        self.buildings = buildings
+        self.types = types
+        # Row numbers sorted by UUID, for searchsorted on the 128-bit values
+        self.uuid_order = np.argsort(uuids, kind="stable").astype(np.int32)
+        self._sorted_uuids = uuids[self.uuid_order]
+
+    # ------------------------------------------------------------------ building
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Row]) -> "SensorCatalog":
+        """Builds the catalog from (name, uuid, building) rows; invalid UUIDs are skipped."""
+        parsed = []
+        for name, uuid, building in rows:
+            try:
+                parsed.append((name, _uuid_bytes(uuid), building))
+            except ValueError:
+                logger.warning(f"Skipping {name}: invalid UUID {uuid!r}")
+        parsed.sort(key=lambda row: (row[0], row[2]))
+
+        names = [row[0] for row in parsed]
+        width = max((len(n.encode("utf-8")) for n in names), default=1)
+        name_column = np.array([n.encode("utf-8") for n in names], dtype=f"S{width}")
+        uuid_column = np.array([row[1] for row in parsed], dtype="S16")
+
+        floors, types = [], []
+        for name in names:
+            match = NAME_PATTERN.match(name)
+            floors.append(int(match.group("floor")) if match else -1)
+            types.append(match.group("type") if match else name)
+        building_codes, buildings = _categorical([row[2] for row in parsed])
+        type_codes, type_names = _categorical(types)
+
+        return cls(
+            name_column,
+            uuid_column,
+            building_codes,
+            np.array(floors, dtype=np.int16),
+            type_codes,
+            buildings,
+            type_names,
+        )
+
+    @classmethod
+    def from_mappings_files(cls, paths: Iterable[str]) -> "SensorCatalog":
+        """
+        Loads one or more sensor_mappings.txt files (`name,uuid[,building]` per line).
+
+        Lines without a building column are assigned to the file's building: the
+        parent directory name for `<building>/sensor_mappings.txt`, otherwise
+        SENSOR_DEFAULT_BUILDING.
+        """
+        def rows():
+            for path in paths:
+                parent = os.path.basename(os.path.dirname(os.path.abspath(path)))
+                default = parent if parent not in ("", "actions") else DEFAULT_BUILDING
+                with open(path, "r") as f:
+                    for line_num, line in enumerate(f, 1):
+                        line = line.strip()
+                        if not line or line.startswith("#"):
+                            continue
+                        parts = [part.strip() for part in line.split(",")]
+                        if len(parts) == 2:
+                            yield parts[0], parts[1], default
+                        elif len(parts) == 3:
+                            yield parts[0], parts[1], parts[2]
+                        else:
+                            logger.warning(
+                                f"{path} line {line_num}: expected 'name,uuid[,building]' but got: {line}"
+                            )
+
+        return cls.from_rows(rows())
+
+    def save(self, path: str, source_digest: str = "") -> None:
+        """
+        Writes the columns to an uncompressed .npz (no pickling), via a temporary
+        file so readers never see a partial cache. `source_digest` identifies the
+        files the catalog was built from (see load_cached).
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    names=self.names,
+                    uuids=self.uuids,
+                    building=self.building,
+                    floor=self.floor,
+                    type_codes=self.type_codes,
+                    buildings=np.array(self.buildings, dtype=str),
+                    types=np.array(self.types, dtype=str),
+                    source_digest=np.array(source_digest),
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path: str, source_digest: Optional[str] = None) -> "SensorCatalog":
+        """Loads a saved catalog; raises ValueError if it was built from other files than `source_digest`."""
+        with np.load(path, allow_pickle=False) as data:
+            if source_digest is not None and str(data["source_digest"]) != source_digest:
+                raise ValueError(f"{path} was built from different source files")
+            return cls(
+                data["names"],
+                data["uuids"],
+                data["building"],
+                data["floor"],
+                data["type_codes"],
+                data["buildings"].tolist(),
+                data["types"].tolist(),
+            )
+
+    @staticmethod
+    def digest(sources: Sequence[str]) -> str:
+        """Content hash of the source files, so a cache is never trusted on mtimes alone."""
+        h = hashlib.sha1()
+        for src in sources:
+            with open(src, "rb") as f:
+                h.update(f.read())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    @classmethod
+    def load_cached(cls, sources: Sequence[str], cache_path: str) -> "SensorCatalog":
+        """
+        Loads `cache_path` if it was built from the current contents of `sources`,
+        else rebuilds and re-saves it. A missing, truncated or stale cache is rebuilt.
+        """
+        source_digest = cls.digest(sources)
+        try:
+            return cls.load(cache_path, source_digest)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            logger.info(f"Rebuilding sensor catalog cache {cache_path}: {e}")
+        catalog = cls.from_mappings_files(sources)
+        try:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            catalog.save(cache_path, source_digest)
+        except OSError as e:
+            logger.warning(f"Could not write sensor catalog cache {cache_path}: {e}")
+        return catalog
+
+    # ------------------------------------------------------------------- lookups
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return self.find(name) is not None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            column.nbytes
+            for column in (self.names, self.uuids, self.building, self.floor, self.type_codes, self.uuid_order, self._sorted_uuids)
+        )
+
+    def name(self, row: int) -> str:
+        return sys.intern(self.names[row].decode("utf-8"))
+
+    def uuid(self, row: int) -> str:
+        # numpy drops trailing NUL bytes from S16 items; pad them back
+        return str(uuid_module.UUID(bytes=bytes(self.uuids[row]).ljust(16, b"\x00")))
+
+    def find(self, name: str, building: Optional[str] = None) -> Optional[int]:
+        """Row of `name` (in `building`, if given), or None."""
+        start, end = self._name_range(name.encode("utf-8"))
+        if building is None:
+            return int(start) if start < end else None
+        if building not in self.buildings:
+            return None
+        code = self.buildings.index(building)
+        for row in range(start, end):
+            if self.building[row] == code:
+                return row
+        return None
+
+    def lookup_dicts(self, building: Optional[str] = None) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        Plain name -> UUID and UUID -> name dicts for one building (or all), for
+        hot paths that look up one string at a time, where a dict is far cheaper
+        than a searchsorted call. A name shared by buildings maps to its first row.
+        """
+        rows = range(len(self)) if building is None else self.select(building=building).tolist()
+        name_to_uuid: Dict[str, str] = {}
+        uuid_to_name: Dict[str, str] = {}
+        for row in rows:
+            name, uuid = self.name(row), self.uuid(row)
+            name_to_uuid.setdefault(name, uuid)
+            uuid_to_name.setdefault(uuid, name)
+        return name_to_uuid, uuid_to_name
+
+    def find_names(self, names: Sequence[str]) -> np.ndarray:
+        """Vectorised name lookup: row per name, -1 where unknown (first match across buildings)."""
+        encoded = [n.encode("utf-8") for n in names]
+        if not len(self.names):
+            return np.full(len(encoded), -1, dtype=np.int64)
+        # Casting to the column's width truncates longer names, which can never match
+        fits = np.array([len(key) <= self.names.itemsize for key in encoded], dtype=bool)
+        keys = np.array(encoded, dtype=self.names.dtype)
+        rows = np.minimum(np.searchsorted(self.names, keys), len(self.names) - 1)
+        hits = fits & (self.names[rows] == keys)
+        return np.where(hits, rows, -1).astype(np.int64)
+
+    def find_uuids(self, uuids: Sequence[str]) -> np.ndarray:
+        """Vectorised UUID lookup: row per UUID, -1 where unknown or malformed."""
+        parsed = [self._parse_uuid(u) for u in uuids]
+        if not len(self.uuids):
+            return np.full(len(parsed), -1, dtype=np.int64)
+        valid = np.array([key is not None for key in parsed], dtype=bool)
+        keys = np.array([key or bytes(16) for key in parsed], dtype="S16")
+        positions = np.minimum(np.searchsorted(self._sorted_uuids, keys), len(self.uuids) - 1)
+        hits = valid & (self._sorted_uuids[positions] == keys)
+        return np.where(hits, self.uuid_order[positions], -1).astype(np.int64)
+
+    def name_for_uuid(self, uuid: str) -> Optional[str]:
+        row = self.find_uuids([uuid])[0]
+        return self.name(row) if row >= 0 else None
+
+    def uuid_for_name(self, name: str, building: Optional[str] = None) -> Optional[str]:
+        row = self.find(name, building)
+        return self.uuid(row) if row is not None else None
+
+    def with_prefix(self, prefix: str) -> np.ndarray:
+        """Rows whose name starts with `prefix` (a contiguous slice, since names are sorted)."""
+        key = prefix.encode("utf-8")
+        start = np.searchsorted(self.names, key, side="left")
+        # Any name with the prefix sorts before prefix + 0xff
+        end = np.searchsorted(self.names, key + b"\xff", side="left")
+        return np.arange(start, end)
+
+    def select(self, building: Optional[str] = None, floor: Optional[int] = None, sensor_type: Optional[str] = None) -> np.ndarray:
+        """Rows matching every given attribute."""
+        mask = np.ones(len(self.names), dtype=bool)
+        if building is not None:
+            mask &= self.building == (self.buildings.index(building) if building in self.buildings else -1)
+        if floor is not None:
+            mask &= self.floor == floor
+        if sensor_type is not None:
+            mask &= self.type_codes == (self.types.index(sensor_type) if sensor_type in self.types else -1)
+        return np.flatnonzero(mask)
+
+    def _name_range(self, key: bytes) -> Tuple[int, int]:
+        if len(key) > self.names.itemsize:
+            return 0, 0
+        start = int(np.searchsorted(self.names, key, side="left"))
+        end = int(np.searchsorted(self.names, key, side="right"))
+        return start, end
+
+    @staticmethod
+    def _parse_uuid(value: str) -> Optional[bytes]:
+        try:
+            return _uuid_bytes(value)
+        except (ValueError, AttributeError, TypeError):
+            return None
@@ -0,0 +1,222 @@
+"""
+Shared, hot-reloading view of sensor_mappings.txt.
+
+The file maps sensor names to their timeseries UUIDs, one `name,uuid[,building]`
+per line. It is loaded into a SensorCatalog (see sensor_catalog.py), whose
+columns are cached in SENSOR_CATALOG_CACHE, so a restart with an unchanged file
+reads the cache instead of parsing text. The per-string lookups of the actions
+(translate_uuids runs one for every UUID-sized string in a payload) use plain
+name -> UUID and UUID -> name dicts built from the catalog for SENSOR_BUILDING
+(every building when unset); bulk and cross-building queries use the catalog.
+The file's mtime is checked at most once every `check_interval` seconds; only
+when it has changed is the catalog reloaded, and it is swapped in with its dicts
+as one immutable snapshot so concurrent readers never see a half-built registry.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+from .sensor_catalog import SensorCatalog
+
+logger = logging.getLogger(__name__)
+
+SENSOR_MAPPINGS_FILE = os.getenv("SENSOR_MAPPINGS_FILE", "./actions/sensor_mappings.txt")
+SENSOR_MAPPINGS_CHECK_INTERVAL = float(os.getenv("SENSOR_MAPPINGS_CHECK_INTERVAL", "2"))
+# Columnar cache of the same file (see sensor_catalog.py); rebuilt when the file's contents
+# change (an empty value disables the cache)
+SENSOR_CATALOG_CACHE = os.getenv("SENSOR_CATALOG_CACHE", "./actions/cache/sensor_catalog.npz")
+# Building whose sensors name_to_uuid / uuid_to_name hold (empty: every building)
+SENSOR_BUILDING = os.getenv("SENSOR_BUILDING", "")
+
+UUID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+UUID_LENGTH = 36
+
+
+class SensorSnapshot(NamedTuple):
+    catalog: SensorCatalog
+    name_to_uuid: Dict[str, str]
+    uuid_to_name: Dict[str, str]
+    mtime_ns: Optional[int]
+
+    @classmethod
+    def of(cls, catalog: SensorCatalog, mtime_ns: Optional[int], building: Optional[str] = None) -> "SensorSnapshot":
+        name_to_uuid, uuid_to_name = catalog.lookup_dicts(building)
+        return cls(catalog, name_to_uuid, uuid_to_name, mtime_ns)
+
+
+class SensorRegistry:
+    def __init__(
+        self,
+        path: str = SENSOR_MAPPINGS_FILE,
+        check_interval: float = SENSOR_MAPPINGS_CHECK_INTERVAL,
+        cache_path: str = SENSOR_CATALOG_CACHE,
+        building: str = SENSOR_BUILDING,
+    ):
+        self.path = path
+        self.check_interval = check_interval
+        self.cache_path = cache_path
+        self.building = building or None
+        self._snapshot = SensorSnapshot.of(SensorCatalog.from_rows([]), None)
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+
+    def _load(self) -> SensorSnapshot:
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        if self.cache_path:
+            catalog = SensorCatalog.load_cached([self.path], self.cache_path)
+        else:
+            catalog = SensorCatalog.from_mappings_files([self.path])
+        return SensorSnapshot.of(catalog, mtime_ns, self.building)
+
+    def _create_empty_file(self) -> None:
+        # Keeps the previous behaviour of the actions: a missing file is replaced
+        # with an empty one so later reloads (and the form) do not keep failing
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "w") as f:
+                f.write("# Format: sensor_name,sensor_uuid\n")
+            logger.info(f"Created empty {self.path}")
+        except OSError as e:
+            logger.error(f"Failed to create empty {self.path}: {e}")
+
+    def refresh(self, force: bool = False) -> SensorSnapshot:
+        """Re-parses the mappings file if its mtime changed since the last load."""
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return self._snapshot
+
+        with self._reload_lock:
+            if not force and now < self._next_check:
+                return self._snapshot
+            self._next_check = now + self.check_interval
+            try:
+                mtime_ns = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                logger.error(f"{self.path} not found")
+                self._create_empty_file()
+                return self._snapshot
+            if not force and mtime_ns == self._snapshot.mtime_ns:
+                return self._snapshot
+            try:
+                snapshot = self._load()
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to load {self.path}: {e}")
+                return self._snapshot
+            self._snapshot = snapshot
+            catalog = snapshot.catalog
+            logger.info(
+                f"Loaded {len(catalog)} sensor mappings from {self.path} "
+                f"({len(catalog.buildings)} buildings, {catalog.nbytes} bytes)"
+            )
+            return snapshot
+
+    @property
+    def snapshot(self) -> SensorSnapshot:
+        return self.refresh()
+
+    @property
+    def catalog(self) -> SensorCatalog:
+        """The columns themselves, for bulk/vectorised lookups by name, UUID, prefix, building, floor or type."""
+        return self.snapshot.catalog
+
+    @property
+    def name_to_uuid(self) -> Dict[str, str]:
+        return self.snapshot.name_to_uuid
+
+    @property
+    def uuid_to_name(self) -> Dict[str, str]:
+        return self.snapshot.uuid_to_name
+
+    def uuid_for(self, name: str, building: Optional[str] = None) -> Optional[str]:
+        if building is not None:
+            return self.snapshot.catalog.uuid_for_name(name, building)
+        return self.snapshot.name_to_uuid.get(name)
+
+    def name_for(self, uuid: str) -> Optional[str]:
+        return self.snapshot.uuid_to_name.get(uuid)
+
+    def is_known(self, name: str) -> bool:
+        return name in self.snapshot.name_to_uuid
+
+    def names(self) -> List[str]:
+        return list(self.snapshot.name_to_uuid)
+
+    def translate(self, data: Any) -> Tuple[Any, Set[str]]:
+        """translate_uuids() against the current snapshot."""
+        return translate_uuids(data, self.snapshot.uuid_to_name)
+
+
+def _translate_string(value: str, uuid_to_name: Mapping[str, str], found: Set[str]) -> str:
+    # Exact match is the common case (timeseries ids as values or keys)
+    name = uuid_to_name.get(value)
+    if name is not None:
+        found.add(value)
+        return name
+    if len(value) < UUID_LENGTH or "-" not in value:
+        return value
+
+    def substitute(match: "re.Match") -> str:
+        uuid = match.group(0)
+        found.add(uuid)
+        return uuid_to_name.get(uuid, uuid)
+
+    # UUIDs embedded in longer strings, e.g. full timeseries URIs
+    return UUID_PATTERN.sub(substitute, value)
+
+
+def translate_uuids(data: Any, uuid_to_name: Mapping[str, str]) -> Tuple[Any, Set[str]]:
+    """
+    Returns a copy of `data` with every known UUID replaced by its sensor name.
+
+    Dict keys and string values are both translated, including UUIDs embedded in
+    longer strings. The structure is walked once with an explicit stack (no
+    recursion), so large analytics payloads are not re-serialised or re-scanned.
+    Also returns every UUID seen, mapped or not, for logging.
+    """
+    found: Set[str] = set()
+
+    def convert(value: Any) -> Any:
+        if isinstance(value, str):
+            return _translate_string(value, uuid_to_name, found)
+        return value
+
+    def container_for(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {}
+        if isinstance(value, (list, tuple)):
+            return []
+        return None
+
+    root = container_for(data)
+    if root is None:
+        return convert(data), found
+
+    stack = [(data, root)]
+    while stack:
+        source, target = stack.pop()
+        if isinstance(source, dict):
+            for key, value in source.items():
+                if isinstance(key, str):
+                    key = _translate_string(key, uuid_to_name, found)
+                child = container_for(value)
+                if child is None:
+                    target[key] = convert(value)
+                else:
+                    target[key] = child
+                    stack.append((value, child))
+        else:
+            for value in source:
+                child = container_for(value)
+                if child is None:
+                    target.append(convert(value))
+                else:
+                    target.append(child)
+                    stack.append((value, child))
+    return root, found
+
+
+# Shared instance used by every action
+sensor_registry = SensorRegistry()
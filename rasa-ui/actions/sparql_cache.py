@@ -0,0 +1,229 @@
+"""
+Result cache for the SPARQL queries sent to Fuseki.
+
+Keys are the normalised query text: the standard PREFIX block added by
+add_sparql_prefixes is dropped (any other PREFIX declarations are kept, sorted),
+and whitespace outside IRIs and string literals is collapsed, so the same
+question always hits the same entry however it was formatted.
+
+The cache holds at most SPARQL_CACHE_MAX_BYTES of (JSON-encoded) results, evicting
+least recently used entries first, and entries expire after SPARQL_CACHE_MAX_AGE
+seconds. It is cleared whenever the dataset version changes. A background thread
+probes the version every SPARQL_CACHE_VERSION_INTERVAL seconds, so lookups never
+wait on it, from one of:
+
+    fuseki  the version triple written by brick-datasets/load_models.py on every
+            load (<urn:brickbot:dataset> dcterms:modified ...); a single index
+            lookup. Datasets loaded some other way have no version triple, and
+            their entries only expire by age (default)
+    file    a hash of the model file BRICK_MODEL_TTL
+    none    never probed; entries only expire by age
+
+Only execute_sparql_query goes through the cache. Streamed queries
+(SPARQL_STREAMING, see sparql_stream.py) write their rows straight to an
+attachment and always go to Fuseki.
+
+Cached results are shared between callers and must be treated as read-only.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from SPARQLWrapper import JSON, SPARQLWrapper
+
+from .sparql_prefixes import NAMESPACES
+
+logger = logging.getLogger(__name__)
+
+SPARQL_CACHE_MAX_BYTES = int(os.getenv("SPARQL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+SPARQL_CACHE_MAX_AGE = float(os.getenv("SPARQL_CACHE_MAX_AGE", "3600"))
+SPARQL_CACHE_VERSION_SOURCE = os.getenv("SPARQL_CACHE_VERSION_SOURCE", "fuseki").lower()
+SPARQL_CACHE_VERSION_INTERVAL = float(os.getenv("SPARQL_CACHE_VERSION_INTERVAL", "60"))
+
+PREFIX_DECLARATION = re.compile(r"^\s*PREFIX\s+([\w\-]*):\s*<([^>]*)>\s*", re.IGNORECASE)
+# IRIs and string literals are copied verbatim; any other whitespace run becomes one space
+LEXICAL = re.compile(r'(<[^<>\s]*>|"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')|\s+')
+
+# Written by brick-datasets/load_models.py; keep the two in sync
+DATASET_VERSION_SUBJECT = "urn:brickbot:dataset"
+DATASET_VERSION_PREDICATE = "http://purl.org/dc/terms/modified"
+
+VersionProbe = Callable[[], Optional[str]]
+
+
+def normalise_query(query: str) -> str:
+    declared = {}
+    rest = query
+    while True:
+        match = PREFIX_DECLARATION.match(rest)
+        if not match:
+            break
+        prefix, uri = match.groups()
+        if NAMESPACES.get(prefix) != uri:
+            declared[prefix] = uri
+        rest = rest[match.end():]
+    body = LEXICAL.sub(lambda m: m.group(1) or " ", rest).strip()
+    header = " ".join(f"PREFIX {p}: <{declared[p]}>" for p in sorted(declared))
+    return f"{header} {body}" if header else body
+
+
+def fuseki_version_probe(endpoint: str, timeout: float = 5) -> VersionProbe:
+    """
+    Version = the dataset's version triple(s), in the default or any named graph.
+    An append-mode load adds a second value rather than replacing the first, so
+    all of them make up the version.
+    """
+    query = (
+        f"SELECT ?version WHERE {{ {{ <{DATASET_VERSION_SUBJECT}> <{DATASET_VERSION_PREDICATE}> ?version }}"
+        f" UNION {{ GRAPH ?g {{ <{DATASET_VERSION_SUBJECT}> <{DATASET_VERSION_PREDICATE}> ?version }} }} }}"
+    )
+
+    def probe() -> Optional[str]:
+        sparql = SPARQLWrapper(endpoint)
+        sparql.setQuery(query)
+        sparql.setReturnFormat(JSON)
+        sparql.setTimeout(int(timeout))
+        results = sparql.queryAndConvert()
+        versions = sorted({row["version"]["value"] for row in results["results"]["bindings"]})
+        return " ".join(versions) or None
+    return probe
+
+
+def file_hash_probe(path: str) -> VersionProbe:
+    """Version = SHA-256 of the model file, re-hashed only when its mtime or size changes."""
+    last: Dict[str, Any] = {}
+
+    def probe() -> Optional[str]:
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if last.get("stamp") != stamp:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            last["stamp"], last["version"] = stamp, digest.hexdigest()
+        return last["version"]
+    return probe
+
+
+class SparqlResultCache:
+    def __init__(
+        self,
+        version_probe: Optional[VersionProbe] = None,
+        max_bytes: int = SPARQL_CACHE_MAX_BYTES,
+        max_age: float = SPARQL_CACHE_MAX_AGE,
+        version_interval: float = SPARQL_CACHE_VERSION_INTERVAL,
+    ):
+        self.version_probe = version_probe
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.version_interval = version_interval
+        # key -> (results, size in bytes, stored at)
+        self._entries: "OrderedDict[str, Tuple[Dict, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._version: Optional[str] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _start_watcher(self) -> None:
+        """Starts the version thread on first use (not at import, which may happen before a fork)."""
+        if self.version_probe is None or self._watcher is not None:
+            return
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch_version, name="sparql-cache-version", daemon=True)
+            self._watcher.start()
+
+    def _watch_version(self) -> None:
+        while True:
+            self.check_version()
+            time.sleep(self.version_interval)
+
+    def check_version(self) -> None:
+        """Clears the cache if the dataset version changed. Blocking (may query Fuseki)."""
+        if self.version_probe is None:
+            return
+        try:
+            version = self.version_probe()
+        except Exception as e:
+            logger.warning(f"SPARQL cache version check failed, keeping cached results: {e}")
+            return
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    logger.info(f"Dataset version changed ({self._version} -> {version}); clearing {len(self._entries)} cached results")
+                self._entries.clear()
+                self._bytes = 0
+                self._version = version
+
+    def get(self, query: str) -> Optional[Dict]:
+        self._start_watcher()
+        key = normalise_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[2] > self.max_age:
+                if entry is not None:
+                    self._evict(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, query: str, results: Dict) -> None:
+        if results is None:
+            return
+        try:
+            size = len(json.dumps(results))
+        except (TypeError, ValueError):
+            return
+        # One result set may not take over the whole cache
+        if size > self.max_bytes // 4:
+            return
+        key = normalise_query(query)
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (results, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "version": self._version,
+            }
+
+
+def make_sparql_cache(fuseki_url: str, model_path: str) -> SparqlResultCache:
+    """Cache configured from SPARQL_CACHE_VERSION_SOURCE."""
+    if SPARQL_CACHE_VERSION_SOURCE == "file":
+        probe = file_hash_probe(model_path)
+    elif SPARQL_CACHE_VERSION_SOURCE == "none":
+        probe = None
+    else:
+        probe = fuseki_version_probe(fuseki_url)
+    return SparqlResultCache(version_probe=probe)
@@ -0,0 +1,89 @@
+"""
+The SPARQL prefixes used by the Brick model and the NL2SPARQL output.
+
+Generated queries use these prefixes without declaring them; the actions prepend
+PREFIX_BLOCK before sending a query to Fuseki and use the same table to compact
+result URIs back to `prefix:local` form.
+"""
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+PREFIXES: List[Tuple[str, str]] = [
+    ("brick", "https://brickschema.org/schema/Brick#"),
+    ("dcterms", "http://purl.org/dc/terms/"),
+    ("owl", "http://www.w3.org/2002/07/owl#"),
+    ("rdf", "http://www.w3.org/1999/02/22-rdf-syntax-ns#"),
+    ("rdfs", "http://www.w3.org/2000/01/rdf-schema#"),
+    ("sh", "http://www.w3.org/ns/shacl#"),
+    ("skos", "http://www.w3.org/2004/02/skos/core#"),
+    ("sosa", "http://www.w3.org/ns/sosa/"),
+    ("xsd", "http://www.w3.org/2001/XMLSchema#"),
+    ("tag", "https://brickschema.org/schema/BrickTag#"),
+    ("bldg", "http://abacwsbuilding.cardiff.ac.uk/abacws#"),
+    ("bsh", "https://brickschema.org/schema/BrickShape#"),
+    ("s223", "http://data.ashrae.org/standard223#"),
+    ("bacnet", "http://data.ashrae.org/bacnet/2020#"),
+    ("g36", "http://data.ashrae.org/standard223/1.0/extensions/g36#"),
+    ("qkdv", "http://qudt.org/vocab/dimensionvector/"),
+    ("quantitykind", "http://qudt.org/vocab/quantitykind/"),
+    ("qudt", "http://qudt.org/schema/qudt/"),
+    ("rec", "https://w3id.org/rec#"),
+    ("ref", "https://brickschema.org/schema/Brick/ref#"),
+    ("s223tobrick", "https://brickschema.org/extension/brick_extension_interpret_223#"),
+    ("schema1", "http://schema.org/"),
+    ("unit", "http://qudt.org/vocab/unit/"),
+    ("vcard", "http://www.w3.org/2006/vcard/ns#"),
+]
+
+# prefix -> namespace URI
+NAMESPACES: Dict[str, str] = dict(PREFIXES)
+
+PREFIX_BLOCK = "\n".join(f"PREFIX {prefix}: <{uri}>" for prefix, uri in PREFIXES)
+
+
+class UriCompactor:
+    """
+    Longest-prefix URI -> `prefix:local` compaction, built once.
+
+    A namespace can only match where the URI has the namespace's last character
+    (`#` or `/` for all of ours), so the URI is cut at those positions from the
+    right and each cut is a single dict lookup; typically the first one hits.
+    Results are memoised, since the same entities recur across bindings.
+    """
+
+    def __init__(self, prefixes: List[Tuple[str, str]], cache_size: int = 65536):
+        self.by_namespace = {uri: prefix for prefix, uri in prefixes}
+        self.cut_chars = frozenset(uri[-1] for uri in self.by_namespace if uri)
+        self.compact = lru_cache(maxsize=cache_size)(self._compact)
+
+    def _compact(self, uri: str) -> str:
+        for i in range(len(uri) - 1, -1, -1):
+            if uri[i] in self.cut_chars:
+                prefix = self.by_namespace.get(uri[:i + 1])
+                if prefix is not None:
+                    return f"{prefix}:{uri[i + 1:]}"
+        return uri
+
+    def standardize_binding(self, binding: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+        """One SPARQL JSON binding -> {var: value} with compacted URIs and `@lang` literals."""
+        entry = {}
+        for key, val in binding.items():
+            value_type = val.get("type")
+            value = val.get("value", "")
+            if value_type == "uri":
+                value = self.compact(value)
+            elif value_type == "literal":
+                lang = val.get("xml:lang")
+                if lang:
+                    value = f"{value}@{lang}"
+            entry[key] = value
+        return entry
+
+    def standardize_bindings(self, bindings: Iterable[Dict[str, Dict[str, str]]]) -> Iterator[Dict[str, str]]:
+        """Lazily standardises a (possibly streamed) sequence of bindings."""
+        standardize = self.standardize_binding
+        for binding in bindings:
+            yield standardize(binding)
+
+
+URI_COMPACTOR = UriCompactor(PREFIXES)
@@ -0,0 +1,192 @@
+"""
+Streaming SELECT execution against Fuseki.
+
+With SPARQL_STREAMING=1, ActionQuestionToBrickbot asks Fuseki for
+text/tab-separated-values instead of SPARQL JSON and parses the response line by
+line as it arrives. Each row is compacted (URI_COMPACTOR) and written straight to
+the JSON attachment; only the first SPARQL_CHAT_ROW_LIMIT rows are kept for the
+chat message and the summary, plus the timeseriesId column for the follow-up SQL
+query. Memory therefore stays flat however many rows a query returns.
+
+Streamed queries bypass the result cache, which only holds complete result sets.
+
+The per-read timeout does not bound a response that keeps trickling in, so the
+stream also checks an overall deadline, and a cancel flag set by the caller once
+it has given up, between chunks. Either one stops the worker and drops its temp
+files.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from .attachments import AttachmentStore
+from .sparql_prefixes import URI_COMPACTOR
+
+logger = logging.getLogger(__name__)
+
+SPARQL_STREAMING = os.getenv("SPARQL_STREAMING", "0") == "1"
+SPARQL_CHAT_ROW_LIMIT = int(os.getenv("SPARQL_CHAT_ROW_LIMIT", "50"))
+# Overall limit for a streamed query; the per-read timeout is SPARQL_TIMEOUT
+SPARQL_STREAM_TIMEOUT = float(os.getenv("SPARQL_STREAM_TIMEOUT", "120"))
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f", '"': '"', "'": "'", "\\": "\\"}
+ESCAPE_PATTERN = re.compile(r"\\(u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|.)")
+INTEGER = re.compile(r"^[+-]?\d+$")
+DECIMAL = re.compile(r"^[+-]?\d*\.\d+$")
+
+# Keep-alive connections to Fuseki, used from the blocking executor
+_client = httpx.Client(limits=httpx.Limits(max_connections=8, max_keepalive_connections=4))
+
+
+class StreamCancelled(Exception):
+    """The stream passed its deadline or was cancelled; nothing was saved."""
+
+
+def _unescape(text: str) -> str:
+    def replace(match: "re.Match") -> str:
+        code = match.group(1)
+        if code[0] in "uU" and len(code) > 1:
+            return chr(int(code[1:], 16))
+        return ESCAPES.get(code, code)
+    return ESCAPE_PATTERN.sub(replace, text) if "\\" in text else text
+
+
+def parse_tsv_term(cell: str) -> Optional[Dict[str, str]]:
+    """One SPARQL TSV cell (an RDF term in Turtle syntax) -> a SPARQL JSON term, None if unbound."""
+    if not cell:
+        return None
+    if cell[0] == "<" and cell[-1] == ">":
+        return {"type": "uri", "value": cell[1:-1]}
+    if cell.startswith("_:"):
+        return {"type": "bnode", "value": cell[2:]}
+    if cell[0] == '"':
+        end = cell.rfind('"')
+        term = {"type": "literal", "value": _unescape(cell[1:end])}
+        suffix = cell[end + 1:]
+        if suffix.startswith("@"):
+            term["xml:lang"] = suffix[1:]
+        elif suffix.startswith("^^<") and suffix.endswith(">"):
+            term["datatype"] = suffix[3:-1]
+        return term
+    # Bare numbers and booleans
+    if cell in ("true", "false"):
+        datatype = "boolean"
+    elif INTEGER.match(cell):
+        datatype = "integer"
+    elif DECIMAL.match(cell):
+        datatype = "decimal"
+    else:
+        datatype = "double"
+    return {"type": "literal", "value": cell, "datatype": XSD + datatype}
+
+
+def iter_tsv_bindings(lines: Iterator[str]) -> Tuple[List[str], Iterator[Dict[str, Dict[str, str]]]]:
+    """Splits a TSV result into its variable names and a lazy iterator of SPARQL JSON bindings."""
+    header = next(lines, "")
+    variables = [name.lstrip("?$") for name in header.rstrip("\r").split("\t")] if header else []
+
+    def bindings() -> Iterator[Dict[str, Dict[str, str]]]:
+        for line in lines:
+            line = line.rstrip("\r")
+            if not line:
+                continue
+            binding = {}
+            for name, cell in zip(variables, line.split("\t")):
+                term = parse_tsv_term(cell)
+                if term is not None:
+                    binding[name] = term
+            yield binding
+
+    return variables, bindings()
+
+
+def _checked_lines(chunks: Iterator[str], check) -> Iterator[str]:
+    """Lines of a text stream, calling check() before every chunk is used."""
+    pending = ""
+    for chunk in chunks:
+        check()
+        pending += chunk
+        *lines, pending = pending.split("\n")
+        yield from lines
+    if pending:
+        yield pending
+
+
+class StreamedSelect:
+    def __init__(
+        self,
+        variables: List[str],
+        preview: List[Dict[str, Any]],
+        total_rows: int,
+        timeseries_ids: List[str],
+        filename: str,
+        url: str,
+    ):
+        self.variables = variables
+        self.preview = preview
+        self.total_rows = total_rows
+        self.timeseries_ids = timeseries_ids
+        self.filename = filename
+        self.url = url
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_rows > len(self.preview)
+
+
+def stream_select_to_attachment(
+    endpoint: str,
+    query: str,
+    store: AttachmentStore,
+    filename: str,
+    header: Dict[str, Any],
+    row_limit: int = SPARQL_CHAT_ROW_LIMIT,
+    read_timeout: float = 10,
+    deadline: float = SPARQL_STREAM_TIMEOUT,
+    cancel: Optional[threading.Event] = None,
+) -> StreamedSelect:
+    """
+    Runs `query` on `endpoint`, writing every standardised row to the attachment
+    `filename` and keeping the first `row_limit` rows. Blocking; raises
+    httpx.HTTPError / OSError / ValueError (malformed response) on failure, and
+    StreamCancelled after `deadline` seconds or once `cancel` is set. No
+    attachment is left behind in any of these cases.
+    """
+    preview: List[Dict[str, Any]] = []
+    timeseries_ids: List[str] = []
+    total = 0
+    stop_at = time.monotonic() + deadline
+
+    def check() -> None:
+        if cancel is not None and cancel.is_set():
+            raise StreamCancelled("cancelled by the caller")
+        if time.monotonic() > stop_at:
+            raise StreamCancelled(f"still streaming after {deadline}s")
+    with _client.stream(
+        "POST",
+        endpoint,
+        data={"query": query},
+        headers={"Accept": "text/tab-separated-values"},
+        timeout=httpx.Timeout(read_timeout, connect=5),
+    ) as response:
+        response.raise_for_status()
+        variables, bindings = iter_tsv_bindings(_checked_lines(response.iter_text(), check))
+        with store.open_stream(filename, header) as attachment:
+            for row in URI_COMPACTOR.standardize_bindings(bindings):
+                attachment.write_row(row)
+                if len(preview) < row_limit:
+                    preview.append(row)
+                timeseries_id = row.get("timeseriesId")
+                if timeseries_id:
+                    timeseries_ids.append(timeseries_id)
+                total += 1
+            # Last chance to back out before the files are moved into place
+            check()
+    logger.info(f"Streamed {total} SPARQL rows ({len(preview)} kept for chat) to {filename}")
+    return StreamedSelect(variables, preview, total, timeseries_ids, filename, store.url_for(filename))
@@ -1,20 +1,41 @@
-from flask import Flask, send_from_directory, abort
+from flask import Flask, send_from_directory, abort, request
+import logging
+import mimetypes
 import os
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
 
 app = Flask(__name__)
 
 # Configure logging
-
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 # Define the path to the attachments folder (same directory as server.py)
 STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "attachments")
 
+# Precompressed variants written by the action server, in order of preference
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
 
 @app.route("/attachments/<path:filename>")
 def serve_static(filename):
     try:
-        return send_from_directory(STATIC_FOLDER, filename)
-    except FileNotFoundError:
+        # Serve a precompressed copy when the client accepts it; send_from_directory
+        # already handles ETag/If-None-Match and Range for whichever file is sent
+        for encoding, suffix in PRECOMPRESSED:
+            variant = filename + suffix
+            variant_path = safe_join(STATIC_FOLDER, variant)
+            if encoding in request.accept_encodings and variant_path and os.path.isfile(variant_path):
+                mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                response = send_from_directory(STATIC_FOLDER, variant, mimetype=mimetype)
+                response.headers["Content-Encoding"] = encoding
+                response.headers["Vary"] = "Accept-Encoding"
+                return response
+        response = send_from_directory(STATIC_FOLDER, filename)
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+    except (FileNotFoundError, NotFound):
         abort(404)
     except Exception as e:
         abort(500)
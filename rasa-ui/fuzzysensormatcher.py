@@ -1,25 +1,122 @@
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
 from rasa.nlu.components import Component
 from rapidfuzz import process, fuzz
 
+SEPARATORS = re.compile(r"[\s_\-]+")
+
+
+def normalise(name: str) -> str:
+    """Lower-cases and collapses spaces/underscores/hyphens so "air temp" == "Air_Temp"."""
+    return SEPARATORS.sub("_", name.strip().lower()).strip("_")
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SensorNameIndex:
+    """
+    Character-trigram inverted index over the sensor names.
+
+    Resolution tries, in order: the exact name, the normalised name, then a fuzzy
+    match scored with fuzz.ratio against a shortlist of the names sharing the most
+    trigrams with the candidate, so the cost depends on the candidate rather than on
+    the number of sensors.
+    """
+
+    def __init__(self, names: Iterable[str], shortlist_size: int = 50, common_fraction: float = 0.2):
+        self.names: List[str] = []
+        self.normalised: List[str] = []
+        self.exact: Dict[str, str] = {}
+        self.by_normalised: Dict[str, str] = {}
+        self.postings: Dict[str, List[int]] = {}
+        self.shortlist_size = shortlist_size
+
+        for name in names:
+            if not name or name in self.exact:
+                continue
+            norm = normalise(name)
+            idx = len(self.names)
+            self.names.append(name)
+            self.normalised.append(norm)
+            self.exact[name] = name
+            self.by_normalised.setdefault(norm, name)
+            for gram in trigrams(norm):
+                self.postings.setdefault(gram, []).append(idx)
+
+        # Trigrams shared by a large part of the catalogue ("_se", "sor", ...) barely
+        # discriminate and dominate the counting cost, so they are skipped when a
+        # candidate has rarer ones
+        self.common_limit = max(1, int(len(self.names) * common_fraction))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def shortlist(self, norm: str) -> List[int]:
+        grams = [g for g in trigrams(norm) if g in self.postings]
+        if not grams:
+            return []
+        rare = [g for g in grams if len(self.postings[g]) <= self.common_limit]
+        counts: Counter = Counter()
+        for gram in rare or grams:
+            counts.update(self.postings[gram])
+        return [idx for idx, _ in counts.most_common(self.shortlist_size)]
+
+    def resolve(self, candidate: str) -> Optional[Tuple[str, float]]:
+        """Returns (sensor name, score in 0..1) for the best match, or None."""
+        if candidate in self.exact:
+            return candidate, 1.0
+        norm = normalise(candidate)
+        if norm in self.by_normalised:
+            return self.by_normalised[norm], 1.0
+
+        shortlist = self.shortlist(norm)
+        if not shortlist:
+            return None
+        match = process.extractOne(norm, [self.normalised[idx] for idx in shortlist], scorer=fuzz.ratio)
+        if match is None:
+            return None
+        _, score, position = match
+        return self.names[shortlist[position]], score / 100
+
 
 class FuzzySensorMatcher(Component):
     def __init__(self, component_config=None):
         super().__init__(component_config)
+        component_config = component_config or {}
         self.threshold = component_config.get("threshold", 0.8)
-        with open("data/sensor_list.txt", "r") as f:
-            self.sensor_list = [line.strip() for line in f]
+        with open(component_config.get("sensor_list", "data/sensor_list.txt"), "r") as f:
+            self.index = SensorNameIndex(
+                (line.strip() for line in f),
+                shortlist_size=component_config.get("shortlist_size", 50),
+            )
+        # Recent resolutions; the same few sensors come up message after message
+        self.resolve = lru_cache(maxsize=component_config.get("cache_size", 4096))(self.index.resolve)
+
+    def resolve_all(self, candidates: Iterable[str]) -> Dict[str, Optional[Tuple[str, float]]]:
+        """Resolves each distinct candidate once."""
+        return {candidate: self.resolve(candidate) for candidate in set(candidates)}
 
     def process(self, message, **kwargs):
         entities = message.get("entities", [])
-        for entity in entities:
-            if entity["entity"] == "sensor_type":
-                candidate = entity["value"]
-                best_match, score, _ = process.extractOne(
-                    candidate, self.sensor_list, scorer=fuzz.ratio
-                )
-                if score / 100 >= self.threshold:
-                    entity["value"] = best_match
-                    entity["confidence"] = score / 100
+        sensor_entities = [
+            entity for entity in entities
+            if entity["entity"] == "sensor_type" and isinstance(entity.get("value"), str)
+        ]
+        resolved = self.resolve_all(entity["value"] for entity in sensor_entities)
+        for entity in sensor_entities:
+            match = resolved[entity["value"]]
+            if match is None:
+                continue
+            best_match, score = match
+            if score >= self.threshold:
+                entity["value"] = best_match
+                entity["confidence"] = score
         message.set("entities", entities)
 
     @classmethod
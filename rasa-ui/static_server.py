@@ -1,7 +1,8 @@
 import http.server
-import socketserver
 import os
 import logging
+import re
+from email.utils import formatdate
 
 LOG_DIR = "/app/actions/static/logs"
 LOG_FILE = os.path.join(LOG_DIR, "static_server.log")
@@ -20,17 +21,165 @@ logger = logging.getLogger(__name__)
 STATIC_DIR = "/app/actions/static/attachments"
 PORT = 8000
 
+# Precompressed variants written by actions/attachments.py, in order of preference
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+COPY_CHUNK = 64 * 1024
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def accepted_encodings(header: str) -> set:
+    """Parses Accept-Encoding into the set of codings the client accepts (q > 0)."""
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def parse_range(header: str, size: int):
+    """
+    Parses a single-range `bytes=` header.
+
+    Returns (start, end) inclusive, None if the range is unsatisfiable, or
+    False if the header should be ignored (malformed or multi-range), in which
+    case the full body is sent.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        return False
+    first, last = match.groups()
+    if not first and not last:
+        return False
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+class AttachmentRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Static handler for the attachments folder with:
+      - precompressed .br/.gz variants selected by Accept-Encoding,
+      - strong ETags per variant and If-None-Match -> 304,
+      - single byte-range requests (206 / 416), honouring If-Range.
+    """
+
+    protocol_version = "HTTP/1.1"  # keep-alive between requests from the same client
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s" % (self.address_string(), format % args))
+
+    def choose_variant(self, path: str):
+        accepted = accepted_encodings(self.headers.get("Accept-Encoding"))
+        for encoding, suffix in PRECOMPRESSED:
+            if encoding in accepted and os.path.isfile(path + suffix):
+                return encoding, path + suffix
+        return "identity", path
+
+    def send_head(self):
+        self.remaining = None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            return super().send_head()
+        if not os.path.isfile(path):
+            self.send_error(404, "File not found")
+            return None
+
+        encoding, served_path = self.choose_variant(path)
+        try:
+            f = open(served_path, "rb")
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+
+        try:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            etag = f'"{stat.st_mtime_ns:x}-{size:x}-{encoding}"'
+
+            if_none_match = self.headers.get("If-None-Match")
+            if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+                f.close()
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Vary", "Accept-Encoding")
+                self.end_headers()
+                return None
+
+            start, end, status = 0, size - 1, 200
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            if range_header and (not if_range or if_range.strip() == etag):
+                byte_range = parse_range(range_header, size)
+                if byte_range is None:
+                    f.close()
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return None
+                if byte_range:
+                    start, end = byte_range
+                    status = 206
+
+            self.send_response(status)
+            self.send_header("Content-Type", self.guess_type(path))
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", formatdate(stat.st_mtime, usegmt=True))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Vary", "Accept-Encoding")
+            if encoding != "identity":
+                self.send_header("Content-Encoding", encoding)
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+
+            f.seek(start)
+            self.remaining = end - start + 1
+            return f
+        except Exception:
+            f.close()
+            raise
+
+    def copyfile(self, source, outputfile):
+        remaining = self.remaining
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        while remaining > 0:
+            chunk = source.read(min(COPY_CHUNK, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+
 if __name__ == "__main__":
     # Change to the static directory
     os.makedirs(STATIC_DIR, exist_ok=True)
     os.chdir(STATIC_DIR)
 
-    # Set up the handler
-    Handler = http.server.SimpleHTTPRequestHandler
-
-    # Start the server
+    # Start the server; each connection gets its own thread, so one slow
+    # download does not block every other client
     try:
-        with socketserver.TCPServer(("", PORT), Handler) as httpd:
+        with http.server.ThreadingHTTPServer(("", PORT), AttachmentRequestHandler) as httpd:
             logger.info(f"Serving static files at http://0.0.0.0:{PORT}")
             httpd.serve_forever()
     except OSError as e: